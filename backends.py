@@ -0,0 +1,224 @@
+"""자세 추정 backend.
+
+모든 backend는 decode한 BGR frame을 받아 frame마다 (people, 25, 3) 모양(BODY_25 순서, x, y, confidence)의
+float32 배열을 반환. 사람이 없으면 빈 (0, 25, 3) 배열.
+
+- `openpose`: pyopenpose. backend를 만들 때만 import
+- `synthetic`: CPU 비용을 설정할 수 있는 결정적인 궤적. inference 주변 전부의 부하와 지연 시간 test용
+- `opencv_dnn`: OpenCV DNN module(CPU)에서 돌리는 OpenPose BODY_25 caffe model. heatmap peak로 한 사람만
+"""
+import os
+import sys
+from sys import platform
+from time import process_time
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+NUMBER_PARTS = 25
+
+
+def no_people() -> np.ndarray:
+    return np.zeros((0, NUMBER_PARTS, 3), np.float32)
+
+
+class Backend:
+    def estimate(self, frame: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def estimate_batch(self, frames: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """여러 frame을 한 번에 돌릴 수 있는 backend가 override함"""
+        return [self.estimate(frame) for frame in frames]
+
+
+class OpenPoseBackend(Backend):
+    def __init__(self, openpose_dir=r'D:/projects/openpose-1.5.0/build/examples/tutorial_api_python',
+                 model_folder: Optional[str] = None, number_people_max=1, net_resolution: Optional[str] = None):
+        op = self._import(openpose_dir)
+        params = {
+            'model_folder': model_folder or openpose_dir + '/../../../models/',
+            'render_pose': 0,
+            'number_people_max': number_people_max,
+        }
+        if net_resolution:
+            params['net_resolution'] = net_resolution
+        self._wrapper = op.WrapperPython()
+        self._wrapper.configure(params)
+        self._wrapper.start()
+        self._datum = op.Datum()
+
+    @staticmethod
+    def _import(dir_path):
+        try:
+            # Windows Import
+            if platform == "win32":
+                # Change these variables to point to the correct folder (Release/x64 etc.)
+                sys.path.append(dir_path + '/../../python/openpose/Release')
+                os.environ['PATH'] = os.environ['PATH'] + ';' + dir_path + '/../../x64/Release;' + dir_path + '/../../bin;'
+                import pyopenpose as op
+            else:
+                # Change these variables to point to the correct folder (Release/x64 etc.)
+                sys.path.append('../../python')
+                # If you run `make install` (default path is `/usr/local/python` for Ubuntu),
+                # you can also access the OpenPose/python module from there.
+                # This will install OpenPose and the python library at your desired installation path.
+                # Ensure that this is in your python path in order to use it.
+                # sys.path.append('/usr/local/python')
+                from openpose import pyopenpose as op
+        except ImportError as e:
+            print('Error: OpenPose library could not be found. '
+                  'Did you enable `BUILD_PYTHON` in CMake and have this Python script in the right folder?')
+            raise e
+        return op
+
+    def estimate(self, frame: np.ndarray) -> np.ndarray:
+        datum = self._datum
+        datum.cvInputData = frame
+        self._wrapper.emplaceAndPop([datum])
+        keypoints = datum.poseKeypoints
+        if keypoints is None or not keypoints.shape:
+            return no_people()
+        return keypoints.astype(np.float32)
+
+
+# 서 있는 사람. BODY_25 순서, frame 크기에 대한 상대 (x, y)
+_STANDING = np.array([
+    (0.50, 0.15), (0.50, 0.25), (0.44, 0.25), (0.40, 0.36), (0.38, 0.46), (0.56, 0.25), (0.60, 0.36), (0.62, 0.46),
+    (0.50, 0.50), (0.46, 0.50), (0.46, 0.68), (0.46, 0.86), (0.54, 0.50), (0.54, 0.68), (0.54, 0.86),
+    (0.48, 0.13), (0.52, 0.13), (0.46, 0.14), (0.54, 0.14),
+    (0.56, 0.89), (0.57, 0.885), (0.53, 0.88), (0.44, 0.89), (0.43, 0.885), (0.47, 0.88),
+], np.float32)
+# 양팔을 목 높이로 옆으로 들고 왼발을 든 자세. measurer가 기다리는 시작 자세
+_ONE_LEG = _STANDING.copy()
+_ONE_LEG[[3, 4, 6, 7]] = (0.37, 0.25), (0.30, 0.25), (0.63, 0.25), (0.70, 0.25)
+_ONE_LEG[[13, 14, 19, 20, 21]] += (0.02, -0.14)
+
+
+class SyntheticBackend(Backend):
+    """pixel이 아니라 지금까지 받은 frame 수에만 따라 정해지는 keypoints.
+
+    궤적 (시각 = 받은 frame 수 / `fps`):
+    - `standing`: 관절마다 noise가 있는 정지 자세
+    - `sway`: 서서 좌우로 흔들림
+    - `balance`: 2초 서 있다가 `cycle - 5`초 동안 양팔과 왼발을 든 뒤 발을 내림. `cycle`초마다 반복.
+      measurer가 Idle -> Measuring -> Abnormal로 진행함
+
+    inference 대신 frame마다 `latency`초의 CPU 시간을 씀
+    """
+
+    def __init__(self, latency=0.03, trajectory='balance', people=1, fps=24.0, cycle=30.0, noise=1.0,
+                 confidence=0.8, seed=0):
+        if trajectory not in ('standing', 'sway', 'balance'):
+            raise ValueError(f'Unknown trajectory: {trajectory}')
+        self.latency = latency
+        self.trajectory = trajectory
+        self.people = people
+        self.fps = fps
+        self.cycle = cycle
+        self.noise = noise
+        self.confidence = confidence
+        self._rng = np.random.default_rng(seed)
+        self._frames = 0
+
+    def _burn(self, seconds):
+        # 동시에 도는 worker가 실제로 core를 나눠 쓰도록 wall time이 아니라 CPU time으로 잼
+        deadline = process_time() + seconds
+        while process_time() < deadline:
+            pass
+
+    def _pose(self, t: float) -> np.ndarray:
+        if self.trajectory == 'sway':
+            return _STANDING + (0.02 * np.sin(2 * np.pi * t / 4), 0)
+        if self.trajectory == 'balance':
+            phase = t % self.cycle
+            return _ONE_LEG if 2 <= phase < self.cycle - 3 else _STANDING
+        return _STANDING
+
+    def estimate(self, frame: np.ndarray) -> np.ndarray:
+        return self.estimate_batch([frame])[0]
+
+    def estimate_batch(self, frames: Sequence[np.ndarray]) -> List[np.ndarray]:
+        # batch의 비용은 첫 frame에 latency, 이후 frame마다 그 1/4
+        self._burn(self.latency * (1 + 0.25 * (len(frames) - 1)))
+        results = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            pose = self._pose(self._frames / self.fps)
+            self._frames += 1
+            keypoints = np.empty((self.people, NUMBER_PARTS, 3), np.float32)
+            for person in range(self.people):
+                # 사람끼리 frame 폭의 1/5 간격으로 나란히 섬
+                offset = (person - (self.people - 1) / 2) * 0.2
+                keypoints[person, :, 0] = (pose[:, 0] + offset) * width
+                keypoints[person, :, 1] = pose[:, 1] * height
+            keypoints[..., :2] += self._rng.normal(0, self.noise, keypoints[..., :2].shape)
+            keypoints[..., 2] = self.confidence
+            results.append(keypoints)
+        return results
+
+
+class OpenCvDnnBackend(Backend):
+    """cv2.dnn에서 돌리는 BODY_25 caffe model (pose_deploy.prototxt, pose_iter_584000.caffemodel).
+
+    part affinity field로 묶지 않고 관절마다 heatmap의 peak를 쓰므로 한 사람만 찾음.
+    크기가 같은 frame은 blob 하나로 돌림
+    """
+
+    def __init__(self, prototxt: str, caffemodel: str, net_height=368, threshold=0.1):
+        self._net = cv2.dnn.readNetFromCaffe(prototxt, caffemodel)
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.net_height = net_height
+        self.threshold = threshold
+
+    def estimate(self, frame: np.ndarray) -> np.ndarray:
+        return self.estimate_batch([frame])[0]
+
+    def estimate_batch(self, frames: Sequence[np.ndarray]) -> List[np.ndarray]:
+        results = [None] * len(frames)  # type: List[Optional[np.ndarray]]
+        by_size = {}
+        for i, frame in enumerate(frames):
+            by_size.setdefault(frame.shape[:2], []).append(i)
+        for (height, width), indices in by_size.items():
+            # network가 1/8로 줄이므로 OpenPose처럼 입력을 16의 배수로 맞춤
+            net_width = int(round(width * self.net_height / height / 16)) * 16
+            # OpenPose는 pixel / 256 - 0.5로 정규화
+            blob = cv2.dnn.blobFromImages([frames[i] for i in indices], 1 / 256, (net_width, self.net_height),
+                                          (128, 128, 128), swapRB=False, crop=False)
+            self._net.setInput(blob)
+            heatmaps = self._net.forward()[:, :NUMBER_PARTS]
+            for i, maps in zip(indices, heatmaps):
+                results[i] = self._peaks(maps, width, height)
+        return results
+
+    def _peaks(self, maps: np.ndarray, width: int, height: int) -> np.ndarray:
+        parts, map_height, map_width = maps.shape
+        flat = maps.reshape(parts, -1)
+        index = flat.argmax(axis=1)
+        score = flat[np.arange(parts), index]
+        keypoints = np.zeros((1, parts, 3), np.float32)
+        # heatmap cell의 중심을 frame pixel 좌표로 되돌림
+        keypoints[0, :, 0] = (index % map_width + 0.5) * width / map_width - 0.5
+        keypoints[0, :, 1] = (index // map_width + 0.5) * height / map_height - 0.5
+        keypoints[0, :, 2] = score
+        keypoints[0, score < self.threshold] = 0
+        if not keypoints[0, :, 2].any():
+            return no_people()
+        return keypoints
+
+
+BACKENDS = {
+    'openpose': OpenPoseBackend,
+    'synthetic': SyntheticBackend,
+    'opencv_dnn': OpenCvDnnBackend,
+}
+
+
+def create_backend(type: str, **options) -> Backend:
+    """{"type": "synthetic", "latency": 0.03} 같은 config section으로 backend를 만듦"""
+    try:
+        cls = BACKENDS[type]
+    except KeyError:
+        raise ValueError(f'Unknown backend: {type}') from None
+    return cls(**options)
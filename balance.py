@@ -0,0 +1,104 @@
+"""main_v2.py의 균형 측정 상태 기계. 현재 시각 대신 frame의 timestamp로 진행.
+
+frame마다 timestamp(camera 촬영 시각이나 녹화 영상의 재생 시각)를 넘겨받으므로, 같은 code로
+camera와 실시간보다 빠르게 decode하는 파일을 모두 채점함. timestamp가 없으면 `clock()`을 씀
+"""
+from time import time
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+from numpy.linalg import norm
+
+from helper import Keypoint, Mode
+
+NECK_HANDS = [Keypoint.Neck, Keypoint.RWrist, Keypoint.LWrist]
+
+
+class Attempt(NamedTuple):
+    """끝난 측정 한 번"""
+    start: float
+    end: float
+    elapsed: float
+    score: int
+    result: Mode
+    anchor_keypoint: Keypoint
+    start_anchor: tuple
+    deviation_threshold: int
+
+
+class BalanceStateMachine:
+    """Idle -> (양팔을 옆으로 들고 한 발을 든 채 `start_hold`초) -> Measuring
+    -> `normal_sec`초가 지나면 Normal, 딛고 선 발이 움직이면 Abnormal -> `score_popup_timeout`초 뒤 Idle.
+    사람을 놓치면 Idle로 돌아감"""
+
+    def __init__(self, normal_sec=25, start_hold=0.7, score_popup_timeout=5, clock: Callable[[], float] = time):
+        self.normal_sec = normal_sec
+        self.start_hold = start_hold
+        self.score_popup_timeout = score_popup_timeout
+        self.clock = clock
+        self.state = Mode.Idle
+        self.reset()
+
+    def reset(self):
+        self.anchor_keypoint = None
+        self.measuring_start_time = None
+        self.score = 0
+        self.elapsed = 0.0
+        self.start_anchor = None
+        self.deviation_threshold = None
+        self.deviation = None
+        self.score_timeout = None
+        # 시작 자세가 처음 보인 시각과 그때의 keypoints. anchor는 이 keypoints로 정함 (main_v2의 Timer와 같음)
+        self._pose_since = None
+        self._pose_keypoints = None
+
+    @staticmethod
+    def is_start_pose(person: np.ndarray) -> bool:
+        lateral_raised = np.std(person[NECK_HANDS, 1]) < 20
+        torso_length = np.abs(person[Keypoint.Neck, 1] - person[Keypoint.MidHip, 1])
+        ankle_diff = np.abs(person[Keypoint.LAnkle, 1] - person[Keypoint.RAnkle, 1])
+        return lateral_raised and torso_length * 0.2 < ankle_diff
+
+    def start_measuring(self, person: np.ndarray, timestamp: float):
+        self.measuring_start_time = timestamp
+        self.anchor_keypoint = max(Keypoint.LAnkle, Keypoint.RAnkle, key=lambda k: person[k, 1])
+        self.start_anchor = person[self.anchor_keypoint, :2].copy()
+        self.deviation_threshold = int(norm(person[Keypoint.Nose, :2] - self.start_anchor) * 0.05)
+        self.deviation = 0.0
+        self.state = Mode.Measuring
+
+    def update(self, person: Optional[np.ndarray], timestamp: Optional[float] = None) -> Optional[Attempt]:
+        """frame의 첫 번째 사람 (25, 3) 또는 None을 넣음. 측정이 끝나는 frame에서 Attempt를 반환"""
+        if timestamp is None:
+            timestamp = self.clock()
+        if person is None:
+            self.state = Mode.NotDetected
+
+        if self.state == Mode.NotDetected:
+            self.reset()
+            self.state = Mode.Idle
+        elif self.state == Mode.Idle:
+            if not self.is_start_pose(person):
+                self._pose_since = self._pose_keypoints = None
+            elif self._pose_since is None:
+                self._pose_since, self._pose_keypoints = timestamp, person.copy()
+            elif timestamp - self._pose_since >= self.start_hold:
+                self.start_measuring(self._pose_keypoints, self._pose_since + self.start_hold)
+        elif self.state == Mode.Measuring:
+            self.elapsed = timestamp - self.measuring_start_time
+            self.score = int(self.elapsed / self.normal_sec * 100)
+            if self.elapsed >= self.normal_sec:
+                self.state = Mode.Normal
+            # Abnormality check
+            self.deviation = float(norm(person[self.anchor_keypoint, :2] - self.start_anchor))
+            if self.deviation > self.deviation_threshold:
+                self.state = Mode.Abnormal
+            if self.state != Mode.Measuring:
+                self.score_timeout = timestamp
+                return Attempt(self.measuring_start_time, timestamp, self.elapsed, self.score, self.state,
+                               self.anchor_keypoint, tuple(self.start_anchor.tolist()), self.deviation_threshold)
+        elif self.state == Mode.Normal or self.state == Mode.Abnormal:
+            if timestamp - self.score_timeout >= self.score_popup_timeout:
+                self.reset()
+                self.state = Mode.Idle
+        return None
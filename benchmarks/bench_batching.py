@@ -0,0 +1,64 @@
+"""synthetic backend로 잰 inference worker의 동적 micro-batching
+(n개 batch의 비용은 CPU 시간 latency * (1 + 0.25 * (n - 1))).
+
+높은 부하(여러 station이 동시에)와 낮은 부하(station 하나)에서 batching을 끄고 켜서
+처리량, 지연 시간, batch 크기 분포, batching window로 늘어난 지연을 비교.
+
+    python benchmarks/bench_batching.py
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+import sys
+from time import perf_counter, sleep
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backends import create_backend  # noqa: E402
+from inference import InferencePool  # noqa: E402
+
+
+def run(pool, jpeg, clients, requests, think_time):
+    latencies = []
+
+    def client(_):
+        for _ in range(requests):
+            start = perf_counter()
+            pool.estimate(jpeg)
+            latencies.append(perf_counter() - start)
+            sleep(think_time)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(client, range(clients)))
+    return len(latencies) / (perf_counter() - start), np.percentile(latencies, [50, 99]) * 1e3
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=40, help='per client')
+    args = parser.parse_args()
+
+    jpeg = cv2.imencode('.jpg', np.full((368, 656, 3), 128, np.uint8))[1].tobytes()
+    loads = [('heavy', 16, 0.0), ('light', 1, 0.05)]
+    for label, clients, think_time in loads:
+        for max_batch in (1, 8):
+            pool = InferencePool(partial(create_backend, 'synthetic', latency=args.latency), args.workers,
+                                 max_queue=clients, max_batch=max_batch, max_window=0.01)
+            pool.wait_ready()
+            rate, (p50, p99) = run(pool, jpeg, clients, args.requests, think_time)
+            stats = pool.stats()
+            pool.close()
+            sizes = ' '.join(f'{size}:{count}' for size, count in stats['batch_sizes'].items())
+            print(f'{label:<5} {clients:2d} clients  max_batch {max_batch}  {rate:6.1f} req/s'
+                  f'  p50 {p50:6.1f} ms  p99 {p99:6.1f} ms  added delay {stats["mean_batching_delay"] * 1e3:5.2f} ms'
+                  f'  batches {sizes}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""/skeleton 결과 cache: 다시 재생한 / 정지한 / 움직이는 장면에서 tier별 조회 비용과 hit rate.
+
+    python benchmarks/bench_cache.py
+"""
+import os
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_cache import ResultCache, perceptual_hash, thumbnail  # noqa: E402
+
+WIDTH, HEIGHT = 1280, 720
+
+
+def frames(kind, count, rng):
+    background = cv2.resize(rng.integers(40, 200, (HEIGHT // 16, WIDTH // 16, 3), np.uint8), (WIDTH, HEIGHT),
+                            interpolation=cv2.INTER_CUBIC)
+    encoded = []
+    for i in range(count):
+        img = background.copy()
+        # 'moving' / 'replay': frame마다 8 px씩 걷는 사람, 나머지는 가만히 서 있음
+        x = WIDTH // 3 + (i * 8 if kind != 'static' else 0)
+        cv2.rectangle(img, (x - 60, HEIGHT // 4), (x + 60, HEIGHT - 20), (30, 30, 160), -1)
+        if kind != 'replay':
+            img = np.clip(img + rng.normal(0, 2, img.shape), 0, 255).astype(np.uint8)
+        encoded.append(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    if kind == 'replay':
+        # 같은 frame 몇 개가 계속 반복해서 올라옴
+        encoded = [encoded[i % 4] for i in range(count)]
+    return encoded
+
+
+def replay(cache, uploads):
+    for buf in uploads:
+        status, _, key = cache.get(buf)
+        if status == 'miss':
+            cache.put(key, np.zeros((1, 25, 3), np.float32))
+    return cache.stats()
+
+
+def main(count=120, number=200):
+    rng = np.random.default_rng(0)
+    sample = frames('static', 1, rng)[0]
+    decode = timeit.timeit(lambda: cv2.imdecode(np.frombuffer(sample, np.uint8), cv2.IMREAD_UNCHANGED),
+                           number=number) / number
+    exact = ResultCache()
+    exact_cost = timeit.timeit(lambda: exact.get(sample), number=number) / number
+    phash_cost = timeit.timeit(lambda: perceptual_hash(thumbnail(sample)), number=number) / number
+    print(f'full decode {decode * 1e3:6.3f} ms  exact lookup {exact_cost * 1e3:6.3f} ms'
+          f'  perceptual hash {phash_cost * 1e3:6.3f} ms   ({len(sample) / 1024:.0f} KiB JPEG)')
+
+    for kind in ('replay', 'static', 'moving'):
+        uploads = frames(kind, count, rng)
+        for perceptual in (False, True):
+            # tier만 비교하도록 ttl을 전체 실행 시간보다 길게
+            stats = replay(ResultCache(ttl=60, perceptual=perceptual), uploads)
+            print(f'{kind:<7} {"exact+phash" if perceptual else "exact":<12} hits {stats["hits"]:4d}'
+                  f'  near {stats["near_hits"]:4d}  misses {stats["misses"]:4d}  hit rate {stats["hit_rate"]:5.1%}')
+
+
+if __name__ == '__main__':
+    main()
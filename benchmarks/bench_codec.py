@@ -0,0 +1,55 @@
+"""/skeleton 응답 포맷별 encode + decode 왕복 비용 비교 (JSON vs f32 vs i16)."""
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import codec  # noqa: E402
+
+
+def json_round_trip(keypoints):
+    body = json.dumps({'code': 0, 'keypoints': keypoints.tolist()})
+    data = json.loads(body)
+    return np.array(data['keypoints'], np.float32)
+
+
+def binary_round_trip(keypoints, mimetype):
+    return codec.decode(codec.encode(keypoints, mimetype))
+
+
+def main(number=2000):
+    rng = np.random.default_rng(0)
+    for people in (1, 10):
+        keypoints = np.empty((people, codec.NUMBER_PARTS, 3), np.float32)
+        keypoints[..., 0] = rng.uniform(0, 1280, keypoints.shape[:2])
+        keypoints[..., 1] = rng.uniform(0, 720, keypoints.shape[:2])
+        keypoints[..., 2] = rng.uniform(0, 1, keypoints.shape[:2])
+
+        cases = {
+            'json': lambda: json_round_trip(keypoints),
+            'f32': lambda: binary_round_trip(keypoints, codec.FLOAT32),
+            'i16': lambda: binary_round_trip(keypoints, codec.INT16),
+        }
+        sizes = {
+            'json': len(json.dumps({'code': 0, 'keypoints': keypoints.tolist()})),
+            'f32': len(codec.encode(keypoints, codec.FLOAT32)),
+            'i16': len(codec.encode(keypoints, codec.INT16)),
+        }
+        for name, fn in cases.items():
+            per_call = timeit.timeit(fn, number=number) / number
+            print(f'people={people:<3} {name:<5} {per_call * 1e6:9.1f} us/round-trip {sizes[name]:7d} bytes')
+
+    # round-trip 정확도 확인
+    f32 = binary_round_trip(keypoints, codec.FLOAT32)
+    i16 = binary_round_trip(keypoints, codec.INT16)
+    assert np.array_equal(f32, keypoints)
+    assert np.abs(i16[..., :2] - keypoints[..., :2]).max() <= 0.5 / codec.MAX_INT16_SCALE + 1e-3
+    assert np.abs(i16[..., 2] - keypoints[..., 2]).max() <= 0.5 / 255 + 1e-6
+    assert binary_round_trip(None, codec.FLOAT32) is None
+
+
+if __name__ == '__main__':
+    main()
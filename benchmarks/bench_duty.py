@@ -0,0 +1,124 @@
+"""measurer 상태별 추론 주기와 움직임 감지에 따른 서버 요청 수를 모의 시간으로 측정.
+
+빈 화면 → 사람이 들어와 대기 → 측정 → 점수 표시 → 떠남 → 빈 화면의 흐름을 camera framerate로 재생하고
+시간당 요청 수와 사람이 들어온 뒤 최대 주기로 올라가기까지의 지연을 비교.
+
+    python benchmarks/bench_duty.py
+"""
+from argparse import ArgumentParser
+from types import SimpleNamespace
+import os
+import sys
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rpi'))
+from motion import MotionDetector  # noqa: E402
+from processors import FrameProcessor  # noqa: E402
+
+WIDTH, HEIGHT = 640, 360
+# (시작 시각, measurer 상태, 장면)
+TIMELINE = [
+    (0, 'NotDetected', 'empty'),
+    (240, 'NotDetected', 'enter'),
+    (245, 'Idle', 'standing'),
+    (300, 'Measuring', 'standing'),
+    (325, 'Normal', 'standing'),
+    (330, 'Idle', 'leave'),
+    (335, 'NotDetected', 'empty'),
+]
+DURATION = 600
+MODE_RATES = {'Idle': 1, 'NotDetected': 1, 'Measuring': None, 'Abnormal': 1, 'Normal': 1}
+
+
+class Scene:
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        background = rng.integers(40, 200, (HEIGHT // 8, WIDTH // 8, 3), np.uint8)
+        self.background = cv.resize(background, (WIDTH, HEIGHT), interpolation=cv.INTER_LINEAR)
+        self.rng = rng
+        self._cache = {}
+
+    def frame(self, scene: str, t: float, start: float) -> bytes:
+        # 빈 화면과 서 있는 사람은 sensor noise만 바뀌므로 몇 장만 만들어 돌려 씀
+        if scene in ('empty', 'standing'):
+            key = scene, int(t * 24) % 4
+            if key not in self._cache:
+                self._cache[key] = self._encode(self._render(WIDTH // 2 if scene == 'standing' else None))
+            return self._cache[key]
+        progress = min((t - start) / 5, 1)
+        x = int(progress * WIDTH / 2) if scene == 'enter' else int(WIDTH / 2 + progress * WIDTH / 2)
+        return self._encode(self._render(x))
+
+    def _render(self, x):
+        img = self.background.copy()
+        if x is not None:
+            cv.rectangle(img, (x - 30, HEIGHT // 4), (x + 30, HEIGHT - 10), (30, 30, 160), -1)
+        noise = self.rng.normal(0, 2, img.shape)
+        return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def _encode(img) -> bytes:
+        return cv.imencode('.jpg', img)[1].tobytes()
+
+
+def simulate(mode_rates, motion, framerate=24):
+    """(요청 시각 목록, 움직임 감지에 쓴 시간)"""
+    processor = FrameProcessor('http://127.0.0.1:9', workers=1, mode_rates=mode_rates, motion=motion,
+                               frame_capacity=1 << 18)
+    # 실제 요청은 보내지 않고 아래에서 직접 frame을 가져가 즉시 완료 처리
+    processor.flush()
+    scene = Scene()
+    requests, motion_time = [], 0.0
+    modes = iter(TIMELINE + [(DURATION, None, None)])
+    start, mode, kind = next(modes)
+    next_start, next_mode, next_kind = next(modes)
+    for i in range(DURATION * framerate):
+        t = i / framerate
+        if t >= next_start:
+            start, mode, kind = next_start, next_mode, next_kind
+            next_start, next_mode, next_kind = next(modes)
+        processor.set_mode(SimpleNamespace(name=mode))
+
+        frame = processor._acquire_frame()
+        data = scene.frame(kind, t, start)
+        frame._view[:len(data)] = data
+        frame.length = len(data)
+        frame.timestamp = t
+        begin = perf_counter()
+        processor._on_frame(frame)
+        motion_time += perf_counter() - begin
+
+        taken = processor._take_frame(timeout=0)
+        if taken is not None:
+            requests.append(t)
+            taken.release()
+            processor._publish(t, None, 0.05)
+    return np.array(requests), motion_time
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--framerate', type=int, default=24)
+    args = parser.parse_args()
+
+    cases = [
+        ('full rate', None, None),
+        ('per-mode rates', MODE_RATES, None),
+        ('per-mode + motion', MODE_RATES, MotionDetector()),
+    ]
+    for label, mode_rates, motion in cases:
+        requests, motion_time = simulate(mode_rates, motion, args.framerate)
+        per_hour = len(requests) / DURATION * 3600
+        # 사람이 들어온 뒤(240초) 처음으로 요청 간격이 0.2초 이하가 된 시각
+        entered = requests[requests >= 240]
+        fast = entered[1:][np.diff(entered) <= 0.2]
+        wake = f'{fast[0] - 240:5.2f} s' if len(fast) else '    - '
+        print(f'{label:<18} requests/hour {per_hour:8.0f}  full rate after entering {wake}'
+              f'  frame handling {motion_time / (DURATION * args.framerate) * 1e3:6.3f} ms/frame')
+
+
+if __name__ == '__main__':
+    main()
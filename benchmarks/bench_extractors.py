@@ -0,0 +1,108 @@
+"""FrameProcessor engine별 CPU 사용량 비교 (같은 throughput 기준).
+
+별도 process에서 inference 지연만 흉내내는 /skeleton stub 서버를 띄우고,
+camera 대신 고정 fps로 JPEG frame을 write하면서 client process의 CPU 시간을 측정.
+
+    python benchmarks/bench_extractors.py --fps 30 --latency 0.1 --workers 4 16
+"""
+from argparse import ArgumentParser
+from multiprocessing import Process
+import os
+import resource
+import socket
+import sys
+from time import sleep, perf_counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'rpi'))
+import codec  # noqa: E402
+from processors import FrameProcessor  # noqa: E402
+
+
+def serve_stub(port, latency):
+    import logging
+    from flask import Flask, Response
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = Flask(__name__)
+    body = codec.encode(np.ones((1, codec.NUMBER_PARTS, 3), np.float32), codec.FLOAT32)
+
+    @app.route('/skeleton', methods=['POST'])
+    def skeleton():
+        sleep(latency)
+        return Response(body, mimetype=codec.FLOAT32)
+
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run(url, engine, workers, fps, duration, frame):
+    processor = FrameProcessor(url, workers, 'f32', 'http', engine=engine)
+    published = [0]
+    publish = processor._publish
+
+    def counting_publish(*args):
+        published[0] += 1
+        publish(*args)
+
+    processor._publish = counting_publish
+    sleep(0.5)
+
+    interval = 1 / fps
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = perf_counter()
+    next_frame = start
+    while perf_counter() - start < duration:
+        # camera처럼 chunk 단위로 write: frame 시작 chunk가 이전 frame을 내보냄
+        processor.write(frame[:4096])
+        processor.write(frame[4096:])
+        next_frame += interval
+        sleep(max(0.0, next_frame - perf_counter()))
+    elapsed = perf_counter() - start
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    dispatcher = processor.dispatcher
+    processor.flush()
+
+    cpu = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    print(f'{engine:<8} workers={workers:<3} {published[0] / elapsed:6.1f} results/s '
+          f'cpu={cpu / elapsed * 100:5.1f}% ({cpu / max(published[0], 1) * 1e3:.2f} ms/result) '
+          f'in_flight_limit={dispatcher.in_flight_limit} sample_interval={dispatcher.sample_interval * 1e3:.0f}ms '
+          f'drop_rate={dispatcher.drop_rate:.2f}')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--latency', type=float, default=0.1, help='stub inference latency (s)')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--frame-size', type=int, default=60000)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = Process(target=serve_stub, args=(port, args.latency), daemon=True)
+    server.start()
+    sleep(1)
+
+    url = f'http://127.0.0.1:{port}/skeleton'
+    # 중간에 0xff가 있으면 assembler가 SOI/EOI로 잘못 보고 frame을 쪼갬. stub 서버는 decode하지 않으므로 0xff만 뺌
+    filler = np.frombuffer(os.urandom(args.frame_size - 4), np.uint8) % 0xff
+    frame = b'\xff\xd8' + filler.tobytes() + b'\xff\xd9'
+    try:
+        for workers in args.workers:
+            for engine in ('threads', 'asyncio'):
+                run(url, engine, workers, args.fps, args.duration, frame)
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""keypoints 흐름을 여러 추론 주기로 재생하며 anchor 이탈 판정의 오탐과 검출 지연 비교 (raw vs KeypointsFilter).
+
+    python benchmarks/bench_filter.py                      # 합성 흐름
+    python benchmarks/bench_filter.py --input rec.npz      # timestamps (n,), keypoints (n, 25, 3)
+    python benchmarks/bench_filter.py --input rec.npz --event 12.5   # 실제로 발을 뗀 시각
+"""
+from argparse import ArgumentParser
+import os
+import sys
+
+import numpy as np
+from numpy.linalg import norm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rpi'))
+from filters import KeypointsFilter  # noqa: E402
+
+NOSE, LANKLE, RANKLE = 0, 14, 11
+
+
+def synthetic_recording(seed, duration=10.0, rate=30, event=8.0, noise=3.0, outlier_rate=0.03, outlier=45.0):
+    """한 발로 서 있다가 `event`초에 발을 떼는 사람. 관절마다 jitter, 가끔 튀는 관절, confidence 저하 포함"""
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(0, duration, 1 / rate)
+    base = np.zeros((25, 3), np.float32)
+    base[:, 0] = 640 + rng.uniform(-80, 80, 25)
+    base[:, 1] = np.linspace(150, 600, 25)
+    base[NOSE, 1], base[LANKLE, 1], base[RANKLE, 1] = 150, 650, 560
+    base[:, 2] = 0.8
+
+    keypoints = np.repeat(base[None], len(timestamps), axis=0)
+    keypoints[..., :2] += rng.normal(0, noise, (len(timestamps), 25, 2))
+    outliers = rng.random((len(timestamps), 25)) < outlier_rate
+    keypoints[..., :2] += outliers[..., None] * rng.normal(0, outlier, (len(timestamps), 25, 2))
+    # 튀는 관절은 confidence도 대체로 낮음
+    keypoints[..., 2] = np.where(outliers, rng.uniform(0.02, 0.4, outliers.shape), rng.uniform(0.6, 0.9, outliers.shape))
+    # 발을 뗀 뒤 0.3초 동안 바깥쪽으로 80px 이동
+    moved = np.clip((timestamps - event) / 0.3, 0, 1) * 80
+    keypoints[:, LANKLE, 0] += moved
+    return timestamps, keypoints
+
+
+def first_abnormal(timestamps, keypoints, keypoints_filter=None):
+    """start_measuring과 같은 방식으로 anchor를 잡고, deviation이 처음 threshold를 넘는 시각"""
+    def estimate(i):
+        if keypoints_filter is None:
+            return keypoints[i]
+        return keypoints_filter(timestamps[i], keypoints[i])
+
+    # 측정 시작 전 1초 동안 filter를 준비
+    start = int(np.searchsorted(timestamps, timestamps[0] + 1.0))
+    for i in range(start):
+        estimate(i)
+    person = estimate(start)
+    anchor = max(LANKLE, RANKLE, key=lambda k: person[k, 1])
+    start_anchor = person[anchor, :2].copy()
+    threshold = int(norm(person[NOSE, :2] - start_anchor) * 0.05)
+    for i in range(start + 1, len(timestamps)):
+        if norm(estimate(i)[anchor, :2] - start_anchor) > threshold:
+            return timestamps[i]
+    return None
+
+
+def replay(recordings, rate, event, filtered):
+    """(오탐 수, 검출 지연 목록). 오탐은 event 이전에 Abnormal이 된 경우"""
+    false_alarms, latencies = 0, []
+    for timestamps, keypoints in recordings:
+        # 추론 주기가 낮으면 camera frame 중 일부만 keypoints가 됨
+        step = max(1, int(round(1 / rate / np.median(np.diff(timestamps)))))
+        detected = first_abnormal(timestamps[::step], keypoints[::step], KeypointsFilter() if filtered else None)
+        if detected is None:
+            continue
+        if event is not None and detected < event:
+            false_alarms += 1
+        elif event is not None:
+            latencies.append(detected - event)
+    return false_alarms, latencies
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--input', help='npz with timestamps and keypoints of one person')
+    parser.add_argument('--event', type=float, help='time the anchor really moved (synthetic: 8.0)')
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--rates', type=float, nargs='+', default=[30, 15, 10, 5, 3])
+    args = parser.parse_args()
+
+    if args.input:
+        data = np.load(args.input)
+        recordings = [(data['timestamps'], data['keypoints'].astype(np.float32))]
+        event = args.event
+    else:
+        recordings = [synthetic_recording(seed) for seed in range(args.runs)]
+        event = 8.0 if args.event is None else args.event
+
+    for rate in args.rates:
+        for filtered in (False, True):
+            false_alarms, latencies = replay(recordings, rate, event, filtered)
+            latency = f'{np.median(latencies) * 1e3:6.0f} ms' if latencies else '     - '
+            print(f'{rate:4.0f} Hz  {"filtered" if filtered else "raw":<8}  false alarms {false_alarms:3d}/{len(recordings)}'
+                  f'  detected {len(latencies):3d}  median latency {latency}')
+
+
+if __name__ == '__main__':
+    main()
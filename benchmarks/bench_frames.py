@@ -0,0 +1,142 @@
+"""MJPEG stream을 임의 크기 chunk로 재생하며 frame 분리 비용 측정.
+
+- assembler: FrameAssembler (numpy로 EOI 검색)
+- find: EOI 검색만 bytes.find로 바꾼 FrameAssembler
+- legacy: 기존 FrameProcessor.write (BytesIO). chunk가 SOI로 시작할 때만 나누므로 random에서는 frame이 틀림
+
+    python benchmarks/bench_frames.py                     # 합성 stream
+    python benchmarks/bench_frames.py --input rec.mjpeg   # picamera로 녹화한 stream
+"""
+from argparse import ArgumentParser
+from io import BytesIO
+import os
+import sys
+from time import perf_counter
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rpi'))
+from frames import EOI, FramePool, FrameAssembler  # noqa: E402
+
+
+def synthetic_stream(frames, width, height):
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (height // 8, width // 8, 3), np.uint8)
+    background = cv.resize(background, (width, height), interpolation=cv.INTER_LINEAR)
+    encoded = []
+    for i in range(frames):
+        img = background.copy()
+        cv.circle(img, (i * 7 % width, height // 2), 60, (0, 0, 255), -1)
+        encoded.append(cv.imencode('.jpg', img)[1].tobytes())
+    return encoded
+
+
+def chunked(stream: bytes, seed=0, min_size=512, max_size=65536):
+    """camera가 chunk를 합치거나 나누는 상황을 흉내내 frame 경계와 무관하게 자름"""
+    rng = np.random.default_rng(seed)
+    chunks = []
+    pos = 0
+    while pos < len(stream):
+        size = int(rng.integers(min_size, max_size))
+        chunks.append(stream[pos:pos + size])
+        pos += size
+    return chunks
+
+
+class LegacyWriter:
+    """기존 FrameProcessor.write 구현"""
+
+    def __init__(self, on_frame):
+        self._stream = BytesIO()
+        self._on_frame = on_frame
+
+    def write(self, buf):
+        if buf.startswith(b'\xff\xd8') and self._stream.tell() > 0:
+            self._on_frame(self._stream.getvalue())
+            self._stream.seek(0)
+            self._stream.truncate()
+        self._stream.write(buf)
+
+
+class FindAssembler(FrameAssembler):
+    def _find_eoi(self, buf, start: int, stop: int) -> int:
+        return buf.find(EOI, start, stop)
+
+
+def split_frames(chunks, capacity):
+    received = []
+
+    def on_frame(frame):
+        received.append(bytes(frame.data))
+        frame.release()
+
+    assembler = FrameAssembler(FramePool(4, capacity), on_frame)
+    for chunk in chunks:
+        assembler.write(chunk)
+    return received
+
+
+def replay(write, chunks, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        for chunk in chunks:
+            write(chunk)
+    return perf_counter() - start
+
+
+def measure(write, chunks, repeat):
+    """(전체 재생 시간, warm-up 이후 한 번 재생할 때의 최대 메모리 할당량)"""
+    elapsed = replay(write, chunks, repeat)
+    tracemalloc.start()
+    replay(write, chunks, 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--input', help='recorded MJPEG stream')
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, 'rb') as f:
+            stream = f.read()
+        expected = None
+    else:
+        frames = synthetic_stream(args.frames, 1280, 720)
+        stream = b''.join(frames)
+        expected = frames
+    frame_count = stream.count(b'\xff\xd9')
+    capacity = max(1 << 20, len(stream) // max(frame_count, 1) * 4)
+
+    if expected is not None:
+        # 1~8 bytes 단위로 잘라 marker가 chunk 경계에 걸리는 경우까지 확인
+        tiny = b''.join(expected[:3])
+        assert split_frames(chunked(tiny, min_size=1, max_size=8), capacity) == expected[:3]
+
+    cases = [('random', chunked(stream))]
+    if expected is not None:
+        cases.insert(0, ('aligned', expected))
+    for label, chunks in cases:
+        if expected is not None:
+            assert split_frames(chunks, capacity) == expected, f'{label}: frames were not split correctly'
+
+        writers = [
+            ('assembler', FrameAssembler(FramePool(4, capacity), lambda frame: frame.release()).write, ''),
+            ('find', FindAssembler(FramePool(4, capacity), lambda frame: frame.release()).write, ''),
+            # 기존 방식은 chunk가 SOI로 시작하는 경우에만 frame을 나눌 수 있음
+            ('legacy', LegacyWriter(lambda frame: None).write, '' if label == 'aligned' else '  (frames split wrongly)'),
+        ]
+        for name, write, note in writers:
+            elapsed, peak = measure(write, chunks, args.repeat)
+            fps = frame_count * args.repeat / elapsed
+            print(f'{label:<8} {name:<9} {fps:9.0f} fps  peak alloc {peak / 1024:8.1f} KiB{note}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""BodyBalanceMeasurer의 tick당 text layer 갱신 비용 측정 (HudCompositor vs 매번 전체를 다시 그리는 기존 방식).
+
+    python benchmarks/bench_hud.py
+"""
+from argparse import ArgumentParser
+import os
+import sys
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rpi'))
+from helper import Alignment, put_text, fill_alpha_channel  # noqa: E402
+from hud import HudCompositor, run_sprite, text_sprite  # noqa: E402
+
+
+def measuring_session(ticks, framerate=30, seed=0):
+    """측정 중 화면: 0.1초마다 바뀌는 timer, 조금씩 흔들리는 anchor, 마지막 1/4은 SCORE popup"""
+    rng = np.random.default_rng(seed)
+    anchor = np.array([640.0, 600.0])
+    for tick in range(ticks):
+        elapsed = tick / framerate
+        if rng.random() < 0.3:
+            anchor += rng.normal(0, 1.5, 2)
+        yield tick >= ticks * 3 // 4, elapsed, int(elapsed / 10 * 100), anchor.copy()
+
+
+def draw_legacy(plate, state, elapsed, score, anchor, size, margin):
+    """기존 _measure_loop의 그리기"""
+    w, h = size
+    plate.fill(0)
+    if state:
+        put_text(plate, 'Normal', (margin, margin), (0, 255, 0))
+        put_text(plate, f'SCORE: {score}', (w // 2, h // 2), (0, 0, 255), Alignment.CENTER, 5, 8, cv.LINE_AA)
+    else:
+        x, y = anchor
+        put_text(plate, 'Measuring', (margin, margin), (0, 255, 0))
+        put_text(plate, f'{elapsed:.1f} s / id: 42', (margin, h - margin), (255, 255, 255))
+        put_text(plate, f'score: {score}', (w - margin, h - margin), (255, 255, 255), Alignment.RIGHT)
+        cv.circle(plate, (640, 600), 20, (0, 255, 0), 2)
+        cv.circle(plate, (int(x), int(y)), 10, (0, 0, 255), -1)
+        put_text(plate, 'anchor', (int(x) + margin, int(y)), (0, 0, 255))
+    fill_alpha_channel(plate)
+    return plate.copy()
+
+
+def draw_hud(hud, state, elapsed, score, anchor, size, margin):
+    w, h = size
+    hud.begin()
+    if state:
+        hud.text('Normal', (margin, margin), (0, 255, 0))
+        hud.text(f'SCORE: {score}', (w // 2, h // 2), (0, 0, 255), Alignment.CENTER, 5, 8, cv.LINE_AA)
+    else:
+        x, y = anchor
+        hud.text('Measuring', (margin, margin), (0, 255, 0))
+        hud.text(f'{elapsed:.1f} s / id: 42', (margin, h - margin), (255, 255, 255))
+        hud.text(f'score: {score}', (w - margin, h - margin), (255, 255, 255), Alignment.RIGHT)
+        hud.circle((640, 600), 20, (0, 255, 0), 2)
+        hud.circle((int(x), int(y)), 10, (0, 0, 255), -1)
+        hud.text('anchor', (int(x) + margin, int(y)), (0, 0, 255))
+    hud.commit()
+    return hud.layer
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--ticks', type=int, default=600)
+    args = parser.parse_args()
+    size = args.width, args.height
+    margin = round(max(size) * 0.025)
+    session = list(measuring_session(args.ticks))
+
+    # 결과 layer가 기존 방식과 같은지 먼저 확인
+    plate = np.zeros((args.height, args.width, 4), np.uint8)
+    hud = HudCompositor(*size)
+    mismatched = 0
+    for tick in session:
+        expected = draw_legacy(plate, *tick, size, margin)
+        mismatched += not np.array_equal(expected, draw_hud(hud, *tick, size, margin))
+    print(f'{mismatched} of {len(session)} layers differ from the legacy path')
+
+    start = perf_counter()
+    for tick in session:
+        draw_legacy(plate, *tick, size, margin)
+    legacy = (perf_counter() - start) / len(session)
+
+    hud = HudCompositor(*size)
+    start = perf_counter()
+    for tick in session:
+        draw_hud(hud, *tick, size, margin)
+    compositor = (perf_counter() - start) / len(session)
+    print(f'per tick  legacy {legacy * 1e3:7.3f} ms  compositor {compositor * 1e3:7.3f} ms  '
+          f'x{legacy / compositor:5.1f}  ({hud.version} layers published for {len(session)} ticks)')
+    # 숫자가 바뀌어도 label/숫자 sprite는 새로 그리지 않아야 함. text_sprite는 LINE_AA인 SCORE popup만
+    for cached in (run_sprite, text_sprite):
+        info = cached.cache_info()
+        print(f'{cached.__name__:<11} {info.misses:5d} rendered  {info.hits:7d} reused  {info.currsize:4d} cached')
+
+
+if __name__ == '__main__':
+    main()
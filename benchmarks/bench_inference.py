@@ -0,0 +1,81 @@
+"""synthetic backend로 잰 inference worker pool 처리량.
+
+여러 Pi station처럼 client thread 여러 개가 동시에 frame을 올림. 이전 서버 구조(요청 thread에서 lock 뒤의
+estimator 하나)와 비교.
+
+    python benchmarks/bench_inference.py --latency 0.02 --workers 1 2 4
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+import sys
+from threading import Lock
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backends import create_backend  # noqa: E402
+from inference import InferencePool, QueueFull  # noqa: E402
+
+
+def run(estimate, clients, requests):
+    """(초당 요청 수, 지연 시간 percentile ms, 거절 수)"""
+    latencies, rejected = [], 0
+
+    def client(_):
+        nonlocal rejected
+        for _ in range(requests):
+            start = perf_counter()
+            try:
+                estimate()
+            except QueueFull:
+                rejected += 1
+                continue
+            latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(client, range(clients)))
+    elapsed = perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, [50, 99]) * 1e3, rejected
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.02, help='synthetic inference CPU time (s)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=25, help='per client')
+    args = parser.parse_args()
+
+    frame = np.full((720, 1280, 3), 128, np.uint8)
+    jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+    print(f'{os.cpu_count()} CPUs, synthetic latency {args.latency * 1e3:.0f} ms, {args.clients} clients')
+
+    backend, lock = create_backend('synthetic', latency=args.latency), Lock()
+
+    def locked():
+        image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        with lock:
+            return backend.estimate(image)
+
+    rate, (p50, p99), _ = run(locked, args.clients, args.requests)
+    print(f'single estimator + lock  {rate:7.1f} req/s  p50 {p50:6.1f} ms  p99 {p99:6.1f} ms')
+
+    for workers in args.workers:
+        pool = InferencePool(partial(create_backend, 'synthetic', latency=args.latency), workers,
+                             max_queue=args.clients)
+        pool.wait_ready()
+        rate, (p50, p99), rejected = run(lambda: pool.estimate(jpeg), args.clients, args.requests)
+        stats = pool.stats()
+        utilization = ' '.join(f'{u:4.0%}' for u in stats['utilization'])
+        print(f'pool, {workers} worker(s)       {rate:7.1f} req/s  p50 {p50:6.1f} ms  p99 {p99:6.1f} ms'
+              f'  rejected {rejected}  utilization {utilization}')
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
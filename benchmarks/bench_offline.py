@@ -0,0 +1,59 @@
+"""synthetic backend로 잰 offline 채점 pipeline 처리량.
+
+임시 directory에 합성 session 영상 몇 개를 쓰고 inference thread와 decoder 수를 바꿔 가며 채점:
+초당 frame 수와 실시간 대비 배속.
+
+    python benchmarks/bench_offline.py --sessions 4 --seconds 30 --latency 0.005
+"""
+from argparse import ArgumentParser
+import os
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from offline import Pipeline, find_sessions  # noqa: E402
+
+
+def write_sessions(directory, sessions, seconds, fps=24, size=(640, 360)):
+    for i in range(sessions):
+        writer = cv2.VideoWriter(os.path.join(directory, f'session{i}.avi'), cv2.VideoWriter_fourcc(*'MJPG'),
+                                 fps, size)
+        rng = np.random.default_rng(i)
+        background = rng.integers(0, 256, (size[1], size[0], 3), np.uint8)
+        for index in range(int(seconds * fps)):
+            writer.write(np.roll(background, index, axis=1))
+        writer.release()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--latency', type=float, default=0.005, help='synthetic inference CPU time (s)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--decoders', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--batch', type=int, default=4)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        write_sessions(directory, args.sessions, args.seconds)
+        paths = find_sessions([directory])
+        sessions = [(os.path.splitext(os.path.basename(path))[0], path) for path in paths]
+        print(f'{os.cpu_count()} CPUs, {args.sessions} sessions of {args.seconds:.0f} s,'
+              f' synthetic latency {args.latency * 1e3:.0f} ms')
+        for workers in args.workers:
+            for decoders in args.decoders:
+                pipeline = Pipeline({'type': 'synthetic', 'latency': args.latency}, workers, decoders, args.batch)
+                start = perf_counter()
+                pipeline.run(sessions, os.path.join(directory, 'out'))
+                elapsed = perf_counter() - start
+                print(f'{workers} worker(s) {decoders} decoder(s)  {pipeline.frames_processed / elapsed:7.1f} fps'
+                      f'  {pipeline.media_time / elapsed:5.1f}x real time')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""사람 수별 skeleton 렌더링 비용 측정 (pose.render_keypoints vs 기존 사람/관절 단위 loop)과
+MainController의 keypoints overlay 갱신 비용 측정 (전체 지우기 vs 지난번에 그린 영역만 지우기).
+
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --width 1920 --height 1080 --people 1 10 20
+"""
+from argparse import ArgumentParser
+import math
+import os
+import sys
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rpi'))
+import pose  # noqa: E402
+from pose import BODY_25_PAIRS, BODY_25_SCALES, BODY_25_COLORS  # noqa: E402
+
+
+def legacy_rectangle(person, threshold):
+    """기존 get_keypoints_rectangle 구현"""
+    type_info = np.finfo(person.dtype)
+    min_x = type_info.max
+    max_x = type_info.min
+    min_y = min_x
+    max_y = max_x
+
+    for part in person:
+        score = part[2]
+        if score > threshold:
+            x, y = part[:2]
+            if max_x < x: max_x = x
+            if min_x > x: min_x = x
+            if max_y < y: max_y = y
+            if min_y > y: min_y = y
+
+    return min_x, min_y, max_x - min_x, max_y - min_y if max_x >= min_x and max_y >= min_y else (0, 0, 0, 0)
+
+
+def legacy_render(frame, keypoints, threshold=0.05):
+    """기존 render_keypoints 구현. BGRA frame은 그린 뒤 alpha를 따로 채움"""
+    height, width = frame.shape[:2]
+    area = width * height
+    number_scales = len(BODY_25_SCALES)
+
+    for person in keypoints:
+        x, y, w, h = legacy_rectangle(person, 0.1)
+        if w * h > 0:
+            ratio_area = min(1, max(w / width, h / height))
+            thickness_ratio = max(round(math.sqrt(area) * pose.thickness_circle_ratio * ratio_area), 2)
+            thickness_circle = max(1, thickness_ratio if ratio_area > 0.05 else -1)
+            thickness_line = max(1, round(thickness_ratio * pose.thickness_line_ratio_wrt_circle))
+            radius = thickness_ratio / 2
+
+            for i, j in BODY_25_PAIRS:
+                kp1, kp2 = person[i], person[j]
+                if kp1[2] > threshold and kp2[2] > threshold:
+                    thickness_line_scaled = int(round(thickness_line * BODY_25_SCALES[j % number_scales]))
+                    color = BODY_25_COLORS[j][::-1]
+                    p1 = int(round(kp1[0])), int(round(kp1[1]))
+                    p2 = int(round(kp2[0])), int(round(kp2[1]))
+                    cv.line(frame, p1, p2, color, thickness_line_scaled)
+
+            for i, part in enumerate(person):
+                if part[2] > threshold:
+                    radius_scaled = int(round(radius * BODY_25_SCALES[i % number_scales]))
+                    thickness_circle_scaled = int(round(thickness_circle * BODY_25_SCALES[i % number_scales]))
+                    color = BODY_25_COLORS[i][::-1]
+                    center = int(round(part[0])), int(round(part[1]))
+                    cv.circle(frame, center, radius_scaled, color, thickness_circle_scaled)
+
+    if frame.shape[2] == 4:
+        mask = np.logical_or(np.logical_or(frame[:, :, 0], frame[:, :, 1]), frame[:, :, 2])
+        frame[:, :, 3][mask] = 255
+
+
+def synthetic_keypoints(people, width, height, seed=0):
+    """화면에 흩어진 사람들. 관절 일부는 confidence가 낮아 그려지지 않음"""
+    rng = np.random.default_rng(seed)
+    keypoints = np.zeros((people, 25, 3), np.float32)
+    scale = min(width, height) / max(2, math.sqrt(people))
+    for person in keypoints:
+        cx, cy = rng.uniform(0.1, 0.9) * width, rng.uniform(0.2, 0.8) * height
+        person[:, 0] = cx + rng.uniform(-0.25, 0.25, 25) * scale
+        person[:, 1] = cy + rng.uniform(-0.5, 0.5, 25) * scale
+        person[:, 2] = rng.uniform(0, 1, 25)
+    return keypoints
+
+
+def measure(render, frame, keypoints, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        frame.fill(0)
+        render(frame, keypoints)
+    return (perf_counter() - start) / repeat
+
+
+def overlay_sequence(count, width, height, seed=0):
+    """한 사람이 천천히 움직이다 가끔 사라지는 keypoints 흐름"""
+    rng = np.random.default_rng(seed)
+    person = synthetic_keypoints(1, width, height, seed)
+    sequence = []
+    for i in range(count):
+        person[..., :2] += rng.normal(0, 3, (1, 25, 2))
+        sequence.append(None if i % 30 == 29 else person.copy())
+    return sequence
+
+
+def update_full(drawing, sequence):
+    """기존 방식: 매번 전체 buffer를 지우고 다시 그림"""
+    for keypoints in sequence:
+        drawing.fill(0)
+        if keypoints is not None:
+            pose.render_keypoints(drawing, keypoints)
+        yield
+
+
+def update_dirty(drawing, sequence, regions):
+    """MainController._update_keypoints_overlay와 같은 방식"""
+    drawn_region = None
+    for keypoints in sequence:
+        if drawn_region is not None:
+            x, y, w, h = drawn_region
+            drawing[y:y + h, x:x + w] = 0
+        drawn_region = pose.render_keypoints(drawing, keypoints) if keypoints is not None else None
+        regions.append(drawn_region)
+        yield
+
+
+def compare_overlay(width, height, count):
+    sequence = overlay_sequence(count, width, height)
+    full, dirty = np.zeros((height, width, 4), np.uint8), np.zeros((height, width, 4), np.uint8)
+    regions = []
+    for _ in zip(update_full(full, sequence), update_dirty(dirty, sequence, regions)):
+        assert np.array_equal(full, dirty), 'dirty region update differs from full redraw'
+    coverage = np.mean([region[2] * region[3] if region else 0 for region in regions]) / (width * height)
+
+    timings = []
+    for update in (lambda drawing: update_full(drawing, sequence),
+                   lambda drawing: update_dirty(drawing, sequence, [])):
+        drawing = np.zeros((height, width, 4), np.uint8)
+        start = perf_counter()
+        for _ in update(drawing):
+            pass
+        timings.append((perf_counter() - start) / count)
+    print(f'overlay full {timings[0] * 1e3:7.3f} ms  dirty {timings[1] * 1e3:7.3f} ms  '
+          f'x{timings[0] / timings[1]:5.2f}  (region {coverage:.0%} of frame)')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--people', type=int, nargs='+', default=[1, 3, 10, 20])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    for channels in (3, 4):
+        label = 'BGR' if channels == 3 else 'BGRA'
+        frame = np.zeros((args.height, args.width, channels), np.uint8)
+        for people in args.people:
+            keypoints = synthetic_keypoints(people, args.width, args.height)
+            # 원은 기존 구현과 pixel 단위로 같고, 색이 다른 선끼리 교차하는 곳만 그리는 순서에 따라 다를 수 있음
+            if people == 1:
+                expected, actual = np.zeros_like(frame), np.zeros_like(frame)
+                legacy_render(expected, keypoints)
+                pose.render_keypoints(actual, keypoints)
+                mismatch = np.count_nonzero((expected != actual).any(axis=2))
+                drawn = np.count_nonzero(expected[..., :3].any(axis=2))
+                print(f'{label:<4} 1 person: {mismatch} of {drawn} drawn pixels differ')
+
+            legacy = measure(legacy_render, frame, keypoints, args.repeat)
+            vectorized = measure(pose.render_keypoints, frame, keypoints, args.repeat)
+            print(f'{label:<4} people {people:3d}  legacy {legacy * 1e3:7.3f} ms  '
+                  f'vectorized {vectorized * 1e3:7.3f} ms  x{legacy / vectorized:5.2f}')
+
+    compare_overlay(args.width, args.height, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""기록된 keypoints로 BodyBalanceMeasurer와 keypoints overlay 그리기의 처리량 측정.
+
+기록 경로를 주면 그 기록을, 없으면 합성한 기록(30초마다 2초에 측정 시작, 18초에 anchor 발목이 움직임)을 사용.
+
+    python benchmarks/bench_replay.py [recordings/20240101-120000] --minutes 10
+"""
+from argparse import ArgumentParser
+from collections import namedtuple
+import json
+import os
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import numpy as np
+
+RPI_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rpi')
+sys.path.insert(0, RPI_DIR)
+from measurer import BodyBalanceMeasurer, Keypoint  # noqa: E402
+from pose import render_keypoints  # noqa: E402
+from recording import KeypointsLog, KeypointsRecorder, KeypointsReplayer  # noqa: E402
+
+
+def synthesize(path, minutes, framerate=24, resolution=(1280, 720), seed=0):
+    """한 발로 선 사람이 30초마다 측정을 시작하고 16초 뒤에 발을 디딤"""
+    rng = np.random.default_rng(seed)
+    width, height = resolution
+    pose = np.zeros((1, 25, 3), np.float32)
+    pose[0, :, 0] = rng.uniform(0.4, 0.6, 25) * width
+    pose[0, :, 1] = np.linspace(0.15, 0.9, 25) * height
+    pose[0, :, 2] = 0.8
+    pose[0, Keypoint.Nose, 1] = 0.15 * height
+    pose[0, Keypoint.RAnkle, 1] = 0.9 * height
+    pose[0, Keypoint.LAnkle, 1] = 0.8 * height
+    recorder = KeypointsRecorder(path, resolution=resolution)
+    for index in range(int(minutes * 60 * framerate)):
+        t = index / framerate
+        keypoints = pose.copy()
+        keypoints[0, :, :2] += rng.normal(0, 0.5, (25, 2))
+        if t % 30 >= 18:
+            keypoints[0, Keypoint.RAnkle, 0] += 60
+        if index % (30 * framerate) == 2 * framerate:
+            recorder.mark('start', 1000 + t, user_id=str(index))
+        recorder.record(1000 + t, keypoints)
+    recorder.close()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('path', nargs='?', help='확장자를 뺀 기록 경로')
+    parser.add_argument('--minutes', type=float, default=10, help='합성할 기록의 길이')
+    parser.add_argument('--speed', type=float, default=20, help='속도를 제한한 재생의 배율')
+    args = parser.parse_args()
+
+    with open(os.path.join(RPI_DIR, 'config.json')) as f:
+        base_config = json.load(f, object_hook=lambda d: namedtuple('Config', d.keys())(*d.values()))
+
+    with TemporaryDirectory() as directory:
+        path = args.path
+        if path is None:
+            path = os.path.join(directory, 'synthetic')
+            start = perf_counter()
+            synthesize(path, args.minutes)
+            print(f'recorded {args.minutes:.0f} min in {perf_counter() - start:.2f} s')
+
+        start = perf_counter()
+        log = KeypointsLog(path)
+        print(f'open: {(perf_counter() - start) * 1e3:.2f} ms for {len(log)} records'
+              f' ({log.duration / 60:.1f} min, {os.path.getsize(path + ".bin") / 2 ** 20:.1f} MiB)')
+
+        start = perf_counter()
+        people = sum(keypoints is not None for _, keypoints in (log[i] for i in range(len(log))))
+        elapsed = perf_counter() - start
+        print(f'read:    {len(log) / elapsed:9.0f} records/s ({people} with people)')
+
+        width, height = log.resolution or (1280, 720)
+        config = base_config._replace(picamera=base_config.picamera._replace(
+            resolution=base_config.picamera.resolution._replace(width=width, height=height)))
+        for speed in (None, args.speed):
+            replayer = KeypointsReplayer(log, speed)
+            scores = []
+            measurer = BodyBalanceMeasurer(replayer, config, clock=replayer.clock)
+            measurer.add_score_listener(lambda *score: scores.append(score))
+            # 속도를 제한한 재생은 처음 1분만
+            stop = len(log) if speed is None else log.seek(log.start + 60)
+            start = perf_counter()
+            replayer.run(measurer, stop=stop)
+            elapsed = perf_counter() - start
+            measurer.close()
+            results = ' '.join(f'{mode.name[0]}{score}' for _, score, _, mode in scores[:8])
+            if speed is None:
+                print(f'measure: {stop / elapsed:9.0f} records/s, {len(scores)} attempts: {results} ...')
+            else:
+                media = float(log.times[stop - 1] - log.times[0])
+                print(f'replay x{speed:.0f}: {media:.1f} s of log in {elapsed:.2f} s'
+                      f' (x{media / elapsed:.1f}), {len(scores)} attempts: {results}')
+
+        canvas = np.zeros((height, width, 4), np.uint8)
+        drawn = None
+        count = min(len(log), 5000)
+        start = perf_counter()
+        for i in range(count):
+            _, keypoints = log[i]
+            if drawn is not None:
+                x, y, w, h = drawn
+                canvas[y:y + h, x:x + w] = 0
+            drawn = render_keypoints(canvas, keypoints) if keypoints is not None else None
+        elapsed = perf_counter() - start
+        print(f'render:  {count / elapsed:9.0f} records/s')
+        del log
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""원본 frame 업로드와 사람 영역만 잘라낸 업로드의 크기, 자르는 비용, 서버 decode + 입력 resize 비용 비교.
+잘라낸 이미지에서 찾은 위치를 원본 좌표로 되돌렸을 때의 오차도 확인.
+
+    python benchmarks/bench_roi.py
+"""
+import os
+import sys
+import timeit
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rpi'))
+from roi import RoiCropper  # noqa: E402
+
+WIDTH, HEIGHT = 1280, 720
+# 서버(OpenPose net_resolution)의 입력 높이
+NET_HEIGHT = 368
+
+
+def scene(person_height, rng):
+    """배경 위에 서 있는 사람 하나와 그 keypoints (1, 25, 3)"""
+    background = rng.integers(40, 200, (HEIGHT // 16, WIDTH // 16, 3), np.uint8)
+    img = cv.resize(background, (WIDTH, HEIGHT), interpolation=cv.INTER_CUBIC)
+    img = np.clip(img + rng.normal(0, 4, img.shape), 0, 255).astype(np.uint8)
+    cx, top = WIDTH // 2, HEIGHT - 20 - person_height
+    keypoints = np.zeros((1, 25, 3), np.float32)
+    keypoints[0, :, 0] = cx + rng.uniform(-person_height / 5, person_height / 5, 25)
+    keypoints[0, :, 1] = np.linspace(top, top + person_height, 25)
+    keypoints[0, :, 2] = 0.8
+    for x, y, _ in keypoints[0]:
+        cv.circle(img, (int(x), int(y)), 6, (20, 20, 180), -1)
+    return img, keypoints
+
+
+def server_decode(jpeg):
+    """서버가 추론 전에 하는 decode + network 입력 크기로의 resize"""
+    img = cv.imdecode(np.frombuffer(jpeg, np.uint8), cv.IMREAD_COLOR)
+    scale = NET_HEIGHT / img.shape[0]
+    return cv.resize(img, (round(img.shape[1] * scale), NET_HEIGHT), interpolation=cv.INTER_AREA)
+
+
+def marker_error(cropper, jpeg, region):
+    """원본 (x, y)에 찍은 점을 잘라낸 이미지에서 찾아 원본 좌표로 되돌린 오차(px)"""
+    x0, y0, x1, y1 = region
+    target = np.array([(x0 + x1) // 2 + 17, (y0 + y1) // 2 - 11])
+    img = cv.imdecode(np.frombuffer(jpeg, np.uint8), cv.IMREAD_COLOR)
+    cv.circle(img, tuple(int(v) for v in target), 8, (255, 255, 255), -1, cv.LINE_AA)
+    marked = cv.imencode('.jpg', img, [cv.IMWRITE_JPEG_QUALITY, 95])[1]
+    encoded, roi = cropper.crop_jpeg(marked, region)
+    crop = cv.imdecode(np.frombuffer(encoded, np.uint8), cv.IMREAD_GRAYSCALE).astype(np.float32)
+    weights = np.clip(crop - 200, 0, None)
+    ys, xs = np.indices(crop.shape)
+    found = np.array([[[(xs * weights).sum() / weights.sum(), (ys * weights).sum() / weights.sum(), 1]]], np.float32)
+    restored = roi.to_frame(found)[0, 0, :2]
+    return float(np.linalg.norm(restored - target))
+
+
+def main(number=50):
+    rng = np.random.default_rng(0)
+    cropper = RoiCropper(WIDTH, HEIGHT)
+    for person_height in (600, 400, 200):
+        img, keypoints = scene(person_height, rng)
+        jpeg = cv.imencode('.jpg', img, [cv.IMWRITE_JPEG_QUALITY, 90])[1]
+        region = cropper._person_region(keypoints)
+        encoded, roi = cropper.crop_jpeg(jpeg, region)
+
+        crop_time = timeit.timeit(lambda: cropper.crop_jpeg(jpeg, region), number=number) / number
+        full_decode = timeit.timeit(lambda: server_decode(jpeg), number=number) / number
+        crop_decode = timeit.timeit(lambda: server_decode(encoded), number=number) / number
+        x0, y0, x1, y1 = region
+        print(f'person {person_height:3d}px  region {x1 - x0:4d}x{y1 - y0:<4d} sent {roi.scale_x:.2f}x'
+              f'  bytes {len(jpeg) / 1024:6.1f} KiB -> {len(encoded) / 1024:5.1f} KiB'
+              f'  crop {crop_time * 1e3:5.2f} ms'
+              f'  server decode+resize {full_decode * 1e3:5.2f} -> {crop_decode * 1e3:5.2f} ms'
+              f'  back-projection error {marker_error(cropper, jpeg, region):4.2f} px')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""ScoreUploader를 local mock 점수 서버에 붙여서 확인.
+
+1. DB가 응답하지 않는 동안(--hang초) submit이 걸리는 시간 (measurer thread가 기다리는 시간)
+2. DB가 꺼져 있는 동안 쌓인 점수가 서버가 다시 뜬 뒤 모두 올라가는 시간과 요청 수
+3. 올리기 전에 uploader를 닫고 다시 열어도(재부팅) 점수가 남아 있는지
+4. bulk endpoint가 없는 서버(404)와 일부 점수를 거절(400)하는 서버
+5. 처음 몇 요청을 429로 돌려보내는 서버. 거절된 점수 없이 다시 보내야 함
+
+mock 서버가 받은 점수를 세어 빠지거나 중복된 점수가 없는지 확인.
+
+    python benchmarks/bench_uploader.py --scores 200
+"""
+from argparse import ArgumentParser
+from collections import Counter
+import os
+import socket
+import sys
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'rpi'))
+from uploader import ScoreUploader, score_record  # noqa: E402
+
+
+class MockScoreServer:
+    """/scores/save와 /scores/save_bulk. 받은 점수의 user_seq를 셈"""
+
+    def __init__(self, port: int, bulk=True, latency=0.0, reject=None, throttle=0):
+        import logging
+        from flask import Flask, request
+        from werkzeug.serving import make_server
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.received = Counter()
+        self.requests = Counter()
+        self.latency = latency
+        # 남은 429 응답 수
+        self.throttle = throttle
+        app = Flask(__name__)
+
+        @app.before_request
+        def rate_limit():
+            if self.throttle > 0:
+                self.throttle -= 1
+                self.requests['429'] += 1
+                return {'msg': 'too many requests'}, 429
+
+        @app.route('/scores/save', methods=['POST'])
+        def save():
+            self.requests['save'] += 1
+            sleep(self.latency)
+            record = request.get_json()
+            if reject is not None and reject(record):
+                return {'msg': 'invalid score'}, 400
+            self.received[record['user_seq']] += 1
+            return {'msg': 'success'}
+
+        @app.route('/scores/save_bulk', methods=['POST'])
+        def save_bulk():
+            self.requests['save_bulk'] += 1
+            if not bulk:
+                return {'msg': 'not found'}, 404
+            sleep(self.latency)
+            records = request.get_json()
+            if reject is not None and any(reject(record) for record in records):
+                return {'msg': 'invalid score'}, 400
+            self.received.update(record['user_seq'] for record in records)
+            return {'msg': 'success'}
+
+        self._server = make_server('127.0.0.1', port, app, threaded=True)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def submit_all(uploader: ScoreUploader, ids, interval=0.0):
+    """measurer처럼 점수를 하나씩 넣으며 submit에 걸린 시간을 잼"""
+    times = []
+    for user_id in ids:
+        start = perf_counter()
+        uploader.submit(score_record(user_id, 1, 42, 12.345))
+        times.append(perf_counter() - start)
+        if interval:
+            sleep(interval)
+    return np.array(times)
+
+
+def check(name: str, server: MockScoreServer, ids, extra=''):
+    missing = [user_id for user_id in ids if not server.received[user_id]]
+    duplicated = sum(count - 1 for count in server.received.values() if count > 1)
+    print(f'{name}: {len(ids) - len(missing)}/{len(ids)} received, {duplicated} duplicated,'
+          f' requests {dict(server.requests)}{extra}')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--scores', type=int, default=100)
+    parser.add_argument('--hang', type=float, default=3.0, help='DB가 응답하지 않는 시간(초)')
+    parser.add_argument('--outage', type=float, default=3.0, help='DB가 꺼져 있는 시간(초)')
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        # 1. 응답하지 않는 DB
+        port = free_port()
+        server = MockScoreServer(port, latency=args.hang)
+        uploader = ScoreUploader(f'http://127.0.0.1:{port}', os.path.join(directory, 'hang.sqlite3'),
+                                 timeout=args.hang * 2, min_backoff=0.2)
+        ids = [f'hang-{i}' for i in range(args.scores)]
+        times = submit_all(uploader, ids)
+        print(f'submit while the database hangs {args.hang:.0f} s: p50 {np.median(times) * 1e3:.2f} ms,'
+              f' p99 {np.percentile(times, 99) * 1e3:.2f} ms, max {times.max() * 1e3:.2f} ms')
+        server.latency = 0.0
+        uploader.wait_empty(args.hang * 4)
+        check('  after it recovers', server, ids)
+        uploader.close()
+        server.close()
+
+        # 2. 꺼져 있던 DB. 3. 도중에 uploader를 닫았다가 다시 엶
+        port = free_port()
+        url = f'http://127.0.0.1:{port}'
+        spool = os.path.join(directory, 'outage.sqlite3')
+        uploader = ScoreUploader(url, spool, min_backoff=0.2, max_backoff=1.0)
+        ids = [f'outage-{i}' for i in range(args.scores)]
+        submit_all(uploader, ids[:len(ids) // 2], args.outage / args.scores)
+        uploader.close()
+        uploader = ScoreUploader(url, spool, min_backoff=0.2, max_backoff=1.0)
+        print(f'reopened the spool with {uploader.pending}/{len(ids) // 2} scores pending')
+        submit_all(uploader, ids[len(ids) // 2:], args.outage / args.scores)
+        failures = uploader.failures
+        server = MockScoreServer(port)
+        start = perf_counter()
+        drained = uploader.wait_empty(10)
+        elapsed = perf_counter() - start
+        check(f'outage of {args.outage:.0f} s', server, ids,
+              f', {failures} failed posts, drained {"in" if drained else "NOT in"} {elapsed:.2f} s after restart')
+        uploader.close()
+        server.close()
+
+        # 4. bulk endpoint가 없고 일부 점수를 거절하는 서버
+        port = free_port()
+        server = MockScoreServer(port, bulk=False, reject=lambda record: record['user_seq'].endswith('7'))
+        uploader = ScoreUploader(f'http://127.0.0.1:{port}', os.path.join(directory, 'legacy.sqlite3'))
+        ids = [f'legacy-{i}' for i in range(args.scores)]
+        submit_all(uploader, ids)
+        uploader.wait_empty(10)
+        rejected = [user_id for user_id in ids if user_id.endswith('7')]
+        check('no bulk endpoint, 400 for ids ending in 7', server, [i for i in ids if i not in rejected],
+              f', spool {uploader.counts()} (expected {len(rejected)} rejected)')
+        uploader.close()
+        server.close()
+
+        # 5. 요청 수 제한(429)
+        port = free_port()
+        server = MockScoreServer(port, throttle=3)
+        uploader = ScoreUploader(f'http://127.0.0.1:{port}', os.path.join(directory, 'throttle.sqlite3'),
+                                 min_backoff=0.2)
+        ids = [f'throttle-{i}' for i in range(args.scores)]
+        submit_all(uploader, ids)
+        drained = uploader.wait_empty(10)
+        check('429 for the first 3 requests', server, ids,
+              f', {uploader.failures} failed posts, spool {uploader.counts()}{"" if drained else " NOT drained"}')
+        uploader.close()
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
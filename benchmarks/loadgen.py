@@ -0,0 +1,503 @@
+"""여러 Pi station이 동시에 /skeleton을 호출하는 상황을 흉내내는 부하 생성기.
+
+station마다 camera thread가 `--fps`로 frame을 만들고, `--workers`개의 upload thread가
+FrameProcessor + KeypointsExtractor처럼 가장 최신 frame만 가져가 보냄 (보내기 전에 새 frame이
+오면 이전 frame은 버림). Pi와 같은 AdaptiveDispatcher로 동시 요청 수와 샘플링 간격을 조절하며,
+`--fixed`면 항상 workers개를 동시에 보냄. 결과는 더 최신 frame의 결과가 이미 있으면 버림.
+
+처리량, 응답 시간 분포(p50/p95/p99), 오류/timeout/stale(410) 비율과 station별 keypoints 신선도
+(화면에 보이는 keypoints가 나온 frame이 촬영된 뒤 지난 시간)를 보고. 서버가 /workers를 제공하면
+측정 구간 동안 추론하지 않고 버린 frame(shed)과 결과가 쓰이지 않은 추론(wasted)도 보고.
+
+`--transport stream`이면 HTTP POST 대신 Pi의 StreamExtractor로 stream_server에 한 연결로 보냄.
+stream에는 header가 없어 deadline과 mode를 보내지 않고, 서버가 버린 frame은 응답이 없어
+timeout 뒤에 dropped로 셈. `--transport http stream`이면 같은 조건에서 둘을 차례로 측정.
+
+    python benchmarks/loadgen.py --serve --stations 1 4 8 --duration 20     # synthetic backend 서버를 띄워서
+    python benchmarks/loadgen.py --serve --stations 1 4 --transport http stream
+    python benchmarks/loadgen.py --url http://10.0.0.2:5000/skeleton --stations 8 --fixture rec.mjpeg
+"""
+from argparse import ArgumentParser
+from collections import Counter
+import json
+from multiprocessing import Process
+import os
+import socket
+import sys
+import tempfile
+from threading import Condition, Lock, Thread
+from time import perf_counter, sleep, time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'rpi'))
+import codec  # noqa: E402
+from dispatch import AdaptiveDispatcher  # noqa: E402
+from transport import StreamExtractor  # noqa: E402
+
+
+def load_fixture(path: str) -> List[bytes]:
+    """JPEG 파일이 든 directory 또는 MJPEG stream(picamera 녹화)"""
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(('.jpg', '.jpeg')))
+        frames = []
+        for name in names:
+            with open(os.path.join(path, name), 'rb') as f:
+                frames.append(f.read())
+        return frames
+    with open(path, 'rb') as f:
+        stream = f.read()
+    frames = []
+    start = stream.find(b'\xff\xd8')
+    while start >= 0:
+        end = stream.find(b'\xff\xd9', start)
+        if end < 0:
+            break
+        frames.append(stream[start:end + 2])
+        start = stream.find(b'\xff\xd8', end + 2)
+    return frames
+
+
+def synthetic_frames(station: int, count: int, width: int, height: int, quality: int) -> List[bytes]:
+    """station마다 다른 장면. 서버의 result cache에 걸리지 않도록 frame마다 움직임"""
+    rng = np.random.default_rng(station)
+    background = cv2.resize(rng.integers(0, 255, (height // 16, width // 16, 3), np.uint8), (width, height),
+                            interpolation=cv2.INTER_LINEAR)
+    frames = []
+    for i in range(count):
+        image = background.copy()
+        x = int(width * (0.3 + 0.4 * i / count))
+        cv2.ellipse(image, (x, height // 2), (width // 16, height // 3), 0, 0, 360, (40, 80, 200), -1)
+        cv2.circle(image, (x, height // 6), height // 14, (60, 160, 220), -1)
+        frames.append(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+class StreamFrame:
+    """StreamExtractor가 보내는 frames.Frame 대신. 업로드마다 새로 만들므로 release할 것이 없음"""
+    roi = None
+    trace_id = 0
+
+    def __init__(self, timestamp: float, jpeg: bytes):
+        self.timestamp = timestamp
+        self.data = jpeg
+        self.length = len(jpeg)
+
+    def release(self):
+        pass
+
+
+class Station:
+    """Pi 한 대: camera thread 하나와 upload worker `workers`개.
+    `stream_url`이 있으면 upload worker 대신 최대 `workers`개를 응답 대기로 두는 StreamExtractor 하나"""
+
+    def __init__(self, index: int, url: str, frames: List[bytes], fps: float, workers: int, timeout: float,
+                 mode='Idle', deadline=True, adaptive=True, target_age=0.15, keypoints_format='f32',
+                 stream_url: Optional[str] = None):
+        self.index = index
+        self.mode = mode
+        # Pi처럼 촬영 시각과 기한(요청 timeout)을 보냄
+        self.deadline = deadline
+        self.url = url
+        self.stream_url = stream_url
+        self.workers = workers
+        self._extractor = None  # type: Optional[StreamExtractor]
+        self.frames = frames
+        self.fps = fps
+        self.timeout = timeout
+        self.accept = codec.accept_header(keypoints_format)
+        self._condition = Condition()
+        self._latest = None  # (timestamp, jpeg)
+        self.dispatcher = AdaptiveDispatcher(workers, target_age) if adaptive else None
+        self._lock = Lock()
+        self.running = False
+        self.recording = False
+        # 측정 구간의 기록
+        self.latencies = []  # type: List[float]
+        self.outcomes = Counter()  # type: Counter
+        self.captured = 0
+        self.superseded = 0
+        # AdaptiveDispatcher의 샘플링 간격 때문에 보내지 않은 frame
+        self.sampled_out = 0
+        self.stale = 0
+        self.freshness = []  # type: List[float]
+        self.published_timestamp = None  # type: Optional[float]
+        self._threads = [Thread(target=self._camera, name=f'station{index}-camera', daemon=True)]
+        if stream_url is None:
+            self._threads += [Thread(target=self._upload, name=f'station{index}-upload{i}', daemon=True)
+                              for i in range(workers)]
+
+    def start(self):
+        self.running = True
+        for thread in self._threads:
+            thread.start()
+        if self.stream_url is not None:
+            # 생성하면서 바로 연결하고 보내기 시작함
+            self._extractor = StreamExtractor(self.stream_url, self, f'station{self.index}-stream', self.workers,
+                                              self.timeout)
+
+    def stop(self):
+        self.running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._extractor is not None:
+            self._extractor.terminated = True
+            self._extractor.join(self.timeout + 1)
+        for thread in self._threads:
+            thread.join(self.timeout + 1)
+
+    def _camera(self):
+        interval = 1 / self.fps
+        # station들이 같은 순간에 찍지 않도록 시작 시점을 흩뜨림
+        next_frame = perf_counter() + interval * (self.index * 0.37 % 1)
+        i = self.index
+        while self.running:
+            sleep(max(0.0, next_frame - perf_counter()))
+            next_frame += interval
+            timestamp = time()
+            with self._condition:
+                if self.dispatcher is not None and not self.dispatcher.accept(timestamp):
+                    self.sampled_out += self.recording
+                else:
+                    if self._latest is not None:
+                        self.superseded += self.recording
+                        if self.dispatcher is not None:
+                            self.dispatcher.superseded()
+                    self._latest = timestamp, self.frames[i % len(self.frames)]
+                    self._condition.notify()
+            if self.recording:
+                self.captured += 1
+            i += 1
+
+    def _ready(self) -> bool:
+        return not self.running or (self._latest is not None and
+                                    (self.dispatcher is None or self.dispatcher.can_dispatch()))
+
+    def _take(self):
+        with self._condition:
+            if not self._condition.wait_for(self._ready, 0.5) or not self.running:
+                return None
+            latest, self._latest = self._latest, None
+            if self.dispatcher is not None:
+                self.dispatcher.dispatched()
+            return latest
+
+    def _done(self, outcome: str, rtt: float, server_time: Optional[float]):
+        """FrameProcessor의 _publish/_discard와 같이 dispatcher에 결과를 알림"""
+        with self._condition:
+            if self.dispatcher is not None:
+                if outcome == '200':
+                    self.dispatcher.completed(time(), rtt, server_time)
+                elif outcome == '410':
+                    self.dispatcher.shed()
+                else:
+                    self.dispatcher.failed()
+            self._condition.notify_all()
+
+    def _upload(self):
+        sess = requests.Session()
+        sess.headers['Accept'] = self.accept
+        sess.headers.update({'X-Station-Id': f'station-{self.index}', 'X-Station-Mode': self.mode,
+                             'X-Session-Id': f'{self.index}' if self.mode == 'Measuring' else ''})
+        while self.running:
+            latest = self._take()
+            if latest is None:
+                continue
+            timestamp, jpeg = latest
+            recording = self.recording
+            sent = perf_counter()
+            server_time = None
+            headers = {'X-Frame-Time': f'{timestamp:.6f}', 'X-Budget-Ms': f'{self.timeout * 1000:.0f}'} \
+                if self.deadline else None
+            try:
+                res = sess.post(self.url, files={'frame': jpeg}, headers=headers, timeout=self.timeout)
+                outcome = str(res.status_code)
+                if res.status_code == 200:
+                    codec.decode(res.content) if codec.is_binary(res.headers.get('Content-Type', '')) \
+                        else res.json()
+                    server_time = float(res.headers.get('X-Process-Time', 0)) or None
+            except requests.exceptions.Timeout:
+                outcome = 'timeout'
+            except (requests.exceptions.RequestException, ValueError) as e:
+                outcome = type(e).__name__
+            latency = perf_counter() - sent
+            self._done(outcome, latency, server_time)
+            self._record(timestamp, outcome, latency, recording)
+
+    def _record(self, timestamp: float, outcome: str, latency: float, recording: bool):
+        with self._lock:
+            if recording:
+                self.outcomes[outcome] += 1
+            if outcome != '200':
+                return
+            if recording:
+                self.latencies.append(latency)
+            if self.published_timestamp is not None and self.published_timestamp >= timestamp:
+                self.stale += recording
+            else:
+                self.published_timestamp = timestamp
+
+    # StreamExtractor가 FrameProcessor 대신 호출하는 method들
+
+    def _take_frame(self, timeout=None) -> Optional[StreamFrame]:
+        latest = self._take()
+        return None if latest is None else StreamFrame(*latest)
+
+    def _publish(self, timestamp: float, keypoints, rtt: float, server_time=None, roi=None, trace=None):
+        self._done('200', rtt, server_time)
+        self._record(timestamp, '200', rtt, self.recording)
+
+    def _discard(self, shed=False):
+        # 연결 실패와 응답 timeout을 구분할 수 없음
+        outcome = '410' if shed else 'dropped'
+        self._done(outcome, 0.0, None)
+        self._record(0.0, outcome, 0.0, self.recording)
+
+    def sample_freshness(self, now: float):
+        published = self.published_timestamp
+        if published is not None and self.recording:
+            self.freshness.append(now - published)
+
+
+def percentiles(values, qs=(50, 95, 99)) -> List[float]:
+    return [float(v) for v in np.percentile(values, qs)] if len(values) else [float('nan')] * len(qs)
+
+
+def run(url: str, stations: int, workers: int, fps: float, duration: float, warmup: float, timeout: float,
+        frames_for, measuring=0, **options) -> dict:
+    """처음 `measuring`개의 station은 측정 중(Mode.Measuring)으로 보냄. options는 Station의 인자.
+    `url`은 /workers를 물어볼 HTTP 주소로도 씀"""
+    group = [Station(i, url, frames_for(i), fps, workers, timeout, 'Measuring' if i < measuring else 'Idle',
+                     **options) for i in range(stations)]
+    for station in group:
+        station.start()
+    sleep(warmup)
+    before = server_stats(url)
+    for station in group:
+        station.recording = True
+    start = perf_counter()
+    # 20 Hz로 각 station 화면의 keypoints 나이를 기록
+    while perf_counter() - start < duration:
+        now = time()
+        for station in group:
+            station.sample_freshness(now)
+        sleep(0.05)
+    elapsed = perf_counter() - start
+    for station in group:
+        station.recording = False
+    after = server_stats(url)
+    for station in group:
+        station.stop()
+
+    latencies = [latency for station in group for latency in station.latencies]
+    outcomes = sum((station.outcomes for station in group), Counter())
+    requests_sent = sum(outcomes.values())
+    p50, p95, p99 = percentiles(latencies)
+    result = {
+        'transport': 'http' if options.get('stream_url') is None else 'stream',
+        'stations': stations, 'workers': workers, 'fps': fps, 'duration': elapsed,
+        'requests': requests_sent,
+        'throughput': outcomes['200'] / elapsed,
+        'latency': {'p50': p50, 'p95': p95, 'p99': p99},
+        'error_rate': (requests_sent - outcomes['200'] - outcomes['410'] - outcomes['timeout']) / max(requests_sent, 1),
+        'timeout_rate': outcomes['timeout'] / max(requests_sent, 1),
+        'stale_rate': outcomes['410'] / max(requests_sent, 1),
+        'outcomes': dict(outcomes),
+        'per_station': [],
+    }
+    if before is not None and after is not None:
+        result['server'] = {
+            'jobs_done': sum(after['jobs_done']) - sum(before['jobs_done']),
+            'shed': {k: v - before['shed'][k] for k, v in after['shed'].items()},
+            'wasted': {k: v - before['wasted'][k] for k, v in after['wasted'].items()},
+            'wasted_seconds': after['wasted_seconds'] - before['wasted_seconds'],
+        }
+    for station in group:
+        f50, f95, _ = percentiles(station.freshness)
+        l50, _, l99 = percentiles(station.latencies)
+        result['per_station'].append({
+            'station': station.index,
+            'mode': station.mode,
+            'throughput': len(station.latencies) / elapsed,
+            'latency': {'p50': l50, 'p99': l99},
+            'freshness': {'p50': f50, 'p95': f95},
+            'superseded': station.superseded / max(station.captured, 1),
+            'sampled_out': station.sampled_out / max(station.captured, 1),
+            'stale': station.stale,
+            'outcomes': dict(station.outcomes),
+        })
+    return result
+
+
+def print_result(result: dict, per_station: bool):
+    latency = result['latency']
+    others = ' '.join(f'{k}:{v}' for k, v in sorted(result['outcomes'].items()) if k != '200')
+    print(f'{result["transport"]:6s} {result["stations"]:3d} stations x {result["workers"]} workers @ {result["fps"]:g} fps:'
+          f' {result["throughput"]:7.1f} req/s  p50 {latency["p50"] * 1e3:6.1f} ms  p95 {latency["p95"] * 1e3:6.1f} ms'
+          f'  p99 {latency["p99"] * 1e3:6.1f} ms  errors {result["error_rate"]:5.1%}'
+          f'  timeouts {result["timeout_rate"]:5.1%}  stale {result["stale_rate"]:5.1%}  {others}')
+    server = result.get('server')
+    if server is not None:
+        wasted = sum(server['wasted'].values())
+        print(f'    server: {server["jobs_done"]} jobs, shed {sum(server["shed"].values())}'
+              f' ({" ".join(f"{k}:{v}" for k, v in server["shed"].items() if v)}), wasted inference {wasted}'
+              f' ({" ".join(f"{k}:{v}" for k, v in server["wasted"].items() if v)}, {server["wasted_seconds"]:.1f} s)')
+    freshness = [s['freshness']['p50'] for s in result['per_station']]
+    print(f'    keypoints age p50 over stations: best {min(freshness) * 1e3:.0f} ms,'
+          f' worst {max(freshness) * 1e3:.0f} ms')
+    if per_station:
+        for s in result['per_station']:
+            print(f'    station {s["station"]:2d} {s["mode"]:9s}: {s["throughput"]:6.1f} req/s  p50 {s["latency"]["p50"] * 1e3:6.1f} ms'
+                  f'  p99 {s["latency"]["p99"] * 1e3:6.1f} ms  age p50 {s["freshness"]["p50"] * 1e3:6.0f} ms'
+                  f' p95 {s["freshness"]["p95"] * 1e3:6.0f} ms  superseded {s["superseded"]:4.0%}'
+                  f'  sampled out {s["sampled_out"]:4.0%}  stale {s["stale"]}')
+
+
+def server_stats(url: str) -> Optional[dict]:
+    """서버의 GET /workers. shed/wasted를 세지 않는 이전 서버나 다른 endpoint면 None"""
+    try:
+        stats = requests.get(url.rsplit('/', 1)[0] + '/workers', timeout=2).json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    return stats if 'wasted' in stats else None
+
+
+def serve(port: int, config_path: str, stream_port: Optional[int] = None):
+    """main_http를 synthetic backend로 띄움 (별도 process). stream_port가 있으면 같은 pool로 stream_server도 띄움"""
+    import logging
+    import signal
+    from werkzeug.serving import make_server
+
+    os.environ['BBM_CONFIG'] = config_path
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    import main_http
+    # terminate() 때 inference worker도 정리
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if stream_port is not None:
+        from stream_server import StreamServer
+        stream = StreamServer(('127.0.0.1', stream_port), main_http.submit)
+        Thread(target=stream.serve_forever, name='stream_server', daemon=True).start()
+    try:
+        make_server('127.0.0.1', port, main_http.app, threaded=True).serve_forever()
+    finally:
+        if main_http._pool is not None:
+            main_http._pool.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, frame: bytes, timeout=60.0):
+    """inference worker가 model을 올릴 때까지 요청을 반복"""
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        try:
+            if requests.post(url, files={'frame': frame}, timeout=5).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        sleep(0.2)
+    raise RuntimeError(f'{url} did not become ready')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--url', help='/skeleton URL. 없으면 --serve')
+    parser.add_argument('--stream-url', help='--transport stream일 때 stream_server 주소 (tcp://host:port)')
+    parser.add_argument('--transport', nargs='+', choices=['http', 'stream'], default=['http'],
+                        help='여러 개면 station 수마다 차례로 측정')
+    parser.add_argument('--serve', action='store_true', help='synthetic backend로 main_http를 띄워서 측정')
+    parser.add_argument('--stations', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--workers', type=int, default=4, help='station별 동시 요청 수 (config.json의 workers)')
+    parser.add_argument('--measuring', type=int, default=0, help='측정 중으로 보낼 station 수')
+    parser.add_argument('--no-deadline', action='store_true', help='X-Frame-Time/X-Budget-Ms를 보내지 않음')
+    parser.add_argument('--fixed', action='store_true', help='AdaptiveDispatcher 없이 항상 workers개를 동시에 보냄')
+    parser.add_argument('--target-age', type=float, default=0.15, help='AdaptiveDispatcher의 target_age')
+    parser.add_argument('--fps', type=float, default=24)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--timeout', type=float, default=1, help='요청 timeout (Pi의 reqeust_timeout)')
+    parser.add_argument('--fixture', help='JPEG directory 또는 MJPEG stream. 없으면 합성 frame')
+    parser.add_argument('--resolution', default='1280x720', help='합성 frame 크기')
+    parser.add_argument('--quality', type=int, default=85, help='합성 frame JPEG 품질')
+    parser.add_argument('--per-station', action='store_true')
+    parser.add_argument('--json', help='결과를 저장할 경로')
+    # --serve 설정
+    parser.add_argument('--backend-latency', type=float, default=0.03, help='synthetic inference CPU 시간(초)')
+    parser.add_argument('--server-workers', type=int, default=2)
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--no-latest-wins', action='store_true', help='station의 대기 중인 이전 frame을 버리지 않음')
+    parser.add_argument('--dispatch-depth', type=int, help='worker에게 넘겨 둘 최대 job 수 (기본 workers * max_batch)')
+    args = parser.parse_args()
+    if not args.url and not args.serve:
+        parser.error('--url or --serve is required')
+    if 'stream' in args.transport and not args.stream_url and not args.serve:
+        parser.error('--transport stream requires --stream-url or --serve')
+
+    if args.fixture:
+        fixture = load_fixture(args.fixture)
+        # 같은 녹화를 쓰더라도 station마다 다른 위치부터 재생
+        frames_for = lambda i: fixture[i * 7 % len(fixture):] + fixture[:i * 7 % len(fixture)]  # noqa: E731
+    else:
+        width, height = map(int, args.resolution.split('x'))
+        frames_for = lambda i: synthetic_frames(i, 24, width, height, args.quality)  # noqa: E731
+    sample = frames_for(0)
+    print(f'frames: {np.mean([len(f) for f in sample]) / 1024:.0f} KiB average')
+
+    server = None
+    url = args.url
+    stream_url = args.stream_url
+    if args.serve:
+        config = {
+            'backend': {'type': 'synthetic', 'latency': args.backend_latency},
+            'inference': {'workers': args.server_workers, 'max_queue': 64, 'request_timeout': 2.0,
+                          'max_batch': args.max_batch, 'max_window': 0.01},
+            'result_cache': {'max_entries': 256, 'ttl': 1.0, 'perceptual': False, 'max_distance': 4},
+            'scheduling': {'dispatch_depth': args.dispatch_depth, 'station_quota': args.workers * 2, 'default_weight': 1,
+                           'weights': {'Measuring': 4}, 'latest_wins': not args.no_latest_wins},
+        }
+        config_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        json.dump(config, config_file)
+        config_file.close()
+        port = free_port()
+        stream_port = free_port() if 'stream' in args.transport else None
+        # inference worker를 띄워야 하므로 daemon이 아님
+        server = Process(target=serve, args=(port, config_file.name, stream_port))
+        server.start()
+        url = f'http://127.0.0.1:{port}/skeleton'
+        if stream_port is not None:
+            stream_url = f'tcp://127.0.0.1:{stream_port}'
+        print(f'serving synthetic backend ({args.backend_latency * 1e3:.0f} ms, {args.server_workers} workers,'
+              f' max_batch {args.max_batch}) on {url}')
+
+    try:
+        wait_ready(url, sample[0])
+        results = []
+        for stations in args.stations:
+            for transport in args.transport:
+                result = run(url, stations, args.workers, args.fps, args.duration, args.warmup, args.timeout,
+                             frames_for, args.measuring, deadline=not args.no_deadline, adaptive=not args.fixed,
+                             target_age=args.target_age, stream_url=stream_url if transport == 'stream' else None)
+                print_result(result, args.per_station)
+                results.append(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+            os.unlink(config_file.name)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
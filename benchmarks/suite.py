@@ -0,0 +1,384 @@
+"""Pi에서 frame마다 실행되는 hot path 벤치마크 모음.
+
+카메라, 서버, OpenPose 없이 합성 keypoints와 MJPEG fixture로 실행하며 720p/1080p, 1~10명에 대해
+호출당 시간(중앙값, p95)과 호출당 Python/numpy 할당량(tracemalloc, OpenCV 내부 할당은 제외)을 보고.
+결과를 JSON으로 저장해 두면 다른 commit의 결과와 비교할 수 있음.
+
+    python benchmarks/suite.py                                  # 전체
+    python benchmarks/suite.py -k render --sizes 1080p          # 이름에 render가 들어간 case만
+    python benchmarks/suite.py --save                           # benchmarks/results/<commit>.json
+    python benchmarks/suite.py --compare benchmarks/results/abc1234.json
+    python benchmarks/suite.py --mjpeg rec.mjpeg                # picamera로 녹화한 stream으로 write 측정
+"""
+from argparse import ArgumentParser
+from collections import namedtuple
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+from time import perf_counter
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import cv2 as cv
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RPI_DIR = os.path.join(ROOT_DIR, 'rpi')
+sys.path.insert(0, RPI_DIR)
+from frames import SOI  # noqa: E402
+from helper import Alignment, fill_alpha_channel, put_text  # noqa: E402
+from measurer import BodyBalanceMeasurer, Keypoint, Mode  # noqa: E402
+import pose  # noqa: E402
+from processors import FrameProcessor, KeypointsSnapshot  # noqa: E402
+
+SIZES = {'720p': (1280, 720), '1080p': (1920, 1080)}
+PEOPLE = (1, 2, 5, 10)
+FIXTURE_DIR = os.path.join(BENCH_DIR, 'fixtures')
+RESULT_DIR = os.path.join(BENCH_DIR, 'results')
+
+
+# 합성 입력
+
+def synthetic_people(people: int, width: int, height: int, seed=0) -> np.ndarray:
+    """화면에 흩어져 선 사람들 (people, 25, 3). 관절 몇 개는 confidence가 낮아 그려지지 않음"""
+    rng = np.random.default_rng(seed)
+    keypoints = np.zeros((people, 25, 3), np.float32)
+    # 사람이 많을수록 작게
+    scale = height * 0.8 / max(1.0, math.sqrt(people))
+    for i, person in enumerate(keypoints):
+        cx = (i + 0.5) / people * width if people > 1 else width / 2
+        cy = height / 2 + rng.uniform(-0.1, 0.1) * height
+        person[:, 0] = cx + rng.uniform(-0.15, 0.15, 25) * scale
+        person[:, 1] = cy + np.linspace(-0.45, 0.45, 25) * scale
+        person[:, 2] = rng.uniform(0.3, 1.0, 25)
+        person[rng.choice(25, 3, replace=False), 2] = 0.0
+    return keypoints
+
+
+def jittered(keypoints: np.ndarray, count: int, sigma=1.5, seed=0) -> List[np.ndarray]:
+    """frame마다 조금씩 흔들리는 keypoints 흐름"""
+    rng = np.random.default_rng(seed)
+    sequence = []
+    for _ in range(count):
+        moved = keypoints.copy()
+        moved[..., :2] += rng.normal(0, sigma, moved[..., :2].shape).astype(np.float32)
+        sequence.append(moved)
+    return sequence
+
+
+def balance_pose(width: int, height: int) -> np.ndarray:
+    """measurer가 측정을 시작할 수 있는 한 발 서기 자세 (1, 25, 3)"""
+    keypoints = synthetic_people(1, width, height)
+    keypoints[0, :, 2] = 0.9
+    keypoints[0, Keypoint.Nose, 1] = height * 0.15
+    keypoints[0, Keypoint.RAnkle, 1] = height * 0.9
+    keypoints[0, Keypoint.LAnkle, 1] = height * 0.75
+    return keypoints
+
+
+def mjpeg_fixture(width: int, height: int, frames=48) -> str:
+    """사람 모양이 움직이는 MJPEG stream. 처음 한 번 만들어 fixtures/에 둠"""
+    path = os.path.join(FIXTURE_DIR, f'synthetic_{width}x{height}.mjpeg')
+    if os.path.exists(path):
+        return path
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    rng = np.random.default_rng(0)
+    background = cv.resize(rng.integers(0, 255, (height // 16, width // 16, 3), np.uint8), (width, height),
+                           interpolation=cv.INTER_LINEAR)
+    keypoints = synthetic_people(1, width, height)
+    with open(path + '.tmp', 'wb') as f:
+        for i in range(frames):
+            image = background.copy()
+            moved = keypoints.copy()
+            moved[..., 0] += (i - frames / 2) * width / frames / 4
+            pose.render_keypoints(image, moved)
+            f.write(cv.imencode('.jpg', image, [cv.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def split_jpegs(stream: bytes) -> List[bytes]:
+    """SOI 위치로 stream을 frame 단위로 나눔. picamera는 frame 하나를 write 한 번으로 넘김"""
+    starts = [m.start() for m in re.finditer(re.escape(SOI), stream)]
+    frames = [stream[a:b] for a, b in zip(starts, starts[1:] + [len(stream)])]
+    # JPEG 내부의 SOI와 같은 byte열(썸네일 등)로 잘린 조각은 앞 frame에 붙임
+    merged = []
+    for frame in frames:
+        if merged and len(frame) < 1024:
+            merged[-1] += frame
+        else:
+            merged.append(frame)
+    return merged
+
+
+# 측정
+
+class Case(NamedTuple):
+    name: str
+    params: Dict
+    # 호출할 때마다 다음 입력을 처리하는 함수
+    call: Callable[[], object]
+    teardown: Optional[Callable[[], None]] = None
+
+
+class Measurement(NamedTuple):
+    name: str
+    params: Dict
+    calls: int
+    median: float
+    p95: float
+    mean: float
+    # 호출 중 최대로 늘어난 메모리(byte)의 중앙값, 호출 후에도 남은 메모리(byte)의 평균
+    peak_bytes: float
+    retained_bytes: float
+
+    @property
+    def key(self) -> str:
+        return self.name + ''.join(f' {k}={v}' for k, v in sorted(self.params.items()))
+
+
+def measure(case: Case, min_time=0.5, min_calls=50, max_calls=20000, alloc_calls=30) -> Measurement:
+    call = case.call
+    # warm-up (cache, lazy 초기화)
+    for _ in range(5):
+        call()
+    times = []
+    started = perf_counter()
+    while len(times) < max_calls and (len(times) < min_calls or perf_counter() - started < min_time):
+        start = perf_counter()
+        call()
+        times.append(perf_counter() - start)
+
+    # tracemalloc은 호출을 몇 배 느리게 만들므로 시간 측정과 따로 실행
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    if case.teardown is not None:
+        case.teardown()
+    times = np.array(times)
+    return Measurement(case.name, case.params, len(times), float(np.median(times)), float(np.percentile(times, 95)),
+                       float(times.mean()), float(np.median(peaks)), float(np.mean(retained)))
+
+
+# case
+
+def render_cases(size_name: str, people: int) -> List[Case]:
+    width, height = SIZES[size_name]
+    sequence = jittered(synthetic_people(people, width, height), 64)
+    params = {'size': size_name, 'people': people}
+    cases = []
+
+    # MainController._update_keypoints_overlay: 지난번 영역을 지우고 BGRA overlay에 다시 그림
+    overlay = np.zeros((height, width, 4), np.uint8)
+    state = {'i': 0, 'drawn': None}
+
+    def render_overlay():
+        i = state['i'] = (state['i'] + 1) % len(sequence)
+        if state['drawn'] is not None:
+            x, y, w, h = state['drawn']
+            overlay[y:y + h, x:x + w] = 0
+        state['drawn'] = pose.render_keypoints(overlay, sequence[i])
+
+    cases.append(Case('render_keypoints_overlay', params, render_overlay))
+
+    # 카메라 frame(BGR) 위에 그리기 (main_http_client, main_v2)
+    frame = np.zeros((height, width, 3), np.uint8)
+    counter = iter(range(1 << 62))
+    cases.append(Case('render_keypoints_bgr', params,
+                      lambda: pose.render_keypoints(frame, sequence[next(counter) % len(sequence)])))
+
+    rect_counter = iter(range(1 << 62))
+    cases.append(Case('get_keypoints_rectangle', params,
+                      lambda: [pose.get_keypoints_rectangle(person, 0.05)
+                               for person in sequence[next(rect_counter) % len(sequence)]]))
+    return cases
+
+
+def image_cases(size_name: str) -> List[Case]:
+    width, height = SIZES[size_name]
+    params = {'size': size_name}
+    # text와 skeleton이 그려졌지만 alpha는 아직 채우지 않은 BGRA layer
+    drawing = np.zeros((height, width, 3), np.uint8)
+    pose.render_keypoints(drawing, synthetic_people(2, width, height))
+    put_text(drawing, 'Measuring', (30, 30), (0, 255, 0))
+    layer = cv.cvtColor(drawing, cv.COLOR_BGR2BGRA)
+    layer[..., 3] = 0
+
+    text_layer = np.zeros((height, width, 3), np.uint8)
+    texts = [f'{t / 10:.1f} s / id: 1234' for t in range(250)]
+    counter = iter(range(1 << 62))
+    return [
+        Case('fill_alpha_channel', params, lambda: fill_alpha_channel(layer)),
+        Case('put_text', params, lambda: put_text(text_layer, texts[next(counter) % len(texts)],
+                                                  (30, height - 30), (255, 255, 255))),
+        Case('put_text_score_popup', params, lambda: put_text(text_layer, 'SCORE: 100', (width // 2, height // 2),
+                                                              (0, 0, 255), Alignment.CENTER, 5, 8, cv.LINE_AA)),
+    ]
+
+
+def write_case(size_name: str, mjpeg: Optional[str]) -> Case:
+    width, height = SIZES[size_name]
+    path = mjpeg or mjpeg_fixture(width, height)
+    with open(path, 'rb') as f:
+        jpegs = split_jpegs(f.read())
+    # extractor 없이 조립과 샘플링만. 보낼 곳이 없으므로 최신 frame만 남기고 계속 교체됨
+    processor = FrameProcessor('http://127.0.0.1:9/skeleton', workers=0, frame_capacity=width * height)
+    counter = iter(range(1 << 62))
+    params = {'size': size_name, 'source': 'recorded' if mjpeg else 'synthetic'}
+    return Case('frame_processor_write', params, lambda: processor.write(jpegs[next(counter) % len(jpegs)]),
+                processor.flush)
+
+
+class StubProcessor:
+    """BodyBalanceMeasurer가 쓰는 FrameProcessor의 부분"""
+
+    def __init__(self):
+        self.snapshot = KeypointsSnapshot(0.0, None, 0)
+
+    def add_keypoints_listener(self, listener):
+        pass
+
+    def set_mode(self, mode):
+        pass
+
+    def publish(self, timestamp: float, keypoints: np.ndarray):
+        self.snapshot = KeypointsSnapshot(timestamp, keypoints, self.snapshot.sequence + 1, timestamp)
+
+
+def measurer_cases(size_name: str, config) -> List[Case]:
+    width, height = SIZES[size_name]
+    config = config._replace(picamera=config.picamera._replace(
+        resolution=config.picamera.resolution._replace(width=width, height=height)))
+    sequence = jittered(balance_pose(width, height), 240, sigma=0.5)
+    cases = []
+    for state in (Mode.Idle, Mode.Measuring):
+        processor = StubProcessor()
+        clock = {'now': 0.0}
+        measurer = BodyBalanceMeasurer(processor, config, clock=lambda: clock['now'])
+        # tick은 직접 호출하므로 measurer thread는 멈춤
+        measurer.close()
+        processor.publish(0.0, sequence[0])
+        measurer._tick()
+        if state == Mode.Measuring:
+            measurer.start_measuring('1234')
+            # 벤치마크 중에 측정이 끝나지 않도록. 흔들림(0.5 px)은 deviation_threshold보다 훨씬 작음
+            measurer.normal_sec = 1e9
+        counter = iter(range(1 << 62))
+
+        def tick(processor=processor, measurer=measurer, clock=clock, counter=counter):
+            i = next(counter)
+            # 30 fps로 keypoints가 발행되는 상황
+            clock['now'] = i / 30
+            processor.publish(clock['now'], sequence[i % len(sequence)])
+            measurer._tick()
+
+        cases.append(Case('measurer_tick', {'size': size_name, 'state': state.name}, tick))
+    return cases
+
+
+def build_cases(sizes: List[str], people: List[int], mjpeg: Optional[str]) -> List[Case]:
+    with open(os.path.join(RPI_DIR, 'config.json')) as f:
+        config = json.load(f, object_hook=lambda d: namedtuple('Config', d.keys())(*d.values()))
+    cases = []
+    for size_name in sizes:
+        for count in people:
+            cases.extend(render_cases(size_name, count))
+        cases.extend(image_cases(size_name))
+        cases.append(write_case(size_name, mjpeg))
+        cases.extend(measurer_cases(size_name, config))
+    return cases
+
+
+# 결과 저장과 비교
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def environment() -> dict:
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def load_baseline(path: str) -> Dict[str, dict]:
+    with open(path) as f:
+        saved = json.load(f)
+    return {Measurement(**result).key: result for result in saved['results']}
+
+
+def report(measurements: List[Measurement], baseline: Optional[Dict[str, dict]]):
+    header = f'{"case":<58} {"median":>10} {"p95":>10} {"calls/s":>9} {"alloc":>9}'
+    if baseline is not None:
+        header += f' {"vs base":>8}'
+    print(header)
+    for m in measurements:
+        line = (f'{m.key:<58} {m.median * 1e6:8.1f}us {m.p95 * 1e6:8.1f}us {1 / m.mean:9.0f}'
+                f' {m.peak_bytes / 1024:7.1f}KB')
+        if baseline is not None:
+            base = baseline.get(m.key)
+            line += f' {m.median / base["median"]:7.2f}x' if base else f' {"new":>8}'
+        print(line)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-k', dest='pattern', help='이름(과 parameter)에 이 정규식이 들어간 case만')
+    parser.add_argument('--sizes', nargs='+', default=list(SIZES), choices=list(SIZES))
+    parser.add_argument('--people', type=int, nargs='+', default=list(PEOPLE))
+    parser.add_argument('--mjpeg', help='picamera로 녹화한 MJPEG stream (없으면 합성 fixture)')
+    parser.add_argument('--min-time', type=float, default=0.5, help='case별 최소 측정 시간(초)')
+    parser.add_argument('--save', nargs='?', const='', help='결과 JSON 경로. 생략하면 results/<commit>.json')
+    parser.add_argument('--compare', help='비교할 이전 결과 JSON')
+    args = parser.parse_args()
+
+    cases = build_cases(args.sizes, args.people, args.mjpeg)
+    if args.pattern:
+        pattern = re.compile(args.pattern)
+        skipped = [case for case in cases if not pattern.search(case.name + str(case.params))]
+        for case in skipped:
+            if case.teardown is not None:
+                case.teardown()
+        cases = [case for case in cases if pattern.search(case.name + str(case.params))]
+    baseline = load_baseline(args.compare) if args.compare else None
+
+    env = environment()
+    print(f'commit {env["commit"]}, python {env["python"]}, numpy {env["numpy"]}, opencv {env["opencv"]},'
+          f' {env["cpus"]} CPUs')
+    measurements = [measure(case, args.min_time) for case in cases]
+    report(measurements, baseline)
+
+    if args.save is not None:
+        path = args.save or os.path.join(RESULT_DIR, f'{env["commit"]}.json')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'environment': env, 'results': [m._asdict() for m in measurements]}, f, indent=1)
+        print(f'saved {path}')
+
+
+if __name__ == '__main__':
+    main()
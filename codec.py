@@ -0,0 +1,78 @@
+import struct
+from typing import Optional
+
+import numpy as np
+
+JSON = 'application/json'
+FLOAT32 = 'application/x-keypoints-f32'
+INT16 = 'application/x-keypoints-i16'
+FORMATS = {'json': JSON, 'f32': FLOAT32, 'i16': INT16}
+
+# magic, version, dtype, 사람 수, 관절 수, 좌표 배율(i16만), padding.
+# payload가 np.frombuffer로 바로 읽히도록 16 bytes로 맞춤
+HEADER = struct.Struct('<2sBBHHf4x')
+MAGIC = b'KP'
+VERSION = 1
+DTYPE_FLOAT32 = 0
+DTYPE_INT16 = 1
+NUMBER_PARTS = 25
+# 1/16 pixel 정밀도로도 int16에 1920 px 폭 frame까지 담김
+MAX_INT16_SCALE = 16.0
+
+
+def accept_header(fmt: str) -> str:
+    """`fmt`을 우선하되 binary를 모르는 서버에서는 JSON을 받는 Accept header"""
+    mimetype = FORMATS[fmt]
+    if mimetype == JSON:
+        return JSON
+    return f'{mimetype}, {JSON};q=0.5'
+
+
+def is_binary(content_type: str) -> bool:
+    return content_type.split(';')[0].strip() in (FLOAT32, INT16)
+
+
+def encode(keypoints: Optional[np.ndarray], mimetype: str) -> bytes:
+    if keypoints is None or not keypoints.shape:
+        people, parts = 0, NUMBER_PARTS
+        keypoints = np.zeros((0, parts, 3), np.float32)
+    else:
+        people, parts = keypoints.shape[:2]
+
+    if mimetype == FLOAT32:
+        header = HEADER.pack(MAGIC, VERSION, DTYPE_FLOAT32, people, parts, 1.0)
+        return header + np.ascontiguousarray(keypoints, '<f4').tobytes()
+
+    if mimetype == INT16:
+        max_abs = float(np.abs(keypoints[..., :2]).max()) if people else 0.0
+        scale = min(MAX_INT16_SCALE, 32767 / max_abs) if max_abs > 0 else MAX_INT16_SCALE
+        coords = np.rint(keypoints[..., :2] * scale).astype('<i2')
+        confidences = np.rint(np.clip(keypoints[..., 2], 0, 1) * 255).astype(np.uint8)
+        header = HEADER.pack(MAGIC, VERSION, DTYPE_INT16, people, parts, scale)
+        return header + coords.tobytes() + confidences.tobytes()
+
+    raise ValueError(f'Unsupported keypoints format: {mimetype}')
+
+
+def decode(buf) -> Optional[np.ndarray]:
+    """binary payload를 decode. float32는 `buf`의 read-only view를 그대로 반환"""
+    magic, version, dtype, people, parts, scale = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Invalid keypoints payload')
+    if people == 0:
+        return None
+
+    offset = HEADER.size
+    if dtype == DTYPE_FLOAT32:
+        return np.frombuffer(buf, '<f4', people * parts * 3, offset).reshape(people, parts, 3)
+
+    if dtype == DTYPE_INT16:
+        count = people * parts
+        coords = np.frombuffer(buf, '<i2', count * 2, offset).reshape(people, parts, 2)
+        confidences = np.frombuffer(buf, np.uint8, count, offset + count * 4).reshape(people, parts)
+        keypoints = np.empty((people, parts, 3), np.float32)
+        np.multiply(coords, 1 / scale, out=keypoints[..., :2], casting='unsafe')
+        np.multiply(confidences, 1 / 255, out=keypoints[..., 2], casting='unsafe')
+        return keypoints
+
+    raise ValueError(f'Unsupported keypoints dtype: {dtype}')
@@ -0,0 +1,527 @@
+"""크기가 정해진 job queue 뒤의 inference worker process.
+
+worker process마다 `factory`로 자기 backend(예: OpenPose wrapper + datum)를 만들므로 동시에 들어온 요청끼리
+공유하는 것이 없음. front end(Flask / stream server thread)는 올라온 JPEG를 submit하고 Future를 기다리며,
+collector thread가 job id로 결과를 돌려줌.
+
+worker는 동적으로 batch를 만듦: 이미 대기 중인 job은 항상 같이 가져가고, batching window만큼 더 기다릴 수 있음.
+window는 worker마다 조정됨: 기다려서 job이 더 들어오면 늘리고, 아니면 절반으로 줄이며, 부하가 적으면 0이 되어
+요청 하나를 늦추지 않음.
+
+job은 이 process 안의 station별 queue(scheduling.FairQueue 참고)에서 기다리다가 worker가 가진 job이
+`dispatch_depth`개보다 적을 때만 worker queue로 넘어감. 그래서 station 간 처리 순서는 도착 순서가 아니라 여기서 정함.
+
+job에는 deadline(아무도 응답을 기다리지 않게 되는 perf_counter 시각)과 frame의 촬영 시각이 붙을 수 있음.
+dispatch할 때, worker가 꺼낼 때, decode한 뒤에 deadline이 지났으면, 그리고 `latest_wins`일 때 대기 중에
+같은 station의 더 최신 frame이 오면 추론하지 않고 `Stale`로 응답함. 추론은 했지만 아무도 쓰지 않는 결과
+(호출한 쪽이 포기했거나, deadline 뒤에 끝났거나, station이 이미 받은 결과보다 오래된 것)는 wasted로 셈.
+
+worker는 `spawn`으로 띄움: OpenPose/CUDA 상태를 fork로 물려받으면 안 되므로 `factory`는 pickle할 수 있어야 함
+(module 수준 함수나 그 functools.partial, 예: backends.create_backend). worker는 처리 중인 batch의 id를
+shared memory에 기록해 두고, 죽으면 그 job을 실패 처리하고 dispatch 자리를 돌려줌.
+"""
+from concurrent.futures import Future, TimeoutError
+from itertools import count
+import multiprocessing as mp
+import queue
+from threading import Condition, Lock, Thread
+from time import perf_counter, sleep
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from backends import Backend
+from scheduling import FairQueue, StationQueue, check_weight
+
+# dispatch한 뒤 이 시간이 지나도 돌아오지 않은 job은 잃어버린 것으로 봄
+# (예: job을 가져갔다고 기록하기 전에 죽은 worker)
+LOST_AFTER = 30.0
+# collector가 죽은 worker와 잃어버린 job을 찾는 간격
+SWEEP_INTERVAL = 0.5
+
+
+class QueueFull(Exception):
+    """대기 중인 job이 `max_queue`나 station의 quota보다 많음.
+    지연 시간을 쌓지 말고 503으로 응답해야 함"""
+
+
+class Stale(Exception):
+    """deadline이 지났거나 더 최신 frame으로 대체되어 추론하지 않은 job.
+    `reason`은 'deadline' 또는 'superseded'. client가 쓰지 않는 결과이므로 가볍게 응답하면 됨"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Result(NamedTuple):
+    # 사람이 없으면 None
+    keypoints: Optional[np.ndarray]
+    # worker에서 batch 전체의 decode + inference 시간
+    process_time: float
+    # submit부터 batch 시작까지의 시간. batching_delay 포함
+    queue_time: float
+    worker: int
+    batch_size: int = 1
+    # batching window가 닫히기를 기다린 시간
+    batching_delay: float = 0.0
+    # 이 job의 JPEG decode와 batch 전체의 backend 호출 시간 (둘 다 process_time에 포함)
+    decode_time: float = 0.0
+    inference_time: float = 0.0
+
+
+class MicroBatcher:
+    """`jobs`에서 job을 `max_size`개까지 batch로 모음 (module docstring 참고)"""
+
+    def __init__(self, jobs, max_size=8, max_window=0.01):
+        self.jobs = jobs
+        self.max_size = max_size
+        self.max_window = max_window
+        self.window = max_window / 2 if max_size > 1 else 0.0
+        self.closed = False
+
+    def next_batch(self) -> List[tuple]:
+        """[(job, worker가 꺼낸 시각)]. 정지 marker(None)를 받으면 빈 list"""
+        batch = []
+        job = self.jobs.get()
+        if job is None:
+            self.closed = True
+            return batch
+        batch.append((job, perf_counter()))
+        deadline = batch[0][1] + self.window
+        waited = backlog = False
+        while len(batch) < self.max_size:
+            try:
+                job = self.jobs.get_nowait()
+                backlog = backlog or not waited
+            except queue.Empty:
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=remaining)
+                except queue.Empty:
+                    waited = True
+                    break
+                waited = True
+            if job is None:
+                self.closed = True
+                break
+            batch.append((job, perf_counter()))
+        self._adapt(len(batch), waited, backlog)
+        return batch
+
+    def _adapt(self, size: int, waited: bool, backlog: bool):
+        if self.max_size <= 1:
+            return
+        if size >= self.max_size or (waited and size > 1):
+            # 기다린 보람이 있었음(또는 batch가 참): 다음에는 조금 더 기다림
+            self.window = min(self.max_window, max(self.window * 1.5, self.max_window / 8))
+        elif waited:
+            # 기다리는 동안 아무것도 오지 않음: 요청 하나를 늦추지 않음
+            self.window = self.window / 2 if self.window > self.max_window / 16 else 0.0
+        elif backlog and self.window == 0.0:
+            # window 없이 job이 쌓임: 다시 batch를 모음
+            self.window = self.max_window / 4
+
+
+def _resolve(future: Future, result=None, error: Optional[BaseException] = None):
+    """`_pending`에서 future를 꺼낸 쪽만 lock 밖에서 호출. 그 사이 취소된 future는 건너뜀
+    (취소된 future에 set_result를 하면 InvalidStateError로 collector/dispatcher thread가 죽음)"""
+    if not future.set_running_or_notify_cancel():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def _decode(buf) -> np.ndarray:
+    frame = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError('Failed to decode frame')
+    return frame
+
+
+def _worker_main(index: int, factory: Callable[[], Backend], jobs, results, held, max_batch: int,
+                 max_window: float):
+    backend = factory()
+    # model을 다 올렸다고 pool에 알림
+    results.put((index, None, 0.0, 0.0, 0.0))
+    batcher = MicroBatcher(jobs, max_batch, max_window)
+    while not batcher.closed:
+        batch = batcher.next_batch()
+        if not batch:
+            continue
+        # message가 아니라 shared memory: 죽은 뒤에도 읽을 수 있어야 하는데 results.put은 process와 함께
+        # 죽는 feeder thread가 보냄
+        for slot in range(len(held)):
+            held[slot] = batch[slot][0][0] if slot < len(batch) else -1
+        started = perf_counter()
+        frames, decoded, errors, decode_times, shed = [], [], {}, [0.0] * len(batch), {}
+        for i, ((job_id, buf, _, deadline), _) in enumerate(batch):
+            if deadline is not None and perf_counter() > deadline:
+                shed[i] = 'deadline_dequeue'
+                continue
+            decode_started = perf_counter()
+            try:
+                frames.append(_decode(buf))
+                decoded.append(i)
+            except Exception as e:
+                errors[i] = repr(e)
+            decode_times[i] = perf_counter() - decode_started
+        # batch가 크면 decode하는 동안 앞의 frame이 만료될 수 있음
+        now = perf_counter()
+        expired = {n for n, i in enumerate(decoded) if batch[i][0][3] is not None and now > batch[i][0][3]}
+        if expired:
+            shed.update((decoded[n], 'deadline_decode') for n in expired)
+            frames = [frame for n, frame in enumerate(frames) if n not in expired]
+            decoded = [i for n, i in enumerate(decoded) if n not in expired]
+        keypoints = [None] * len(batch)
+        inference_started = perf_counter()
+        try:
+            for i, people in zip(decoded, backend.estimate_batch(frames) if frames else []):
+                keypoints[i] = people if len(people) else None
+        except Exception as e:
+            errors.update((i, repr(e)) for i in decoded)
+        finished = perf_counter()
+        # 돌리는 platform에서 perf_counter는 system 전체 기준이므로 process끼리 비교할 수 있음
+        jobs_done = [(job_id, keypoints[i], errors.get(i), started - submitted, started - picked, decode_times[i],
+                      shed.get(i))
+                     for i, ((job_id, _, submitted, _), picked) in enumerate(batch)]
+        results.put((index, jobs_done, finished - started, batcher.window, finished - inference_started))
+
+
+class InferencePool:
+    def __init__(self, factory: Callable[[], Backend], workers=2, max_queue=16, max_batch=1, max_window=0.01,
+                 dispatch_depth: Optional[int] = None, station_quota: Optional[int] = None, latest_wins=False):
+        self.factory = factory
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.max_window = max_window
+        # 모든 worker가 batch를 꽉 채워 가져갈 수 있을 만큼
+        self.dispatch_depth = dispatch_depth or workers * max_batch
+        # station 하나가 대기 중이거나 처리 중일 수 있는 job 수
+        self.station_quota = station_quota
+        # station의 더 최신 frame이 오면 아직 대기 중인 그 station의 frame을 대체
+        self.latest_wins = latest_wins
+        self._context = mp.get_context('spawn')
+        # worker가 빌 때까지 job이 여기서 기다림
+        self._jobs = self._context.Queue()
+        self._results = self._context.Queue()
+        self._lock = Lock()
+        self._ids = count()
+        self._pending = {}  # type: Dict[int, Future]
+        self._fair = FairQueue()
+        self._dispatch = Condition(self._lock)
+        # job id -> (station, worker에 넘긴 시각, deadline, frame 시각)
+        self._dispatched = {}  # type: Dict[int, Tuple[StationQueue, float, Optional[float], Optional[float]]]
+        # worker별 현재(또는 마지막) batch의 job id. 빈 칸은 -1
+        self._held = [self._context.RawArray('q', [-1] * max_batch) for _ in range(workers)]
+        self._swept = perf_counter()
+        self._processes = []  # type: List[mp.Process]
+        self._started = perf_counter()
+        self._busy = [0.0] * workers
+        self._jobs_done = [0] * workers
+        self._ready = 0
+        self._windows = [0.0] * workers
+        # batch 크기 -> batch 수
+        self._batch_sizes = {}  # type: Dict[int, int]
+        self._batching_delay = 0.0
+        self.rejected = 0
+        self.failed = 0
+        # Stale로 응답한 job 수. 걸러낸 단계별
+        self.shed = dict.fromkeys(('superseded', 'deadline_dispatch', 'deadline_dequeue', 'deadline_decode'), 0)
+        # 추론했지만 결과를 쓰지 않은 job 수와 그 몫의 decode + inference 시간
+        self.wasted = dict.fromkeys(('abandoned', 'late', 'superseded'), 0)
+        self.wasted_seconds = 0.0
+        self._closed = False
+        for index in range(workers):
+            self._processes.append(self._spawn(index))
+        self._collector = Thread(target=self._collect, name='inference_collector', daemon=True)
+        self._collector.start()
+        self._dispatcher = Thread(target=self._dispatch_loop, name='inference_dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def _spawn(self, index: int) -> mp.Process:
+        process = self._context.Process(target=_worker_main, name=f'inference-{index}',
+                                        args=(index, self.factory, self._jobs, self._results, self._held[index],
+                                              self.max_batch, self.max_window), daemon=True)
+        process.start()
+        return process
+
+    def submit(self, buf, station='', weight=1.0, info: Optional[Dict[str, str]] = None,
+               deadline: Optional[float] = None, frame_time: Optional[float] = None) -> Future:
+        """JPEG를 `station`의 queue에 넣음. weight가 1인 station보다 `weight`배 자주 처리됨.
+        `deadline`은 perf_counter 시각, `frame_time`은 station 시계로 잰 촬영 시각.
+        반환한 Future는 Result나 Stale로 끝남. queue나 station의 quota가 차면 QueueFull, weight가 0 이하면 ValueError"""
+        check_weight(weight)
+        future = Future()
+        superseded = []
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('InferencePool is closed')
+            queue = self._fair.station(station)
+            queue.weight = weight
+            if info:
+                queue.info.update(info)
+            if len(self._pending) >= self.max_queue + self.workers:
+                self.rejected += 1
+                queue.rejected += 1
+                raise QueueFull(f'{len(self._pending)} jobs pending')
+            if self.station_quota is not None and queue.outstanding >= self.station_quota:
+                self.rejected += 1
+                queue.rejected += 1
+                raise QueueFull(f'{queue.outstanding} jobs pending for station {station!r}')
+            if self.latest_wins and frame_time is not None:
+                if frame_time <= queue.latest_dispatched:
+                    # 같은 station의 더 최신 frame을 이미 넘긴 뒤에 도착함
+                    self._shed_job(queue, 'superseded')
+                    future.set_exception(Stale('superseded'))
+                    return future
+                for job in self._fair.drop(queue, lambda job: job[5] is not None and job[5] < frame_time):
+                    superseded.append(self._pending.pop(job[0], None))
+                    self._shed_job(queue, 'superseded')
+            job_id = next(self._ids)
+            self._pending[job_id] = future
+            self._fair.push(queue, (job_id, bytes(buf), perf_counter(), future, deadline, frame_time))
+            self._dispatch.notify()
+        for pending in superseded:
+            if pending is not None:
+                _resolve(pending, error=Stale('superseded'))
+        return future
+
+    def estimate(self, buf, timeout=None, station='', weight=1.0, info: Optional[Dict[str, str]] = None,
+                 deadline: Optional[float] = None, frame_time: Optional[float] = None) -> Result:
+        """기다리는 submit. QueueFull, Stale, concurrent.futures.TimeoutError 또는 worker의 오류를 raise"""
+        future = self.submit(buf, station, weight, info, deadline, frame_time)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            self.abandon(future)
+            raise
+
+    def abandon(self, future: Future):
+        """`future`를 더 기다리지 않아 `max_queue`에 세지 않게 함.
+        station queue에 있는 job은 건너뛰고, 이미 dispatch한 job은 worker가 돌릴 수 있지만 결과는 버림.
+        collector 등이 이미 꺼낸 future는 그쪽에서 완료하므로 취소하지 않음"""
+        with self._lock:
+            for job_id, pending in self._pending.items():
+                if pending is future:
+                    del self._pending[job_id]
+                    break
+            else:
+                return
+        future.cancel()
+
+    def wait_ready(self, timeout=None) -> bool:
+        """모든 worker가 backend를 만들 때까지(model 올리기) 기다림"""
+        deadline = None if timeout is None else perf_counter() + timeout
+        while self._ready < self.workers:
+            if deadline is not None and perf_counter() > deadline:
+                return False
+            sleep(0.05)
+        return True
+
+    def _dispatch_loop(self):
+        """station queue의 job을 DRR 순서로 worker에 넘김. worker가 가진 job은 최대 `dispatch_depth`개"""
+        while True:
+            with self._dispatch:
+                self._dispatch.wait_for(
+                    lambda: self._closed or (len(self._fair) and len(self._dispatched) < self.dispatch_depth))
+                if self._closed:
+                    return
+                queue, (job_id, buf, submitted, future, deadline, frame_time) = self._fair.pop()
+                if job_id not in self._pending:
+                    # station queue에서 기다리는 동안 포기됨
+                    continue
+                now = perf_counter()
+                stale = None
+                if deadline is not None and now > deadline:
+                    stale, reason = 'deadline', 'deadline_dispatch'
+                elif self.latest_wins and frame_time is not None and frame_time <= queue.latest_dispatched:
+                    stale = reason = 'superseded'
+                if stale is not None:
+                    future = self._pending.pop(job_id)
+                    self._shed_job(queue, reason)
+                else:
+                    queue.in_flight += 1
+                    if frame_time is not None:
+                        queue.latest_dispatched = max(queue.latest_dispatched, frame_time)
+                    self._dispatched[job_id] = queue, now, deadline, frame_time
+            if stale is not None:
+                _resolve(future, error=Stale(stale))
+                continue
+            self._jobs.put((job_id, buf, submitted, deadline))
+
+    def _shed_job(self, queue: StationQueue, reason: str):
+        self.shed[reason] += 1
+        queue.shed += 1
+
+    def _collect(self):
+        while True:
+            try:
+                message = self._results.get(timeout=SWEEP_INTERVAL)
+            except queue.Empty:
+                message = None
+                if self._closed:
+                    return
+            if perf_counter() - self._swept >= SWEEP_INTERVAL:
+                # 다른 worker의 결과가 계속 오는 부하 상황에서도 확인
+                self._respawn_dead()
+                self._swept = perf_counter()
+            if message is None:
+                continue
+            index, jobs_done, process_time, window, inference_time = message
+            if jobs_done is None:
+                with self._lock:
+                    self._ready += 1
+                continue
+            size = len(jobs_done)
+            with self._lock:
+                self._busy[index] += process_time
+                self._jobs_done[index] += size
+                self._windows[index] = window
+                self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+                now = perf_counter()
+                inferred = sum(1 for job in jobs_done if job[6] is None and job[2] is None)
+                futures, stale = [], []
+                for job_id, keypoints, error, queue_time, batching_delay, decode_time, shed in jobs_done:
+                    station, _, deadline, frame_time = self._dispatched.pop(job_id, (None, 0.0, None, None))
+                    if station is not None:
+                        station.done(queue_time)
+                    self._batching_delay += batching_delay
+                    future = self._pending.pop(job_id, None)
+                    futures.append(future)
+                    if error is not None:
+                        self.failed += 1
+                        stale.append(None)
+                        continue
+                    if shed is not None:
+                        if station is not None:
+                            self._shed_job(station, shed)
+                        stale.append('deadline')
+                        continue
+                    late = deadline is not None and now > deadline
+                    stale.append('deadline' if late else None)
+                    if future is None:
+                        waste = 'abandoned'
+                    elif late:
+                        waste = 'late'
+                    elif station is not None and frame_time is not None and frame_time < station.latest_answered:
+                        # station이 이미 더 최신 결과를 받았으므로 이 결과는 버림
+                        waste = 'superseded'
+                    else:
+                        waste = None
+                    if station is not None and frame_time is not None:
+                        station.latest_answered = max(station.latest_answered, frame_time)
+                    if waste is not None:
+                        self.wasted[waste] += 1
+                        self.wasted_seconds += decode_time + inference_time / max(inferred, 1)
+                self._dispatch.notify()
+            for future, stale_reason, (_, keypoints, error, queue_time, batching_delay, decode_time, _) in zip(
+                    futures, stale, jobs_done):
+                if future is None:
+                    continue
+                if error is not None:
+                    _resolve(future, error=RuntimeError(error))
+                elif stale_reason is not None:
+                    _resolve(future, error=Stale(stale_reason))
+                else:
+                    _resolve(future, Result(keypoints, process_time, queue_time, index, size, batching_delay,
+                                            decode_time, inference_time))
+
+    def _respawn_dead(self):
+        lost = []
+        dead = [index for index, process in enumerate(self._processes) if not process.is_alive()]
+        with self._lock:
+            if self._closed:
+                return
+            for index in dead:
+                process = self._processes[index]
+                print(f'{process.name} exited with {process.exitcode}, restarting')
+                self._ready = max(self._ready - 1, 0)
+                # 가져간 job은 응답이 오지 않음. 이미 응답한 job의 id는 dispatch 목록에 없으므로 건너뜀
+                held = self._held[index]
+                lost += self._release(list(held), f'{process.name} exited with {process.exitcode}')
+                held[:] = [-1] * len(held)
+            # 기록하기 전에 죽은 worker가 가져간 job
+            now = perf_counter()
+            expired = [job_id for job_id, (_, dispatched, _, _) in self._dispatched.items()
+                       if now - dispatched > LOST_AFTER]
+            lost += self._release(expired, 'Job lost by an inference worker')
+            if lost:
+                self._dispatch.notify()
+        for index in dead:
+            self._processes[index] = self._spawn(index)
+        for future, error in lost:
+            _resolve(future, error=RuntimeError(error))
+
+    def _release(self, job_ids, error: str) -> List[Tuple[Future, str]]:
+        """응답이 오지 않을 job의 dispatch 자리를 돌려줌.
+        아직 기다리는 future를 반환하며, lock 밖에서 실패 처리함"""
+        lost = []
+        for job_id in job_ids:
+            station, _, _, _ = self._dispatched.pop(job_id, (None, 0.0, None, None))
+            if station is None:
+                continue
+            station.in_flight -= 1
+            self.failed += 1
+            future = self._pending.pop(job_id, None)
+            if future is not None:
+                lost.append((future, error))
+        return lost
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._dispatch.notify()
+        for _ in self._processes:
+            self._jobs.put(None)
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        for future in pending:
+            future.cancel()
+        self._collector.join()
+        self._dispatcher.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            elapsed = max(perf_counter() - self._started, 1e-6)
+            pending = len(self._pending)
+            dispatched = len(self._dispatched)
+            jobs_done = sum(self._jobs_done)
+            return {
+                'workers': self.workers,
+                'workers_ready': self._ready,
+                'pending': pending,
+                # station queue에 남은 job 수와 worker에 넘긴 job 수
+                'queue_depth': len(self._fair),
+                'dispatched': dispatched,
+                'dispatch_depth': self.dispatch_depth,
+                'max_queue': self.max_queue,
+                'station_quota': self.station_quota,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'shed': dict(self.shed),
+                'wasted': dict(self.wasted),
+                'wasted_seconds': self.wasted_seconds,
+                'jobs_done': list(self._jobs_done),
+                'utilization': [busy / elapsed for busy in self._busy],
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+                'mean_batching_delay': self._batching_delay / jobs_done if jobs_done else 0.0,
+                'batching_windows': list(self._windows),
+            }
+
+    def station_stats(self, forget_after=600.0) -> Dict[str, dict]:
+        """station별 대기 및 처리 수. `forget_after`초 동안 idle인 station은 지움"""
+        now = perf_counter()
+        with self._lock:
+            self._fair.forget(forget_after)
+            return {queue.name: queue.stats(now) for queue in self._fair}
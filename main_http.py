@@ -1,62 +1,238 @@
-import sys
-from sys import platform
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError
+from functools import partial
+import json
 import os
+from time import perf_counter
+from threading import Lock
+from typing import Optional, Tuple
 
-import cv2
 import numpy as np
-from flask import Flask, request, jsonify
-
-dir_path = r'D:/projects/openpose-1.5.0/build/examples/tutorial_api_python'
-try:
-    # Windows Import
-    if platform == "win32":
-        # Change these variables to point to the correct folder (Release/x64 etc.)
-        sys.path.append(dir_path + '/../../python/openpose/Release')
-        os.environ['PATH'] = os.environ['PATH'] + ';' + dir_path + '/../../x64/Release;' + dir_path + '/../../bin;'
-        import pyopenpose as op
-    else:
-        # Change these variables to point to the correct folder (Release/x64 etc.)
-        sys.path.append('../../python')
-        # If you run `make install` (default path is `/usr/local/python` for Ubuntu),
-        # you can also access the OpenPose/python module from there.
-        # This will install OpenPose and the python library at your desired installation path.
-        # Ensure that this is in your python path in order to use it.
-        # sys.path.append('/usr/local/python')
-        from openpose import pyopenpose as op
-except ImportError as e:
-    print('Error: OpenPose library could not be found. '
-          'Did you enable `BUILD_PYTHON` in CMake and have this Python script in the right folder?')
-    raise e
-
-
-params = {
-    'model_folder': dir_path + '/../../../models/',
-    'render_pose': 0,
-    'number_people_max': 1
-}
-
-opWrapper = op.WrapperPython()
-opWrapper.configure(params)
-opWrapper.start()
-
-datum = op.Datum()
+from flask import Flask, Response, request, jsonify
+
+import codec
+from backends import create_backend
+from inference import InferencePool, QueueFull, Result, Stale
+from metrics import Registry
+from result_cache import ResultCache, MISS
+from scheduling import check_weight
+
+# backend, worker 수, cache 설정. BBM_CONFIG로 다른 파일을 지정할 수 있음
+CONFIG_PATH = os.environ.get('BBM_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'))
+with open(CONFIG_PATH) as f:
+    config = json.load(f, object_hook=lambda d: namedtuple('Config', d.keys())(*d.values()))
+
+_pool = None  # type: Optional[InferencePool]
+_pool_lock = Lock()
+
+
+def get_pool() -> InferencePool:
+    """처음 요청이 들어올 때 worker를 띄움. import 시점에 띄우면 spawn된 worker가 main module을 다시 import할 때 또 띄우게 됨"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 각 worker process가 자기 backend(OpenPose라면 opWrapper/datum)를 만듦
+            factory = partial(create_backend, **config.backend._asdict())
+            inference = config.inference
+            _pool = InferencePool(factory, inference.workers, inference.max_queue, inference.max_batch,
+                                  inference.max_window, config.scheduling.dispatch_depth,
+                                  config.scheduling.station_quota, config.scheduling.latest_wins)
+        return _pool
+
+
+# 같은(또는 거의 같은) frame이 반복해서 올라오면 inference 없이 이전 결과를 반환.
+# perceptual tier는 조금 움직인 사람도 같은 frame으로 볼 수 있으므로 ttl을 짧게 유지
+result_cache = ResultCache(**config.result_cache._asdict())
+
+# GET /metrics. 처리 단계별 시간 분포와 거절/실패 수
+metrics = Registry('bbm_server_')
+queue_seconds = metrics.histogram('queue_seconds', 'Submit to batch start, including the batching window')
+decode_seconds = metrics.histogram('decode_seconds', 'JPEG decode in the worker')
+inference_seconds = metrics.histogram('inference_seconds', 'Backend call for the batch the frame was in')
+request_seconds = metrics.histogram('request_seconds', 'Whole /skeleton handler')
+batch_size = metrics.histogram('batch_size', 'Frames per inference batch', (1, 2, 3, 4, 6, 8, 12, 16))
+requests_total = metrics.counter('requests_total', '/skeleton responses', ('status',))
+cache_lookups = metrics.counter('cache_lookups_total', 'Result cache lookups', ('result',))
+metrics.gauge('pending_jobs', 'Jobs submitted and not answered yet', lambda: _pool.stats()['pending'] if _pool else 0)
+metrics.gauge('rejected_total', 'Jobs rejected because the queue was full',
+              lambda: _pool.rejected if _pool else 0, type='counter')
+metrics.gauge('failed_total', 'Jobs that failed in a worker', lambda: _pool.failed if _pool else 0, type='counter')
+metrics.gauge('shed_total', 'Jobs answered as stale instead of being run, by where they were caught',
+              lambda: _pool.shed if _pool else {}, label='stage', type='counter')
+metrics.gauge('wasted_inference_total', 'Jobs run whose result was not used', lambda: _pool.wasted if _pool else {},
+              label='reason', type='counter')
+metrics.gauge('wasted_inference_seconds_total', 'Decode + inference time spent on unused results',
+              lambda: _pool.wasted_seconds if _pool else 0, type='counter')
+metrics.gauge('station_queue_depth', 'Jobs waiting in the station queue',
+              lambda: _station_values('queued'), label='station')
+metrics.gauge('station_jobs_total', 'Jobs answered by the workers per station',
+              lambda: _station_values('served'), label='station', type='counter')
+metrics.gauge('station_rejected_total', 'Jobs rejected per station (queue full or over quota)',
+              lambda: _station_values('rejected'), label='station', type='counter')
+
+# 측정 중인 station의 frame이 대기 중인 다른 station보다 먼저 처리되도록 상태(Mode 이름)별 가중치를 줌
+station_weights = config.scheduling.weights._asdict()
+for weight in (config.scheduling.default_weight, *station_weights.values()):
+    check_weight(weight)
+
+
+def _station_values(key: str) -> dict:
+    return {station: stats[key] for station, stats in _pool.station_stats().items()} if _pool else {}
+
 
 app = Flask(__name__)
 
 
+def estimate(buf, station='') -> Optional[np.ndarray]:
+    return lookup(buf, station)[0].keypoints
+
+
+def lookup(buf, station='', mode='', session='', deadline: Optional[float] = None,
+           frame_time: Optional[float] = None) -> Tuple[Result, str]:
+    """(결과, cache 결과). cache에 있으면 decode와 inference 없이 worker -1, batch 크기 0으로 반환.
+    worker가 모두 바쁘거나 station의 quota를 넘으면 QueueFull, deadline이 지났거나 같은 station의 더 최신
+    frame이 있으면 Stale"""
+    status, keypoints, key = result_cache.get(buf)
+    cache_lookups.inc(status)
+    if status != MISS:
+        return Result(keypoints, 0.0, 0.0, -1, 0), status
+    weight = station_weights.get(mode, config.scheduling.default_weight)
+    result = get_pool().estimate(buf, config.inference.request_timeout, station, weight,
+                                 {'mode': mode, 'session': session}, deadline, frame_time)
+    _record(key, result)
+    return result, status
+
+
+def submit(buf, station='') -> 'Future[Optional[np.ndarray]]':
+    """기다리지 않는 estimate. 한 연결로 여러 frame을 보내는 stream server용.
+    QueueFull은 바로 raise하고, 나머지 오류(Stale, worker 오류)는 Future로 전달.
+    request_timeout이 지나면 추론하지 않거나 Stale로 끝나므로 Future는 항상 완료됨"""
+    future = Future()
+    status, keypoints, key = result_cache.get(buf)
+    cache_lookups.inc(status)
+    if status != MISS:
+        future.set_result(keypoints)
+        return future
+
+    def done(job: Future):
+        try:
+            result = job.result()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        _record(key, result)
+        future.set_result(result.keypoints)
+
+    deadline = perf_counter() + config.inference.request_timeout
+    get_pool().submit(buf, station, config.scheduling.default_weight, deadline=deadline).add_done_callback(done)
+    return future
+
+
+def _record(key, result: Result):
+    result_cache.put(key, result.keypoints)
+    queue_seconds.observe(result.queue_time)
+    decode_seconds.observe(result.decode_time)
+    inference_seconds.observe(result.inference_time)
+    batch_size.observe(result.batch_size)
+
+
+def negotiate_format() -> str:
+    """`format` query flag로, 없으면 Accept header로 응답 형식을 정함"""
+    fmt = request.args.get('format')
+    if fmt in codec.FORMATS:
+        return codec.FORMATS[fmt]
+    return request.accept_mimetypes.best_match([codec.JSON, codec.FLOAT32, codec.INT16], codec.JSON)
+
+
 @app.route('/skeleton', methods=['POST'])
 def skeleton():
+    start = perf_counter()
+    response = _skeleton(start)
+    # client가 자기 trace와 서버 처리 시간을 맞춰 볼 수 있도록 trace id를 그대로 돌려줌
+    trace_id = request.headers.get('X-Trace-Id')
+    if trace_id is not None:
+        response.headers['X-Trace-Id'] = trace_id
+    server_time = perf_counter() - start
+    response.headers['X-Server-Time'] = f'{server_time:.6f}'
+    request_seconds.observe(server_time)
+    requests_total.inc(response.status_code)
+    return response
+
+
+def _skeleton(start: float) -> Response:
     if 'frame' not in request.files:
-        return jsonify(code=404, error_msg='File not found.'), 404
+        return _error(404, 'File not found.')
 
-    frame = request.files['frame']
-    frame = np.frombuffer(frame.stream.read(), np.uint8)
-    frame = cv2.imdecode(frame, cv2.IMREAD_UNCHANGED)
+    # station id가 없는 client(이전 버전의 Pi)는 주소로 구분
+    station = request.headers.get('X-Station-Id') or request.remote_addr or ''
+    mode = request.headers.get('X-Station-Mode', '')
+    session = request.headers.get('X-Session-Id', '')
+    # request_timeout이 지나면 어차피 504이므로 client가 budget을 보내지 않아도 그때까지만 처리
+    budget = config.inference.request_timeout
+    frame_time = None
+    try:
+        budget = min(budget, float(request.headers['X-Budget-Ms']) / 1000)
+    except (KeyError, ValueError):
+        pass
+    try:
+        frame_time = float(request.headers['X-Frame-Time'])
+    except (KeyError, ValueError):
+        pass
+    try:
+        result, cache_status = lookup(request.files['frame'].stream.read(), station, mode, session, start + budget,
+                                      frame_time)
+    except QueueFull:
+        return _error(503, 'Inference queue is full.')
+    except Stale as e:
+        # 추론하지 않은 frame. client는 결과 없이 다음 frame으로 넘어가면 됨
+        response = _error(410, 'Frame is stale.')
+        response.headers['X-Stale'] = e.reason
+        return response
+    except TimeoutError:
+        return _error(504, 'Inference timed out.')
+    except RuntimeError as e:
+        return _error(500, str(e))
+    # client가 RTT 중 서버 처리 시간을 구분할 수 있도록 decode + inference 시간을 알려줌.
+    # worker를 기다린 시간은 대기열로 보이도록 X-Process-Time에서 제외
+    headers = {'X-Process-Time': f'{result.process_time or perf_counter() - start:.6f}',
+               'X-Queue-Time': f'{result.queue_time:.6f}', 'X-Batch-Size': str(result.batch_size),
+               'X-Decode-Time': f'{result.decode_time:.6f}', 'X-Inference-Time': f'{result.inference_time:.6f}',
+               'X-Cache': cache_status}
+    keypoints = result.keypoints
 
-    datum.cvInputData = frame
-    opWrapper.emplaceAndPop([datum])
+    mimetype = negotiate_format()
+    if mimetype != codec.JSON:
+        return Response(codec.encode(keypoints, mimetype), mimetype=mimetype, headers=headers)
 
-    if datum.poseKeypoints.shape:
-        return jsonify(code=0, keypoints=datum.poseKeypoints.tolist())
+    if keypoints is not None:
+        response = jsonify(code=0, keypoints=keypoints.tolist())
     else:
-        return jsonify(code=1, keypoints=[])
+        response = jsonify(code=1, keypoints=[])
+    response.headers.update(headers)
+    return response
+
+
+def _error(code: int, message: str) -> Response:
+    response = jsonify(code=code, error_msg=message)
+    response.status_code = code
+    return response
+
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route('/workers', methods=['GET'])
+def worker_stats():
+    return jsonify(get_pool().stats())
+
+
+@app.route('/stations', methods=['GET'])
+def station_stats():
+    return jsonify(get_pool().station_stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_text():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
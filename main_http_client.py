@@ -6,8 +6,11 @@ import numpy as np
 from numpy.linalg import norm
 import requests
 
+import codec
+from filters import KeypointsFilter
 from helper import Keypoint, Mode, Alignment, put_text
 from pose import render_keypoints
+from roi import RoiCropper
 
 
 HOST = '{{API_HOST}}'
@@ -39,6 +42,11 @@ score_timeout = None
 DEBUG = True
 neck_hands = [Keypoint.Neck, Keypoint.RWrist, Keypoint.LWrist]
 timer = None
+# 한 frame짜리 jitter로 Abnormal이 되지 않도록 keypoints를 시간축으로 filtering
+keypoints_filter = KeypointsFilter()
+# 마지막으로 찾은 사람 주변만 잘라서 업로드
+cropper = RoiCropper(w, h)
+last_keypoints, last_captured = None, 0.0
 
 
 def initialize_params():
@@ -64,28 +72,43 @@ def start_measuring(pose_keypoints):
 
 
 with requests.Session() as s:
+    s.headers['Accept'] = codec.accept_header('f32')
     while True:
         ret, frame = cap.read()
         if not ret:
             print('Failed to read frame!')
             break
+        captured = time()
 
-        ret, encoded = cv2.imencode('.jpg', frame)
+        region = cropper.region(last_keypoints, captured - last_captured, captured)
+        roi = None
+        if region is None:
+            upload = frame
+        else:
+            upload, roi = cropper.crop_image(frame, region)
+        ret, encoded = cv2.imencode('.jpg', upload)
         if not ret:
             break
 
         try:
             res = s.post(HOST, files={'frame': encoded.tobytes()})
-            data = res.json()
+            if codec.is_binary(res.headers.get('Content-Type', '')):
+                keypoints = codec.decode(res.content)
+            else:
+                data = res.json()
+                keypoints = np.array(data['keypoints'], np.float32) if data['code'] == 0 else None
         except Exception:
             continue
 
-        if data['code'] == 0:
-            keypoints = np.array(data['keypoints'], np.float32)
-            pose_keypoints = keypoints[0]
+        if keypoints is not None and roi is not None:
+            keypoints = roi.to_frame(keypoints)
+        last_keypoints, last_captured = keypoints, captured
+        if keypoints is not None:
+            pose_keypoints = keypoints_filter(captured, keypoints[0])
             if DEBUG:
                 render_keypoints(frame, keypoints)
         else:
+            keypoints_filter.reset()
             state = Mode.NotDetected
 
         put_text(frame, state.name, (border_margin, border_margin), (0, 255, 0))
@@ -0,0 +1,301 @@
+"""녹화된 session을 화면 없이 실시간보다 빠르게 채점.
+
+크기가 정해진 queue로 이어진 세 단계가 겹쳐서 동작함:
+
+1. decode: 영상마다 thread 하나(동시에 --decoders개까지)가 frame을 읽고
+   재생 시각(container timestamp, 없으면 frame 번호 / fps)을 붙임
+2. inference: 각자 backend를 가진 --workers개의 thread가 대기 중인 frame을
+   (--batch개까지) 한 batch로 추론
+3. scoring: session마다 결과를 frame 순서대로 되돌려 재생 시각으로 BalanceStateMachine을
+   진행하고 --out에 <session>.json(측정과 점수)과 <session>_trace.csv(frame별 상태와 anchor)를 씀
+
+    python offline.py imgs/ --out results/ --config config.json
+"""
+from argparse import ArgumentParser
+from collections import namedtuple
+import csv
+import json
+import os
+import queue
+from threading import Thread
+from time import perf_counter
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from backends import create_backend, no_people
+from balance import Attempt, BalanceStateMachine
+from filters import KeypointsFilter
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.h264', '.mjpeg')
+_DONE = None
+
+
+class MediaClock:
+    """decode한 frame의 재생 시각. container의 timestamp를 쓰고, backend가 알려주지 않으면(raw stream)
+    index / fps를 씀"""
+
+    def __init__(self, capture: cv2.VideoCapture, default_fps=24.0):
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else default_fps
+        self._capture = capture
+        self._last = -1.0
+
+    def timestamp(self, index: int) -> float:
+        position = self._capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        fallback = index / self.fps
+        # backend에 따라 모든 frame에 0을 주거나 다음 frame의 시각을 줌. 단조 증가하도록 유지
+        timestamp = position if position > self._last and abs(position - fallback) < 1.0 else fallback
+        self._last = timestamp
+        return timestamp
+
+
+class Frame(NamedTuple):
+    session: str
+    index: int
+    timestamp: float
+    image: np.ndarray
+
+
+class Scored(NamedTuple):
+    session: str
+    index: int
+    timestamp: float
+    keypoints: np.ndarray
+
+
+class SessionEnd(NamedTuple):
+    """decoder가 마지막 frame 뒤에 보냄. scoring 단계가 기다려야 할 결과 수"""
+    session: str
+    frames: int
+
+
+def find_sessions(paths: List[str]) -> List[str]:
+    sessions = []
+    for path in paths:
+        if os.path.isdir(path):
+            sessions.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                            if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            sessions.append(path)
+    return sessions
+
+
+def read_frames(path: str, session: str) -> Iterator[Frame]:
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f'Failed to open {path}')
+    clock = MediaClock(capture)
+    index = 0
+    try:
+        while True:
+            ret, image = capture.read()
+            if not ret:
+                break
+            yield Frame(session, index, clock.timestamp(index), image)
+            index += 1
+    finally:
+        capture.release()
+
+
+class Pipeline:
+    def __init__(self, backend_options: dict, workers=2, decoders=2, batch=4, queue_size=32,
+                 normal_sec=25, filter_options: Optional[dict] = None):
+        self.backend_options = backend_options
+        self.workers = workers
+        self.decoders = decoders
+        self.batch = batch
+        self.normal_sec = normal_sec
+        self.filter_options = filter_options or {}
+        # decode가 inference보다 한없이 앞서 나가지 않도록 크기를 제한
+        self._frames = queue.Queue(queue_size)
+        self._results = queue.Queue(queue_size)
+        self.frames_processed = 0
+        # 채점한 영상 길이(초)
+        self.media_time = 0.0
+
+    def run(self, sessions: List[Tuple[str, str]], out_dir: str) -> Dict[str, List[Attempt]]:
+        """sessions: [(이름, 경로)]. session별 측정 결과를 반환"""
+        os.makedirs(out_dir, exist_ok=True)
+        pending = queue.Queue()
+        for session in sessions:
+            pending.put(session)
+        decoders = [Thread(target=self._decode, args=(pending,), name=f'decoder-{i}')
+                    for i in range(min(self.decoders, len(sessions)))]
+        workers = [Thread(target=self._infer, name=f'inference-{i}') for i in range(self.workers)]
+        for thread in decoders + workers:
+            thread.start()
+
+        scoring = Thread(target=self._score_all, args=(len(sessions), out_dir), name='scoring')
+        self._attempts = {}  # type: Dict[str, List[Attempt]]
+        scoring.start()
+        for thread in decoders:
+            thread.join()
+        for _ in workers:
+            self._frames.put(_DONE)
+        for thread in workers:
+            thread.join()
+        scoring.join()
+        return self._attempts
+
+    def _decode(self, pending: queue.Queue):
+        while True:
+            try:
+                session, path = pending.get_nowait()
+            except queue.Empty:
+                return
+            count = 0
+            try:
+                for frame in read_frames(path, session):
+                    self._frames.put(frame)
+                    count += 1
+            except IOError as e:
+                print(e)
+            self._results.put(SessionEnd(session, count))
+
+    def _infer(self):
+        backend = create_backend(**self.backend_options)
+        while True:
+            frame = self._frames.get()
+            if frame is _DONE:
+                return
+            batch = [frame]
+            while len(batch) < self.batch:
+                try:
+                    frame = self._frames.get_nowait()
+                except queue.Empty:
+                    break
+                if frame is _DONE:
+                    # 다음 worker를 위해 marker를 남기고 이 worker는 batch를 끝낸 뒤 멈춤
+                    self._frames.put(_DONE)
+                    break
+                batch.append(frame)
+            try:
+                results = backend.estimate_batch([f.image for f in batch])
+            except Exception as e:
+                # scoring은 모든 frame을 기다리므로 실패한 batch는 사람이 없는 것으로 처리
+                print(f'{batch[0].session}: inference failed ({e!r})')
+                results = [no_people() for _ in batch]
+            for frame, keypoints in zip(batch, results):
+                self._results.put(Scored(frame.session, frame.index, frame.timestamp, keypoints))
+
+    def _score_all(self, sessions: int, out_dir: str):
+        scorers = {}  # type: Dict[str, SessionScorer]
+        finished = 0
+        while finished < sessions:
+            item = self._results.get()
+            session = item.session
+            scorer = scorers.get(session)
+            if scorer is None:
+                scorer = scorers[session] = SessionScorer(session, out_dir, self.normal_sec, self.filter_options)
+            if isinstance(item, SessionEnd):
+                scorer.expected = item.frames
+            else:
+                scorer.add(item)
+                self.frames_processed += 1
+            if scorer.done:
+                self._attempts[session] = scorer.close()
+                self.media_time += scorer.last_timestamp
+                del scorers[session]
+                finished += 1
+
+
+class SessionScorer:
+    """session 하나의 결과를 frame 번호 순서로 정렬해 상태 기계에 넣음"""
+
+    def __init__(self, session: str, out_dir: str, normal_sec, filter_options: dict):
+        self.session = session
+        self.expected = None  # type: Optional[int]
+        self.balance = BalanceStateMachine(normal_sec=normal_sec)
+        self.keypoints_filter = KeypointsFilter(**filter_options)
+        self.attempts = []  # type: List[Attempt]
+        self.last_timestamp = 0.0
+        self._next = 0
+        self._waiting = {}  # type: Dict[int, Scored]
+        self._out_dir = out_dir
+        self._trace_file = open(os.path.join(out_dir, f'{session}_trace.csv'), 'w', newline='')
+        self._trace = csv.writer(self._trace_file)
+        self._trace.writerow(['frame', 'timestamp', 'state', 'people', 'anchor_x', 'anchor_y', 'deviation', 'score'])
+
+    @property
+    def done(self) -> bool:
+        return self.expected is not None and self._next >= self.expected
+
+    def add(self, scored: Scored):
+        self._waiting[scored.index] = scored
+        while self._next in self._waiting:
+            self._update(self._waiting.pop(self._next))
+            self._next += 1
+
+    def _update(self, scored: Scored):
+        keypoints, timestamp = scored.keypoints, scored.timestamp
+        self.last_timestamp = timestamp
+        if len(keypoints):
+            person = self.keypoints_filter(timestamp, keypoints[0])
+        else:
+            self.keypoints_filter.reset()
+            person = None
+        balance = self.balance
+        attempt = balance.update(person, timestamp)
+        if attempt is not None:
+            self.attempts.append(attempt)
+        measured = balance.anchor_keypoint is not None and person is not None
+        x, y = person[balance.anchor_keypoint, :2] if measured else ('', '')
+        deviation = '' if balance.deviation is None else f'{balance.deviation:.2f}'
+        self._trace.writerow([scored.index, f'{timestamp:.3f}', balance.state.name, len(keypoints),
+                              x if x == '' else f'{x:.1f}', y if y == '' else f'{y:.1f}', deviation, balance.score])
+
+    def close(self) -> List[Attempt]:
+        self._trace_file.close()
+        summary = {
+            'session': self.session,
+            'frames': self.expected,
+            'attempts': [{
+                'start': attempt.start,
+                'end': attempt.end,
+                'elapsed': round(attempt.elapsed, 3),
+                'score': attempt.score,
+                'result': attempt.result.name,
+                'anchor_keypoint': attempt.anchor_keypoint.name,
+                'start_anchor': attempt.start_anchor,
+                'deviation_threshold': attempt.deviation_threshold,
+            } for attempt in self.attempts],
+            'best_score': max((attempt.score for attempt in self.attempts), default=None),
+        }
+        with open(os.path.join(self._out_dir, f'{self.session}.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        return self.attempts
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('inputs', nargs='+', help='video files or directories of them')
+    parser.add_argument('--out', default='results')
+    parser.add_argument('--config', default='config.json', help='backend section selects the pose estimator')
+    parser.add_argument('--workers', type=int, default=2, help='parallel inference threads, one backend each')
+    parser.add_argument('--decoders', type=int, default=2, help='videos decoded at once')
+    parser.add_argument('--batch', type=int, default=4)
+    parser.add_argument('--normal-sec', type=float, default=25)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f, object_hook=lambda d: namedtuple('Config', d.keys())(*d.values()))
+    paths = find_sessions(args.inputs)
+    # session 이름으로 출력 파일 이름을 정하므로 겹치면 안 됨
+    sessions = [(os.path.splitext(os.path.basename(path))[0], path) for path in paths]
+
+    pipeline = Pipeline(config.backend._asdict(), args.workers, args.decoders, args.batch,
+                        normal_sec=args.normal_sec)
+    start = perf_counter()
+    attempts = pipeline.run(sessions, args.out)
+    elapsed = perf_counter() - start
+    for session, _ in sessions:
+        results = ', '.join(f'{a.result.name} {a.score}' for a in attempts.get(session, [])) or 'no attempt'
+        print(f'{session}: {results}')
+    print(f'{pipeline.frames_processed} frames ({pipeline.media_time:.0f} s of video) in {elapsed:.1f} s:'
+          f' {pipeline.frames_processed / elapsed:.1f} fps, {pipeline.media_time / elapsed:.1f}x real time')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""올라온 JPEG를 key로 하는 /skeleton 결과의 process 내 LRU cache.
+
+exact tier: 올라온 byte의 blake2b. 같은 frame이 반복해서 올라오면(여러 worker가 다시 보낸 정지 화면,
+다시 재생한 녹화 영상) decode와 inference를 모두 건너뜀.
+
+perceptual tier (선택): 1/8 크기 grayscale decode의 64-bit DCT hash. sensor noise나 재encoding으로만
+byte가 다른 거의 같은 frame은 hash 차이가 `max_distance` bit 이내면 같은 것으로 봄. 64-bit hash 하나로는
+사람이 몇 pixel 움직인 것을 거의 알아채지 못하므로 후보는 thumbnail을 비교해서 확인함:
+`pixel_threshold` 이상 다른 pixel이 `max_changed` 비율 이하여야 함. thumbnail은 decode하지만 inference는 건너뜀.
+"""
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+from time import monotonic
+from typing import NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+HIT = 'hit'
+NEAR = 'near'
+MISS = 'miss'
+
+
+class CacheKey(NamedTuple):
+    digest: bytes
+    phash: Optional[int]
+    thumbnail: Optional[np.ndarray]
+
+
+class _Entry(NamedTuple):
+    keypoints: Optional[np.ndarray]
+    phash: Optional[int]
+    thumbnail: Optional[np.ndarray]
+    expires: float
+
+
+def thumbnail(buf) -> Optional[np.ndarray]:
+    """1/8 크기 grayscale. JPEG decoder가 줄인 크기로 decode하고 sensor noise를 줄이려고 blur함"""
+    small = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    return None if small is None else cv2.blur(small, (3, 3))
+
+
+def perceptual_hash(small: np.ndarray) -> int:
+    """64-bit pHash: 32x32 thumbnail의 저주파 8x8 DCT 계수(DC 제외)가 중앙값보다 큰지 여부"""
+    thumb = cv2.resize(small, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumb)[:8, :8].ravel()[1:]
+    bits = low > np.median(low)
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, ttl=2.0, perceptual=False, max_distance=4, pixel_threshold=12,
+                 max_changed=0.002):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self.pixel_threshold = pixel_threshold
+        self.max_changed = max_changed
+        self._entries = OrderedDict()  # type: OrderedDict[bytes, _Entry]
+        self._lock = Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, buf) -> Tuple[str, Optional[np.ndarray], CacheKey]:
+        """(HIT | NEAR | MISS, cache된 keypoints, MISS일 때 결과를 `put`할 key)"""
+        digest = blake2b(buf, digest_size=16).digest()
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return HIT, entry.keypoints, CacheKey(digest, entry.phash, entry.thumbnail)
+        if not self.perceptual:
+            with self._lock:
+                self.misses += 1
+            return MISS, None, CacheKey(digest, None, None)
+
+        # thumbnail decode가 비싸므로 lock 밖에서 함
+        small = thumbnail(buf)
+        phash = None if small is None else perceptual_hash(small)
+        key = CacheKey(digest, phash, small)
+        with self._lock:
+            candidates = [] if phash is None else [
+                (cached, entry) for cached, entry in reversed(self._entries.items())
+                if entry.phash is not None and entry.expires > now
+                and bin(entry.phash ^ phash).count('1') <= self.max_distance]
+        for candidate, entry in candidates:
+            if self._similar(small, entry.thumbnail):
+                with self._lock:
+                    if candidate in self._entries:
+                        self._entries.move_to_end(candidate)
+                    self.near_hits += 1
+                return NEAR, entry.keypoints, key
+        with self._lock:
+            self.misses += 1
+        return MISS, None, key
+
+    def _similar(self, a: np.ndarray, b: np.ndarray) -> bool:
+        if a.shape != b.shape:
+            return False
+        changed = np.count_nonzero(cv2.absdiff(a, b) >= self.pixel_threshold)
+        return changed <= self.max_changed * a.size
+
+    def put(self, key: CacheKey, keypoints: Optional[np.ndarray]):
+        """inference 결과를 저장. `None`(사람 없음)도 올바른 결과이므로 cache함"""
+        if keypoints is not None:
+            # 여러 요청이 같이 쓰므로 수정하지 못하게 함
+            keypoints.setflags(write=False)
+        now = monotonic()
+        with self._lock:
+            self._entries[key.digest] = _Entry(keypoints, key.phash, key.thumbnail, now + self.ttl)
+            self._entries.move_to_end(key.digest)
+            # 만료된 entry를 LRU 쪽 끝부터 지운 다음 크기 제한을 적용
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if oldest.expires > now and len(self._entries) <= self.max_entries:
+                    break
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
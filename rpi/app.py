@@ -1,5 +1,5 @@
 from collections import namedtuple
-from flask import Flask, request
+from flask import Flask, Response, request
 from time import sleep
 import json
 
@@ -34,6 +34,17 @@ def application():
     return {'msg': msg}, code
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(controller.output.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/traces', methods=['GET'])
+def traces():
+    """최근 frame들의 trace id와 단계별 시각 (capture, upload, 응답, 발행, 서버 처리 시간)"""
+    return {'traces': list(controller.output.traces)}
+
+
 @app.route('/', methods=['GET'])
 def start_measuring():
     sleep(5)
@@ -0,0 +1,124 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from time import time
+
+import aiohttp
+
+import codec
+from processors import FrameTrace, frame_headers, parse_keypoints, parse_process_time, parse_server_timing
+
+
+class AsyncKeypointsExtractor(Thread):
+    """하나의 event loop thread에서 최대 `concurrency`개의 요청을 동시에 처리.
+
+    KeypointsExtractor thread 여러 개를 대신하며, 동시 요청 수를 늘려도 thread는 늘어나지 않음.
+    """
+
+    def __init__(self, server_url, owner, name, concurrency=16, request_timeout=1, keypoints_format='f32'):
+        super(AsyncKeypointsExtractor, self).__init__()
+        self.name = name
+        self.terminated = False
+        self.url = server_url
+        self.owner = owner
+        self.concurrency = concurrency
+        self.request_timeout = request_timeout
+        self.headers = {'Accept': codec.accept_header(keypoints_format)}
+        self.loop = asyncio.new_event_loop()
+        # event는 loop thread 안에서 생성 (python 3.7의 asyncio.Event는 생성 시점의 loop에 묶임)
+        self._frame_ready = None
+        # ROI crop은 JPEG decode/encode라 loop에서 하면 다른 요청이 모두 멈춤. cv가 GIL을 놓으므로 thread로 충분
+        self._crop_executor = ThreadPoolExecutor(2, f'{name}-crop') if owner.cropper is not None else None
+        owner._frame_listeners.append(self.notify)
+        self.start()
+
+    def notify(self):
+        """capture thread에서 새 frame이 들어왔음을 알림"""
+        frame_ready = self._frame_ready
+        if frame_ready is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(frame_ready.set)
+        except RuntimeError:
+            # loop가 이미 닫힌 경우
+            pass
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+            if self._crop_executor is not None:
+                self._crop_executor.shutdown()
+
+    async def _main(self):
+        self._frame_ready = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        tasks = set()
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as sess:
+            while not self.terminated:
+                await semaphore.acquire()
+                frame = await self._next_frame()
+                if frame is None:
+                    semaphore.release()
+                    continue
+                task = asyncio.ensure_future(self._extract(sess, semaphore, frame))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.wait(tasks)
+
+    async def _next_frame(self):
+        owner = self.owner
+        frame_ready = self._frame_ready
+        while not self.terminated:
+            frame = owner._take_frame(timeout=0, prepare=False)
+            if frame is not None:
+                return frame
+            frame_ready.clear()
+            # clear와 wait 사이에 들어온 frame을 놓치지 않도록 한 번 더 확인
+            frame = owner._take_frame(timeout=0, prepare=False)
+            if frame is not None:
+                return frame
+            try:
+                await asyncio.wait_for(frame_ready.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+        return None
+
+    async def _extract(self, sess, semaphore, frame):
+        try:
+            if self._crop_executor is not None:
+                await self.loop.run_in_executor(self._crop_executor, self.owner._prepare_frame, frame)
+            else:
+                self.owner._prepare_frame(frame)
+            timestamp, trace_id, roi = frame.timestamp, frame.trace_id, frame.roi
+            sent = time()
+            data = aiohttp.FormData()
+            # requests의 files={'frame': ...}와 같이 filename을 지정해야 서버의 request.files에 들어감
+            data.add_field('frame', frame.data, filename='frame')
+            headers = {**frame_headers(trace_id, timestamp, self.request_timeout), **self.owner.station_headers}
+            async with sess.post(self.url, data=data, headers=headers) as res:
+                if res.status == 410:
+                    self.owner._discard(shed=True)
+                    return
+                res.raise_for_status()
+                body = await res.read()
+                keypoints = parse_keypoints(res.headers.get('Content-Type', ''), body)
+                server_time = parse_process_time(res.headers)
+                server_timing = parse_server_timing(res.headers)
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+            print(self.name, repr(e))
+            self.owner._discard()
+            return
+        finally:
+            frame.release()
+            semaphore.release()
+
+        self.owner._publish(timestamp, keypoints, time() - sent, server_time, roi,
+                            FrameTrace(trace_id, timestamp, sent, server_timing))
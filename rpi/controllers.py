@@ -1,13 +1,17 @@
+import os
 from threading import Thread
-from time import time, sleep
+from time import time, sleep, strftime
 
 from picamera import PiCamera
 import numpy as np
 
+from motion import MotionDetector
 from processors import FrameProcessor
+from recording import KeypointsRecorder
+from roi import RoiCropper
 import pose
 from measurer import BodyBalanceMeasurer
-from helper import fill_alpha_channel
+from uploader import ScoreUploader, score_record
 
 
 class MainController:
@@ -19,52 +23,117 @@ class MainController:
         self.cam.framerate = cam_config.framerate
         self.cam.rotation = cam_config.rotation
         self.cam.start_preview()
-        self.output = FrameProcessor(config.server_url, config.workers)
+        roi_config = config.roi
+        cropper = RoiCropper(cam_resolution.width, cam_resolution.height, roi_config.padding, roi_config.max_side,
+                             roi_config.quality, roi_config.full_frame_interval,
+                             roi_config.max_age) if roi_config.enabled else None
+        # MJPEG frame 한 장이 width * height bytes를 넘는 경우는 없음
+        self.output = FrameProcessor(config.server_url, config.workers, config.keypoints_format,
+                                     config.transport, config.stream_url, config.engine,
+                                     frame_capacity=cam_resolution.width * cam_resolution.height,
+                                     target_age=config.target_keypoint_age,
+                                     mode_rates=config.inference_rates._asdict(),
+                                     motion=MotionDetector(config.motion.threshold, config.motion.min_area,
+                                                           config.motion.interval),
+                                     motion_hold=config.motion.hold,
+                                     cropper=cropper, station_id=config.station_id)
         self.cam.start_recording(self.output, format='mjpeg')
-        self._rendered_keypoints_timestamp = time()
         self._keypoints_drawing = np.zeros((cam_resolution.height, cam_resolution.width, 4), np.uint8)
+        # render_keypoints가 마지막으로 그린 (x, y, w, h)
+        self._drawn_region = None
+        self._publish_to_overlay = self.output.metrics.histogram('publish_to_overlay_seconds',
+                                                                 'Keypoints published to keypoints overlay updated')
+        self._overlay_skipped = self.output.metrics.counter('overlay_skipped_total',
+                                                            'Published keypoints never drawn on the overlay')
         self._keypoints_overlay = self.cam.add_overlay(self._keypoints_drawing, layer=3, format='bgra')
         
         self._terminated = False
         self.bbm = BodyBalanceMeasurer(self.output, config)
-        self._text_overlay = self.cam.add_overlay(self.bbm.text_layer, layer=4, format='bgra')
-        self._overlays_update_thread = Thread(target=self._update_overlays, name='overlay_updater')
-        self._overlays_update_thread.start()
+        # 측정이 끝나면 점수를 spool에 넣고 바로 돌아옴. 업로드는 uploader thread에서
+        database = config.database
+        self.uploader = ScoreUploader(database.url, database.spool, database.batch_size, database.bulk_path,
+                                      database.timeout, metrics=self.output.metrics)
+        self.bbm.add_score_listener(lambda user_id, score, elapsed, mode: self.uploader.submit(
+            score_record(user_id, database.module_type, score, elapsed)))
+        self.bbm.add_start_listener(lambda user_id, timestamp: self.output.set_session(user_id))
+        # 발행된 keypoints와 측정 시작을 기록해 두면 recording.py로 현장 상황을 다시 재생할 수 있음
+        self.recorder = None
+        if config.recording.enabled:
+            self.recorder = KeypointsRecorder(os.path.join(config.recording.directory, strftime('%Y%m%d-%H%M%S')),
+                                              config.recording.max_people,
+                                              (cam_resolution.width, cam_resolution.height))
+            self.recorder.listen(self.output)
+            self.bbm.add_start_listener(lambda user_id, timestamp: self.recorder.mark('start', timestamp,
+                                                                                      user_id=user_id))
+        self._text_layer_version, text_layer = self.bbm.hud.published
+        self._text_overlay = self.cam.add_overlay(text_layer, layer=4, format='bgra')
+        # overlay마다 새 내용이 나올 때까지 기다렸다가 바로 갱신
+        self._overlay_update_threads = [
+            Thread(target=self._update_keypoints_overlay_loop, name='keypoints_overlay_updater'),
+            Thread(target=self._update_text_overlay_loop, name='text_overlay_updater'),
+        ]
+        for thread in self._overlay_update_threads:
+            thread.start()
 
-    def _update_overlays(self):
+    def _wait_frame_interval(self, last_update: float):
         # 문서에서 카메라의 framerate보다 더 빠르게 업데이트하지 말라고 언급.
-        # 오버레이 갱신 주기 제한
+        # 방금 한 갱신은 늦추지 않고, 다음 갱신까지의 간격만 제한
+        elapsed = time() - last_update
         frame_interval = 1 / int(self.cam.framerate)
+        if elapsed < frame_interval:
+            sleep(frame_interval - elapsed)
 
+    def _update_keypoints_overlay_loop(self):
+        # 생성 이전에 발행된 keypoints는 그리지 않음
+        sequence = self.output.snapshot.sequence
         while not self._terminated:
+            snapshot = self.output.wait_for_sequence(sequence, timeout=0.5)
+            if snapshot is None:
+                continue
             start = time()
-            self._update_keypoints_overlay()
-            self._update_text_overlay()
-            elapsed = time() - start
-            if elapsed < frame_interval:
-                sleep(frame_interval - elapsed)
-    
-    def _update_keypoints_overlay(self):
-        # 더 최신의 keypoints가 있는 경우에만 업데이트
-        keypoints_timestamp, keypoints = self.output.timestamp_and_keypoints
-        if self._rendered_keypoints_timestamp >= keypoints_timestamp:
+            if snapshot.sequence > sequence + 1:
+                # framerate 제한 때문에 그리기 전에 더 새 결과로 바뀐 keypoints
+                self._overlay_skipped.inc(amount=snapshot.sequence - sequence - 1)
+            sequence = snapshot.sequence
+            self._update_keypoints_overlay(snapshot.keypoints)
+            self._publish_to_overlay.observe(time() - snapshot.published)
+            self._wait_frame_interval(start)
+
+    def _update_text_overlay_loop(self):
+        while not self._terminated:
+            published = self.bbm.hud.wait_for_version(self._text_layer_version, timeout=0.5)
+            if published is None:
+                continue
+            start = time()
+            self._update_text_overlay(*published)
+            self._wait_frame_interval(start)
+
+    def _update_keypoints_overlay(self, keypoints):
+        # 지난번에 그린 영역 밖은 이미 투명하므로 그 영역만 지움
+        if self._drawn_region is not None:
+            x, y, w, h = self._drawn_region
+            self._keypoints_drawing[y:y + h, x:x + w] = 0
+        elif keypoints is None:
             return
-        self._keypoints_drawing.fill(0)
-        if keypoints is not None:
-            pose.render_keypoints(self._keypoints_drawing, keypoints)
-            fill_alpha_channel(self._keypoints_drawing)
+        # BGRA frame에는 그려진 pixel의 alpha까지 채워짐
+        self._drawn_region = pose.render_keypoints(self._keypoints_drawing, keypoints) \
+            if keypoints is not None else None
         self._keypoints_overlay.update(self._keypoints_drawing)
-        self._rendered_keypoints_timestamp = keypoints_timestamp
 
-    def _update_text_overlay(self):
-        self._text_overlay.update(self.bbm.text_layer)
+    def _update_text_overlay(self, version, text_layer):
+        self._text_overlay.update(text_layer)
+        self._text_layer_version = version
     
     def close(self):
         self._terminated = True
-        self._overlays_update_thread.join()
+        for thread in self._overlay_update_threads:
+            thread.join()
         self.cam.remove_overlay(self._text_overlay)
         self.cam.remove_overlay(self._keypoints_overlay)
         self.cam.stop_recording()
         self.cam.stop_preview()
         self.cam.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.uploader.close()
             
\ No newline at end of file
@@ -0,0 +1,123 @@
+from collections import deque
+from statistics import median
+from typing import Optional
+
+
+class AdaptiveDispatcher:
+    """keypoints의 나이(frame 촬영 시각부터 경과한 시간)가 `target_age`를 넘지 않도록
+    동시 요청 수(in_flight_limit)와 frame 샘플링 간격(sample_interval)을 조절.
+
+    - 서버가 느려져 대기열이 쌓이면(RTT가 서버 처리 시간보다 크게 늘어나면) 동시 요청 수를 줄이고
+      샘플링 간격을 늘려 이미 늦은 frame을 보내지 않음
+    - 대기열 없이 결과 간격 때문에 나이가 target을 넘으면 동시 요청 수를 늘림
+
+    thread-safe하지 않으므로 FrameProcessor의 lock 안에서만 호출해야 함.
+    """
+
+    def __init__(self, max_in_flight, target_age=0.15, window=30, adjust_interval=0.5, max_interval=1.0):
+        self.max_in_flight = max_in_flight
+        self.target_age = target_age
+        self.adjust_interval = adjust_interval
+        self.max_interval = max_interval
+        self.in_flight_limit = max_in_flight
+        self.sample_interval = 0.0
+        # 부하와 무관하게 지켜야 하는 최소 샘플링 간격 (measurer 상태별 추론 주기)
+        self.min_interval = 0.0
+        self.in_flight = 0
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        # frames_dropped 중 보내기 전에 더 최신 frame으로 교체된 수. 나머지는 샘플링 간격 때문에 버린 수
+        self.frames_superseded = 0
+        self.requests_sent = 0
+        # 최근 프레임 기준 drop 비율의 이동 평균
+        self.drop_rate = 0.0
+        self._rtts = deque(maxlen=window)
+        self._server_times = deque(maxlen=window)
+        self._completions = deque(maxlen=window)
+        self._last_sampled = 0.0
+        self._last_adjusted = 0.0
+
+    @property
+    def rtt(self) -> Optional[float]:
+        return median(self._rtts) if self._rtts else None
+
+    @property
+    def server_time(self) -> Optional[float]:
+        return median(self._server_times) if self._server_times else None
+
+    @property
+    def result_interval(self) -> Optional[float]:
+        if len(self._completions) < 2:
+            return None
+        return (self._completions[-1] - self._completions[0]) / (len(self._completions) - 1)
+
+    def accept(self, timestamp: float) -> bool:
+        """새로 들어온 frame을 샘플링할지 여부"""
+        self.frames_captured += 1
+        accepted = timestamp - self._last_sampled >= max(self.sample_interval, self.min_interval)
+        if accepted:
+            self._last_sampled = timestamp
+        self._count(dropped=not accepted)
+        return accepted
+
+    def superseded(self):
+        """보내기 전에 더 최신 frame으로 교체된 경우"""
+        self.frames_superseded += 1
+        self._count(dropped=True)
+
+    def _count(self, dropped: bool):
+        if dropped:
+            self.frames_dropped += 1
+        self.drop_rate += 0.05 * (float(dropped) - self.drop_rate)
+
+    def can_dispatch(self) -> bool:
+        return self.in_flight < self.in_flight_limit
+
+    def dispatched(self):
+        self.in_flight += 1
+        self.requests_sent += 1
+
+    def completed(self, now: float, rtt: float, server_time: Optional[float] = None):
+        self.in_flight -= 1
+        self._rtts.append(rtt)
+        if server_time is not None:
+            self._server_times.append(server_time)
+        self._completions.append(now)
+        self._adjust(now)
+
+    def failed(self):
+        self.in_flight -= 1
+
+    def shed(self):
+        """서버가 추론하지 않고 410으로 돌려보낸 경우. 같은 station의 더 최신 frame이 이미 서버에 있거나
+        기한 안에 처리할 수 없다는 뜻이므로 빈 slot으로 바로 다음 frame을 보내지 않도록 동시 요청 수를 줄임"""
+        self.in_flight -= 1
+        if self.in_flight_limit > 1:
+            self.in_flight_limit -= 1
+
+    def _adjust(self, now: float):
+        if now - self._last_adjusted < self.adjust_interval or len(self._rtts) < 3:
+            return
+        self._last_adjusted = now
+
+        rtt = self.rtt
+        # 서버 처리 시간을 모르면 최근 최소 RTT를 대기열 없는 RTT로 간주
+        base = self.server_time if self._server_times else min(self._rtts)
+        queued = rtt > base * 1.5
+        interval = self.result_interval or rtt
+        # 결과가 interval 간격으로 갱신되므로 평균적으로 보이는 keypoints의 나이
+        expected_age = rtt + interval / 2
+
+        if rtt > self.target_age and queued:
+            # 서버 대기열에서 늦어지는 중: 요청을 줄여 이미 늦은 frame을 보내지 않음
+            if self.in_flight_limit > 1:
+                self.in_flight_limit -= 1
+            self.sample_interval = min(self.max_interval, max(self.sample_interval * 1.5, 1 / 30))
+        elif expected_age > self.target_age and not queued:
+            if self.in_flight_limit < self.max_in_flight:
+                self.in_flight_limit += 1
+            self.sample_interval *= 0.5
+        elif expected_age < self.target_age * 0.5:
+            self.sample_interval *= 0.5
+        if self.sample_interval < 1e-3:
+            self.sample_interval = 0.0
@@ -0,0 +1,75 @@
+import math
+from typing import Optional
+
+import numpy as np
+
+NUMBER_PARTS = 25
+
+
+class KeypointsFilter:
+    """한 사람의 (25, 3) keypoints에 관절별 One-Euro filter를 적용.
+
+    느리게 움직일 때는 cutoff가 낮아 한 frame짜리 jitter가 걸러지고, 빠르게 움직일 때는
+    cutoff가 올라가 지연이 줄어듦. 25개 관절을 한 번에 계산하며 update 비용은 frame 간격과 무관.
+
+    confidence가 `threshold` 이하인 관절은 이전 추정값을 유지하고(최대 `max_hold`초),
+    그 이상인 관절은 confidence에 비례해 새 측정값을 반영함.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.003, d_cutoff=1.0, threshold=0.05, max_hold=0.5):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.threshold = threshold
+        self.max_hold = max_hold
+        self._timestamp = None  # type: Optional[float]
+        self._position = np.zeros((NUMBER_PARTS, 2), np.float32)
+        self._velocity = np.zeros((NUMBER_PARTS, 2), np.float32)
+        self._score = np.zeros(NUMBER_PARTS, np.float32)
+        # 관절별 마지막으로 측정값을 반영한 시각. 한 번도 반영하지 않았으면 -inf
+        self._updated = np.full(NUMBER_PARTS, -np.inf)
+
+    def reset(self):
+        """사람을 놓친 경우 이전 추정값을 버림"""
+        self._timestamp = None
+        self._score.fill(0)
+        self._updated.fill(-np.inf)
+
+    @staticmethod
+    def _alpha(cutoff, dt: float):
+        tau = 1 / (2 * math.pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+    def __call__(self, timestamp: float, person: np.ndarray) -> np.ndarray:
+        """timestamp에 측정한 person (25, 3)을 반영한 추정값. 반환값은 새 배열"""
+        if self._timestamp is not None and timestamp <= self._timestamp:
+            # 같은 결과를 다시 받았거나 순서가 뒤바뀐 경우
+            return self.estimate()
+        dt = None if self._timestamp is None else timestamp - self._timestamp
+        self._timestamp = timestamp
+
+        xy = person[:, :2]
+        score = person[:, 2]
+        measured = score > self.threshold
+        # 처음 보이거나 오래 가려졌다 다시 보이는 관절은 측정값에서 새로 시작
+        fresh = measured & (timestamp - self._updated > self.max_hold)
+        tracked = measured & ~fresh
+        if dt is not None and tracked.any():
+            velocity = (xy - self._position) / dt
+            velocity = self._velocity + self._alpha(self.d_cutoff, dt) * (velocity - self._velocity)
+            cutoff = self.min_cutoff + self.beta * np.linalg.norm(velocity, axis=1)
+            alpha = self._alpha(cutoff, dt) * np.minimum(score, 1)
+            position = self._position + alpha[:, None] * (xy - self._position)
+            self._position[tracked] = position[tracked]
+            self._velocity[tracked] = velocity[tracked]
+        self._position[fresh] = xy[fresh]
+        self._velocity[fresh] = 0
+        self._score[measured] = score[measured]
+        self._updated[measured] = timestamp
+        # 오래 측정되지 않은 관절은 보이지 않는 것으로 처리
+        self._score[timestamp - self._updated > self.max_hold] = 0
+        return self.estimate()
+
+    def estimate(self) -> np.ndarray:
+        """현재 추정값 (25, 3). 유지 중인 관절의 confidence는 마지막으로 측정된 값"""
+        return np.concatenate([self._position, self._score[:, None]], axis=1)
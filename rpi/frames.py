@@ -0,0 +1,181 @@
+from collections import deque
+from time import time
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+_SOI_VIEW = memoryview(SOI)
+# 2 bytes씩 읽었을 때의 EOI
+_EOI_WORD = 0xd9ff
+_WORD = np.dtype('<u2')
+
+
+class Frame:
+    """미리 할당된 buffer에 담긴 JPEG 한 장. 업로드가 끝나면 release()로 pool에 반환"""
+    __slots__ = ('timestamp', 'trace_id', 'length', 'roi', '_buffer', '_view', '_pool')
+
+    def __init__(self, pool: 'FramePool', capacity: int):
+        self.timestamp = 0.0
+        # 조립된 순서대로 붙는 번호. 서버 응답과 처리 단계별 시각을 이 번호로 묶음
+        self.trace_id = 0
+        self.length = 0
+        # 사람 영역만 잘라낸 경우 원본 frame 좌표로 되돌리기 위한 Roi. 원본 그대로면 None
+        self.roi = None
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._pool = pool
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def data(self) -> memoryview:
+        """복사 없는 read-only view"""
+        return self._view[:self.length].toreadonly()
+
+    def release(self):
+        self._pool.release(self)
+
+
+class ServerTiming(NamedTuple):
+    """서버가 응답 header로 알려준 처리 시간(초)"""
+    queue: float
+    decode: float
+    inference: float
+    # 요청을 받은 뒤 응답할 때까지 전체. RTT에서 빼면 network 시간
+    total: float
+
+
+class FrameTrace(NamedTuple):
+    """frame 하나의 업로드 기록. extractor가 만들어 FrameProcessor._publish에 넘김"""
+    trace_id: int
+    captured: float
+    sent: float
+    server: Optional[ServerTiming] = None
+
+
+class FramePool:
+    def __init__(self, size: int, capacity: int):
+        self._free = deque(Frame(self, capacity) for _ in range(size))
+
+    def acquire(self) -> Optional[Frame]:
+        try:
+            return self._free.pop()
+        except IndexError:
+            return None
+
+    def release(self, frame: Frame):
+        frame.length = 0
+        frame.roi = None
+        self._free.append(frame)
+
+    def __len__(self):
+        return len(self._free)
+
+
+class FrameAssembler:
+    """picamera가 넘겨주는 MJPEG chunk를 SOI/EOI marker 기준으로 frame 단위로 분리.
+
+    chunk 경계와 frame 경계가 일치하지 않아도(여러 frame이 합쳐지거나 marker가 잘려도) 동작하며,
+    완성된 frame은 pool의 buffer 그대로 `on_frame`으로 전달되어 복사가 발생하지 않음.
+    """
+
+    def __init__(self, pool: FramePool, on_frame: Callable[[Frame], None],
+                 acquire: Optional[Callable[[], Optional[Frame]]] = None):
+        self._pool = pool
+        self._on_frame = on_frame
+        self._acquire = acquire or pool.acquire
+        self._frame = None  # type: Optional[Frame]
+        # 빈 buffer가 없거나 capacity를 넘어선 frame은 EOI까지 버림
+        self._discarding = False
+        self._last_byte = 0
+        # EOI 검색용 scratch. chunk가 이보다 크면 한 번만 다시 할당
+        self._scratch = np.empty(1 << 16, np.bool_)
+        self.dropped = 0
+        self._next_trace_id = 0
+
+    def write(self, buf: bytes):
+        end = len(buf)
+        if not end:
+            return
+        view = memoryview(buf)
+        pos = 0
+        while pos < end:
+            if self._frame is None and not self._discarding:
+                if pos == 0 and self._last_byte == 0xff and buf[0] == 0xd8:
+                    # 이전 chunk 끝의 0xff와 이어지는 SOI
+                    self._begin(_SOI_VIEW[:1])
+                    continue
+                start = buf.find(SOI, pos)
+                if start < 0:
+                    break
+                self._begin(None)
+                pos = start
+            else:
+                if pos == 0 and self._last_byte == 0xff and buf[0] == 0xd9:
+                    stop = 1
+                else:
+                    stop = self._find_eoi(buf, pos, end)
+                    if stop < 0:
+                        self._append(view, pos, end)
+                        break
+                    stop += 2
+                self._append(view, pos, stop)
+                self._finish()
+                pos = stop
+        self._last_byte = buf[-1]
+
+    def _find_eoi(self, buf, start: int, stop: int) -> int:
+        # JPEG entropy-coded 구간에는 0xff가 많아 bytes.find(EOI)가 느림 (bench_frames.py에서 4~5배).
+        # 2 bytes 단위로 짝수/홀수 위치에서 한 번씩 비교하면 chunk를 한 번 읽는 것과 같은 비용
+        found = -1
+        for offset in (0, 1):
+            n = (stop - start - offset) // 2
+            if n <= 0:
+                continue
+            if len(self._scratch) < n:
+                self._scratch = np.empty(n, np.bool_)
+            is_eoi = self._scratch[:n]
+            np.equal(np.frombuffer(buf, _WORD, n, start + offset), _EOI_WORD, out=is_eoi)
+            i = int(is_eoi.argmax())
+            if is_eoi[i] and (found < 0 or start + offset + 2 * i < found):
+                found = start + offset + 2 * i
+        return found
+
+    def _begin(self, prefix: Optional[memoryview]):
+        frame = self._acquire()
+        if frame is None:
+            self.dropped += 1
+            self._discarding = True
+            return
+        self._frame = frame
+        if prefix is not None:
+            self._append(prefix, 0, len(prefix))
+
+    def _append(self, view: memoryview, start: int, stop: int):
+        frame = self._frame
+        if frame is None:
+            return
+        length = frame.length + stop - start
+        if length > frame.capacity:
+            self.dropped += 1
+            frame.release()
+            self._frame = None
+            self._discarding = True
+            return
+        frame._view[frame.length:length] = view[start:stop]
+        frame.length = length
+
+    def _finish(self):
+        frame = self._frame
+        self._frame = None
+        self._discarding = False
+        if frame is None:
+            return
+        frame.timestamp = time()
+        frame.trace_id = self._next_trace_id
+        self._next_trace_id += 1
+        self._on_frame(frame)
@@ -1,8 +1,16 @@
 from enum import IntEnum, auto
+from typing import TYPE_CHECKING
 
 import cv2 as cv
 import numpy as np
-from picamera import PiCamera
+
+if TYPE_CHECKING:
+    # 타입 표기에만 사용. picamera가 없는 곳에서도 put_text 등을 쓸 수 있도록 함
+    from picamera import PiCamera
+
+
+# put_text의 검은 그림자를 글자에서 오른쪽 아래로 떨어뜨리는 거리
+SHADOW_OFFSET = 2
 
 
 class Alignment(IntEnum):
@@ -12,7 +20,7 @@ class Alignment(IntEnum):
 
 
 class OverlayUpdater:
-    def __init__(self, camera: PiCamera, front_layer: int, back_layer: int, **kwargs):
+    def __init__(self, camera: 'PiCamera', front_layer: int, back_layer: int, **kwargs):
         self._camera = camera
         self._front_layer = front_layer
         self._back_layer = back_layer
@@ -37,7 +45,7 @@ def put_text(img, text, position, color, alignment=Alignment.LEFT, scale=None, t
     font = cv.FONT_HERSHEY_SIMPLEX
     font_scale = scale or 0.8
     font_thickness = thickness or 2
-    shadow_offset = 2
+    shadow_offset = SHADOW_OFFSET
     text_size, baseline = cv.getTextSize(text, font, font_scale, font_thickness)
     if alignment == Alignment.LEFT:
         final_position = (position[0], position[1] + text_size[1] // 2)
@@ -0,0 +1,222 @@
+from functools import lru_cache
+import re
+from threading import Condition
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from helper import SHADOW_OFFSET, Alignment, put_text, fill_alpha_channel
+
+FONT = cv.FONT_HERSHEY_SIMPLEX
+# 숫자는 한 글자씩, 나머지는 이어진 부분을 하나의 sprite로 씀
+_RUNS = re.compile(r'\d|\D+')
+
+
+class Sprite(NamedTuple):
+    """미리 그려 둔 글자/도형 조각. 모든 sprite는 cache되어 공유되므로 read-only"""
+    # BGRA. 색이 있는 pixel의 alpha는 255 (fill_alpha_channel과 같음)
+    image: np.ndarray
+    # 그리는 동안 덮어쓴 pixel. put_text의 검은 그림자처럼 투명하게 덮어쓰는 pixel도 포함
+    mask: np.ndarray
+    # 기준 좌표에서 image 왼쪽 위까지의 (dx, dy)
+    offset: Tuple[int, int]
+
+
+def _render(extent: Tuple[int, int], draw: Callable[[np.ndarray, Tuple[int, int]], None]) -> Sprite:
+    """기준 좌표에서 대략 extent(w, h) 안에 그려지는 draw를 작은 canvas에 그려 sprite로 만듦"""
+    pad = 8
+    while True:
+        width, height = 2 * (extent[0] + pad), 2 * (extent[1] + pad)
+        origin = width // 2, height // 2
+        # 배경을 두 가지로 그려 보면 검은색으로 덮어쓴 pixel도 알 수 있음
+        canvases = []
+        for background in (0, 255):
+            canvas = np.full((height, width, 4), background, np.uint8)
+            draw(canvas, origin)
+            canvases.append(canvas)
+        drawn, inverse = canvases
+        # BGRA pixel 하나를 uint32 하나로 비교
+        mask = (drawn.view(np.uint32)[..., 0] != 0) | (inverse.view(np.uint32)[..., 0] != 0xffffffff)
+        if not (mask[0].any() or mask[-1].any() or mask[:, 0].any() or mask[:, -1].any()):
+            break
+        # canvas 경계에 닿았으면 잘렸을 수 있으므로 넓혀서 다시 그림
+        pad *= 2
+
+    ys, xs = np.nonzero(mask)
+    if not len(ys):
+        image, mask, offset = np.zeros((0, 0, 4), np.uint8), np.zeros((0, 0), np.bool_), (0, 0)
+    else:
+        x0, y0, x1, y1 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+        image, mask = drawn[y0:y1, x0:x1].copy(), mask[y0:y1, x0:x1].copy()
+        fill_alpha_channel(image)
+        offset = int(x0) - origin[0], int(y0) - origin[1]
+    image.setflags(write=False)
+    mask.setflags(write=False)
+    return Sprite(image, mask, offset)
+
+
+@lru_cache(maxsize=256)
+def text_sprite(text: str, color: Tuple, alignment=Alignment.LEFT, scale=None, thickness=None,
+                line_type=cv.LINE_8) -> Sprite:
+    """position 기준으로 put_text(img, text, position, ...)가 그리는 것과 같은 sprite"""
+    (text_width, text_height), baseline = cv.getTextSize(text, cv.FONT_HERSHEY_SIMPLEX, scale or 0.8, thickness or 2)
+
+    def draw(canvas, origin):
+        put_text(canvas, text, origin, color, alignment, scale, thickness, line_type)
+
+    return _render((text_width, text_height + baseline), draw)
+
+
+@lru_cache(maxsize=256)
+def run_sprite(text: str, color: Tuple, scale: float, thickness: int, line_type=cv.LINE_8) -> Sprite:
+    """origin 기준으로 cv.putText(img, text, origin, ...)가 그리는 것과 같은 sprite. 그림자 없음"""
+    (text_width, text_height), baseline = cv.getTextSize(text, FONT, scale, thickness)
+
+    def draw(canvas, origin):
+        cv.putText(canvas, text, origin, FONT, scale, color, thickness, line_type)
+
+    return _render((text_width, text_height + baseline), draw)
+
+
+@lru_cache(maxsize=256)
+def text_layout(text: str, scale: float, thickness: int) -> Tuple[Tuple[Tuple[str, int], ...], int, int]:
+    """text를 숫자 한 글자와 그 사이의 label로 나눈 ((run, origin에서 run까지의 x), ...)와 text의 (w, h).
+    run의 x는 앞 글자들의 advance 합으로, `text[:end]` 전체 폭에서 run의 폭을 빼서 구함"""
+    runs = []
+    end = 0
+    for run in _RUNS.findall(text):
+        end += len(run)
+        runs.append((run, cv.getTextSize(text[:end], FONT, scale, thickness)[0][0] -
+                     cv.getTextSize(run, FONT, scale, thickness)[0][0]))
+    (width, height), _ = cv.getTextSize(text, FONT, scale, thickness)
+    return tuple(runs), width, height
+
+
+@lru_cache(maxsize=64)
+def circle_sprite(radius: int, color: Tuple, thickness=1, line_type=cv.LINE_8) -> Sprite:
+    """center 기준으로 cv.circle(img, center, radius, ...)이 그리는 것과 같은 sprite"""
+    extent = radius + max(thickness, 1)
+
+    def draw(canvas, origin):
+        cv.circle(canvas, origin, radius, color, thickness, line_type)
+
+    return _render((extent, extent), draw)
+
+
+class HudCompositor:
+    """sprite를 배치해 text layer를 합성. 전체를 지우고 다시 그리는 대신, 지난번과 달라진
+    sprite가 차지하는 영역만 지우고 그 영역에 걸친 sprite를 순서대로 다시 그림.
+
+    매 tick마다 begin() 후 그리는 순서대로 text()/circle()을 호출하고 commit()으로 반영.
+    내용이 바뀐 경우에만 새 layer를 `published`로 내보내며, 읽는 쪽이 방금 내보낸 layer를
+    복사하는 중일 수 있으므로 `buffers`개의 buffer를 돌아가며 사용.
+    """
+
+    def __init__(self, width: int, height: int, buffers=2):
+        self.width = width
+        self.height = height
+        self._buffers = [np.zeros((height, width, 4), np.uint8) for _ in range(buffers)]
+        # buffer별로 마지막으로 갱신된 이후 바뀐 영역 (x0, y0, x1, y1)
+        self._stale = [[] for _ in range(buffers)]  # type: List[List[Tuple[int, int, int, int]]]
+        self._current = 0
+        self._items = []  # type: List[Tuple[Sprite, int, int]]
+        self._next = []  # type: List[Tuple[Sprite, int, int]]
+        # (version, layer)를 한 번에 교체하여 읽는 쪽이 짝이 맞지 않는 값을 보지 않도록 함
+        self.published = 0, self._buffers[0]
+        self._changed = Condition()
+
+    @property
+    def layer(self) -> np.ndarray:
+        return self.published[1]
+
+    @property
+    def version(self) -> int:
+        return self.published[0]
+
+    def wait_for_version(self, version: int, timeout=None) -> Optional[Tuple[int, np.ndarray]]:
+        """version보다 새로운 layer가 나올 때까지 대기. timeout이 지나면 None"""
+        with self._changed:
+            if not self._changed.wait_for(lambda: self.published[0] > version, timeout):
+                return None
+            return self.published
+
+    def begin(self):
+        self._next = []
+
+    def place(self, sprite: Sprite, position):
+        dx, dy = sprite.offset
+        self._next.append((sprite, int(position[0]) + dx, int(position[1]) + dy))
+
+    def text(self, text, position, color, alignment=Alignment.LEFT, scale=None, thickness=None, line_type=cv.LINE_8):
+        """put_text와 같은 결과. 매 tick 바뀌는 숫자 때문에 문자열마다 새로 그리지 않도록 label과 숫자 한 글자씩의
+        sprite를 이어 붙임"""
+        color = tuple(color)
+        if line_type == cv.LINE_AA:
+            # AA 가장자리는 옆 글자 위에 섞여 그려지므로 나누어 그리면 달라짐
+            self.place(text_sprite(text, color, alignment, scale, thickness, line_type), position)
+            return
+        scale, thickness = scale or 0.8, thickness or 2
+        runs, width, height = text_layout(text, scale, thickness)
+        x, y = int(position[0]), int(position[1]) + height // 2
+        if alignment == Alignment.CENTER:
+            x -= width // 2
+        elif alignment == Alignment.RIGHT:
+            x -= width
+        # put_text처럼 그림자를 모두 그린 뒤 글자를 그림
+        for run_color, offset in (((0, 0, 0), SHADOW_OFFSET), (color, 0)):
+            for run, dx in runs:
+                self.place(run_sprite(run, run_color, scale, thickness, line_type), (x + dx + offset, y + offset))
+
+    def circle(self, center, radius, color, thickness=1, line_type=cv.LINE_8):
+        self.place(circle_sprite(int(radius), tuple(color), thickness, line_type), center)
+
+    def commit(self) -> bool:
+        """새 layer를 내보냈으면 True"""
+        previous, items = self._items, self._next
+        self._items = items
+        if len(previous) == len(items) and all(
+                a[0] is b[0] and a[1:] == b[1:] for a, b in zip(previous, items)):
+            return False
+
+        old = {(id(sprite), x, y): (sprite, x, y) for sprite, x, y in previous}
+        new = {(id(sprite), x, y): (sprite, x, y) for sprite, x, y in items}
+        changed = [old[key] for key in old.keys() - new.keys()] + [new[key] for key in new.keys() - old.keys()]
+        if not changed:
+            # 같은 sprite들의 순서만 바뀐 경우 겹친 부분이 달라질 수 있음
+            changed = items
+        dirty = [rect for rect in map(self._bounds, changed) if rect is not None]
+        if not dirty:
+            return False
+
+        for stale in self._stale:
+            stale.extend(dirty)
+        index = (self._current + 1) % len(self._buffers)
+        buffer = self._buffers[index]
+        for rect in dict.fromkeys(self._stale[index]):
+            self._redraw(buffer, rect)
+        self._stale[index] = []
+        self._current = index
+        with self._changed:
+            self.published = self.version + 1, buffer
+            self._changed.notify_all()
+        return True
+
+    def _bounds(self, item):
+        sprite, x, y = item
+        height, width = sprite.mask.shape
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+    def _redraw(self, buffer: np.ndarray, rect):
+        x0, y0, x1, y1 = rect
+        buffer[y0:y1, x0:x1] = 0
+        for sprite, x, y in self._items:
+            height, width = sprite.mask.shape
+            ix0, iy0 = max(x0, x), max(y0, y)
+            ix1, iy1 = min(x1, x + width), min(y1, y + height)
+            if ix0 >= ix1 or iy0 >= iy1:
+                continue
+            np.copyto(buffer[iy0:iy1, ix0:ix1], sprite.image[iy0 - y:iy1 - y, ix0 - x:ix1 - x],
+                      where=sprite.mask[iy0 - y:iy1 - y, ix0 - x:ix1 - x, None])
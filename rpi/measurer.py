@@ -1,13 +1,15 @@
 from enum import Enum, IntEnum, auto
-from time import time, sleep
-from threading import Thread
+from time import time
+from typing import Callable, Optional
+from threading import Thread, Condition
 
 import cv2 as cv
 import numpy as np
 from numpy.linalg import norm
-import requests
 
-from helper import Alignment, put_text, fill_alpha_channel
+from filters import KeypointsFilter
+from helper import Alignment
+from hud import HudCompositor
 
 
 class Mode(Enum):
@@ -48,8 +50,10 @@ class Keypoint(IntEnum):
 
 
 class BodyBalanceMeasurer:
-    def __init__(self, processor, config):
+    def __init__(self, processor, config, clock: Callable[[], float] = time):
         self.config = config
+        # 기록을 재생할 때는 재생 중인 시각을 씀
+        self.clock = clock
         cam_config = config.picamera
         cam_resolution = cam_config.resolution
         self._terminated = False
@@ -57,9 +61,9 @@ class BodyBalanceMeasurer:
         self.resolution = cam_resolution.width, cam_resolution.height
         self.framerate = cam_config.framerate
         self.border_margin = round(max(self.resolution) * 0.025)
-        self._text_plate = np.zeros((cam_resolution.height, cam_resolution.width, 4), np.uint8)
-        self.text_layer = self._text_plate.copy()
+        self.hud = HudCompositor(cam_resolution.width, cam_resolution.height)
 
+        self._state = Mode.Idle
         self.state = Mode.Idle
         self.anchor_keypoint = None
         self.measuring_start_time = None
@@ -75,11 +79,59 @@ class BodyBalanceMeasurer:
 
         self.user_id = ''
 
+        # 한 frame짜리 jitter로 Abnormal이 되지 않도록 첫 번째 사람의 keypoints를 시간축으로 filtering
+        self.keypoints_filter = KeypointsFilter(**config.measurer.filter._asdict())
+        self._filtered_sequence = -1
+        self._pose_keypoints = None
+
+        # 새 keypoints가 발행되거나 외부에서 상태를 바꾸면 깨어남. 처음 한 번은 바로 그림
+        self._wakeup = Condition()
+        self._woken = True
+        # 한 번 상태를 계산할 때마다 반영한 snapshot의 sequence
+        self._measured = Condition()
+        self.measured_sequence = -1
+        # 측정 시작 (user_id, 시각), 측정 결과 (user_id, score, elapsed, Mode)
+        self._start_listeners = []
+        self._score_listeners = []
+        processor.add_keypoints_listener(self.wake)
         self._worker = Thread(target=self._measure_loop, name='body_balance_measerer')
         self._worker.start()
 
+    @property
+    def state(self) -> Mode:
+        return self._state
+
+    @state.setter
+    def state(self, state: Mode):
+        # 상태에 따라 서버에 보내는 frame 주기가 달라짐
+        self._state = state
+        self.processor.set_mode(state)
+
+    @property
+    def text_layer(self) -> np.ndarray:
+        return self.hud.layer
+
+    def wake(self):
+        with self._wakeup:
+            self._woken = True
+            self._wakeup.notify()
+
+    def add_start_listener(self, listener: Callable[[str, float], None]):
+        self._start_listeners.append(listener)
+
+    def add_score_listener(self, listener: Callable[[str, int, float, Mode], None]):
+        """Normal 또는 Abnormal이 된 tick에 measurer thread에서 호출됨. 화면 갱신이 멈추지 않도록
+        오래 걸리는 일(점수 업로드 등)은 다른 thread에 넘겨야 함"""
+        self._score_listeners.append(listener)
+
+    def wait_measured(self, sequence: int, timeout=None) -> bool:
+        """sequence번째 snapshot까지 상태에 반영될 때까지 대기"""
+        with self._measured:
+            return self._measured.wait_for(lambda: self.measured_sequence >= sequence or self._terminated, timeout)
+
     def close(self):
         self._terminated = True
+        self.wake()
         self._worker.join()
     
     def reset(self):
@@ -97,82 +149,106 @@ class BodyBalanceMeasurer:
     def start_measuring(self, user_id) -> bool:
         """시작 성공 여부를 True/False로 반환. 측정 시작했는데 keypoints가 없는 경우 시작 불가"""
         # TODO: 측정 시작했는데 pose_keypoints가 None인 경우 처리
-        pose_keypoints = self.processor.keypoints
+        pose_keypoints = self._pose_keypoints
         if pose_keypoints is None:
             return False
-        pose_keypoints = pose_keypoints[0]
         self.user_id = user_id
-        self.measuring_start_time = time()
+        self.measuring_start_time = self.clock()
         self.anchor_keypoint = max(Keypoint.LAnkle, Keypoint.RAnkle, key=lambda k: pose_keypoints[k, 1])
         self.start_anchor = pose_keypoints[self.anchor_keypoint, :2]
         self.deviation_threshold = int(norm(pose_keypoints[Keypoint.Nose, :2] - self.start_anchor) * 0.05)
         self.state = Mode.Measuring
+        for listener in self._start_listeners:
+            listener(user_id, self.measuring_start_time)
+        self.wake()
         return True
 
+    def _filter_keypoints(self) -> Optional[np.ndarray]:
+        """새로 발행된 keypoints를 filter에 반영한 첫 번째 사람의 (25, 3) 추정값. 사람이 없으면 None"""
+        snapshot = self.processor.snapshot
+        if snapshot.sequence != self._filtered_sequence:
+            self._filtered_sequence = snapshot.sequence
+            if snapshot.keypoints is None:
+                self.keypoints_filter.reset()
+                self._pose_keypoints = None
+            else:
+                self._pose_keypoints = self.keypoints_filter(snapshot.timestamp, snapshot.keypoints[0])
+        return self._pose_keypoints
+
+    def _next_deadline(self, now: float) -> Optional[float]:
+        """새 keypoints가 들어오지 않아도 상태를 다시 계산해야 하는 시각"""
+        if self.state == Mode.Measuring:
+            # 화면의 경과 시간(0.1초 단위)이나 점수가 바뀌는 시각, 늦어도 normal_sec 만료 시각.
+            # camera framerate보다 자주 그리지는 않음
+            step = max(min(0.1, self.normal_sec / 100), 1 / self.framerate)
+            elapsed = now - self.measuring_start_time
+            return self.measuring_start_time + min((elapsed // step + 1) * step, self.normal_sec)
+        if self.state == Mode.Normal or self.state == Mode.Abnormal:
+            return self.score_timeout + self.score_popup_timeout
+        return None
+
     def _measure_loop(self):
-        config = self.config
+        deadline = None
+
+        while True:
+            # 새 keypoints가 발행되거나 deadline이 될 때까지 대기
+            with self._wakeup:
+                timeout = None if deadline is None else max(deadline - self.clock(), 0)
+                self._wakeup.wait_for(lambda: self._woken, timeout)
+                self._woken = False
+            if self._terminated:
+                break
+            self._tick()
+            with self._measured:
+                self.measured_sequence = self._filtered_sequence
+                self._measured.notify_all()
+            deadline = self._next_deadline(self.clock())
+
+    def _tick(self):
+        """새 keypoints를 반영해 상태를 한 번 계산하고 HUD를 그림"""
         w, h = self.resolution
-        frame_interval = 1 / self.framerate
-        plate = self._text_plate
+        hud = self.hud
         border_margin = self.border_margin
+        pose_keypoints = self._filter_keypoints()
 
-        while not self._terminated:
-            start = time()
-            pose_keypoints = self.processor.keypoints
-
-            if pose_keypoints is None:
-                self.state = Mode.NotDetected
-            else:
-                pose_keypoints = pose_keypoints[0]
-            
-            plate.fill(0)
-            put_text(plate, self.state.name, (border_margin, border_margin), (0, 255, 0))
-
-            if self.state == Mode.Idle:
-                pass
-            elif self.state == Mode.NotDetected:
+        if pose_keypoints is None:
+            self.state = Mode.NotDetected
+        
+        # 내용이 바뀐 sprite의 영역만 다시 그려짐
+        hud.begin()
+        hud.text(self.state.name, (border_margin, border_margin), (0, 255, 0))
+
+        if self.state == Mode.Idle:
+            pass
+        elif self.state == Mode.NotDetected:
+            self.state = Mode.Idle
+        elif self.state == Mode.Measuring:
+            now = self.clock()
+            self.elapsed = now - self.measuring_start_time
+            self.score = int(self.elapsed / self.normal_sec * 100)
+            if self.elapsed >= self.normal_sec:
+                self.score_timeout = now
+                self.state = Mode.Normal
+            # check abnormality
+            current_anchor = pose_keypoints[self.anchor_keypoint, :2]
+            deviation = norm(current_anchor - self.start_anchor)
+            if deviation > self.deviation_threshold:
+                self.score_timeout = now
+                self.state = Mode.Abnormal
+            if self.state != Mode.Measuring:
+                for listener in self._score_listeners:
+                    listener(self.user_id, self.score, self.elapsed, self.state)
+            x, y = current_anchor
+            hud.text(f'{self.elapsed:.1f} s / id: {self.user_id}', (border_margin, h - border_margin), (255, 255, 255))
+            hud.text(f'score: {self.score}', (w - border_margin, h - border_margin), (255, 255, 255), Alignment.RIGHT)
+
+            hud.circle(self.start_anchor, self.deviation_threshold, (0, 255, 0), 2)
+            hud.circle((x, y), 10, (0, 0, 255), -1)
+            hud.text('anchor', (int(x) + border_margin, int(y)), (0, 0, 255))
+        elif self.state == Mode.Normal or self.state == Mode.Abnormal:
+            hud.text(f'SCORE: {self.score}', (w // 2, h // 2), (0, 0, 255), Alignment.CENTER, 5, 8, cv.LINE_AA)
+            if self.clock() - self.score_timeout >= self.score_popup_timeout:
+                self.reset()
                 self.state = Mode.Idle
-            elif self.state == Mode.Measuring:
-                self.elapsed = time() - self.measuring_start_time
-                self.score = int(self.elapsed / self.normal_sec * 100)
-                if self.elapsed >= self.normal_sec:
-                    self.score_timeout = time()
-                    self.state = Mode.Normal
-                # check abnormality
-                current_anchor = pose_keypoints[self.anchor_keypoint, :2]
-                deviation = norm(current_anchor - self.start_anchor)
-                if deviation > self.deviation_threshold:
-                    self.score_timeout = time()
-                    self.state = Mode.Abnormal
-                x, y = current_anchor
-                put_text(plate, f'{self.elapsed:.1f} s / id: {self.user_id}', (border_margin, h - border_margin), (255, 255, 255))
-                put_text(plate, f'score: {self.score}', (w - border_margin, h - border_margin), (255, 255, 255), Alignment.RIGHT)
-
-                cv.circle(plate, tuple(self.start_anchor), self.deviation_threshold, (0, 255, 0), 2)
-                cv.circle(plate, (x, y), 10, (0, 0, 255), -1)
-                put_text(plate, 'anchor', (int(x) + border_margin, int(y)), (0, 0, 255))
-            elif self.state == Mode.Normal or self.state == Mode.Abnormal:
-                put_text(plate, f'SCORE: {self.score}', (w // 2, h // 2), (0, 0, 255), Alignment.CENTER, 5, 8, cv.LINE_AA)
-                if time() - self.score_timeout >= self.score_popup_timeout:
-                    params = {
-                        'user_seq': self.user_id,
-                        'module_type': config.database.module_type,
-                        'score_1': self.score,
-                        'score_2': f'{self.elapsed:.3f}'
-                    }
-                    try:
-                        res = requests.post(f'{config.database.url}/scores/save', json=params, timeout=5)
-                        res.raise_for_status()
-                    except requests.exceptions.Timeout:
-                        print('Timeout error raised while posting data to database')
-                    except requests.exceptions.HTTPError as e:
-                        print(f'Unsuccessful status code: {e}')
-                    self.reset()
-                    self.state = Mode.Idle
-            
-            fill_alpha_channel(plate)
-            self.text_layer = plate.copy()
-
-            elapsed = time() - start
-            if elapsed < frame_interval:
-                sleep(frame_interval - elapsed)
+        
+        hud.commit()
@@ -0,0 +1,146 @@
+"""처리 단계별 시간 분포와 counter를 모아 Prometheus text format으로 내보냄.
+
+관측 한 번은 bucket 경계에 대한 bisect와 정수 증가뿐이므로 frame마다 호출해도 됨.
+"""
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# 0.5 ms ~ 5 s (초)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75,
+                   1.0, 2.0, 5.0)
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+class Histogram:
+    """누적 bucket 대신 bucket별 개수만 세고, 내보낼 때 누적함"""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        # 마지막 칸은 가장 큰 경계를 넘은 값 (+Inf)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """bucket 안에서 선형 보간한 q 분위수. 관측값이 없으면 None"""
+        with self._lock:
+            counts, total = list(self._counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                # +Inf bucket은 가장 큰 경계로 표시
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self._sum / self.count if self.count else None
+
+    def render(self) -> List[str]:
+        with self._lock:
+            counts, total, sum_ = list(self._counts), self.count, self._sum
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {total}')
+        lines.append(f'{self.name}_sum {sum_:.6f}')
+        lines.append(f'{self.name}_count {total}')
+        return lines
+
+
+class Counter:
+    """label 값의 tuple별로 따로 세는 counter"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        self._values = {}  # type: Dict[Tuple, float]
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{_labels(self.labels, key)} {value:g}' for key, value in values)
+        return lines
+
+
+class Gauge:
+    """내보낼 때 `read()`로 현재 값을 읽음. label이 있으면 read()는 {label 값: 값}을 반환해야 함.
+    다른 곳에서 이미 세고 있는 값(queue 길이, drop 수 등)을 그대로 노출할 때 사용"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Union[float, Dict]], label: Optional[str] = None,
+                 type='gauge'):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label = label
+        self.type = type
+
+    def render(self) -> List[str]:
+        value = self.read()
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        if self.label is None:
+            lines.append(f'{self.name} {value:g}')
+        else:
+            lines.extend(f'{self.name}{{{self.label}="{key}"}} {item:g}' for key, item in value.items())
+        return lines
+
+
+class Registry:
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = []  # type: List[Union[Histogram, Counter, Gauge]]
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, buckets))
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Union[float, Dict]], label: Optional[str] = None,
+              type='gauge') -> Gauge:
+        return self._add(Gauge(self.prefix + name, help, read, label, type))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """GET /metrics 응답 본문"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,42 @@
+from typing import Optional
+
+import cv2 as cv
+import numpy as np
+
+
+class MotionDetector:
+    """JPEG frame을 1/8 크기 grayscale로 decode하여 이전에 확인한 frame과의 차이로 움직임을 감지.
+
+    JPEG decoder가 DCT 단계에서 바로 축소하므로 전체 해상도로 decode하는 것보다 훨씬 가벼움.
+    `interval`초에 한 번만 확인하며, 밝기가 `threshold` 이상 바뀐 pixel이 `min_area` 비율을 넘으면 움직임으로 판단.
+    """
+
+    def __init__(self, threshold=12, min_area=0.005, interval=0.2):
+        self.threshold = threshold
+        self.min_area = min_area
+        self.interval = interval
+        self._checked = 0.0
+        self._previous = None  # type: Optional[np.ndarray]
+        self._diff = None  # type: Optional[np.ndarray]
+
+    def reset(self):
+        """한동안 확인하지 않은 경우 오래된 frame과 비교하지 않도록 버림"""
+        self._previous = None
+
+    def update(self, timestamp: float, jpeg) -> bool:
+        if timestamp - self._checked < self.interval:
+            return False
+        self._checked = timestamp
+        small = cv.imdecode(np.frombuffer(jpeg, np.uint8), cv.IMREAD_REDUCED_GRAYSCALE_8)
+        if small is None:
+            return False
+        # sensor noise로 인한 한 pixel짜리 변화는 무시
+        small = cv.blur(small, (3, 3))
+        previous, self._previous = self._previous, small
+        if previous is None or previous.shape != small.shape:
+            return False
+        if self._diff is None or self._diff.shape != small.shape:
+            self._diff = np.empty_like(small)
+        cv.absdiff(small, previous, self._diff)
+        changed = np.count_nonzero(self._diff >= self.threshold)
+        return changed >= self.min_area * small.size
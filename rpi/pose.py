@@ -1,5 +1,6 @@
 import math
-from typing import Tuple
+from functools import lru_cache
+from typing import Optional, Tuple
 
 import cv2 as cv
 import numpy as np
@@ -15,63 +16,116 @@ BODY_25_COLORS = [(255, 0, 85), (255, 0, 0), (255, 85, 0), (255, 170, 0), (255,
                   (0, 0, 255), (255, 0, 170), (170, 0, 255), (255, 0, 255), (85, 0, 255), (0, 0, 255), (0, 0, 255),
                   (0, 0, 255), (0, 255, 255), (0, 255, 255), (0, 255, 255)]
 
+_PAIRS = np.array(BODY_25_PAIRS)
+
+
+def _group_parts(parts):
+    """같은 색, 같은 scale끼리 묶어 OpenCV 호출 한 번에 그릴 수 있도록 함.
+    (BGR color, BGRA color, scale, part index 배열)의 list"""
+    groups = {}
+    for index, part in enumerate(parts):
+        key = BODY_25_COLORS[part], BODY_25_SCALES[part % len(BODY_25_SCALES)]
+        groups.setdefault(key, []).append(index)
+    return [(color[::-1], color[::-1] + (255,), scale, np.array(indices))
+            for (color, scale), indices in groups.items()]
+
+
+# 선은 뒤쪽 part(j)의 색, 원은 자기 part의 색으로 그림
+_LINE_GROUPS = _group_parts(_PAIRS[:, 1])
+_LINE_SCALES = np.array([scale for _, _, scale, _ in _LINE_GROUPS])
+_COLORS_BGR = np.array([color[::-1] for color in BODY_25_COLORS], np.uint8)
+_COLORS_BGRA = np.concatenate([_COLORS_BGR, np.full((len(BODY_25_COLORS), 1), 255, np.uint8)], axis=1)
+
+
+@lru_cache(maxsize=64)
+def _circle_offsets(radius: int, thickness: int) -> np.ndarray:
+    """cv.circle이 (0, 0)을 중심으로 칠하는 pixel들의 (x, y) offset.
+    정수 중심의 원은 위치와 무관하게 같은 모양이므로 미리 한 번만 그려 둠"""
+    half = radius + thickness + 1
+    stamp = np.zeros((2 * half + 1, 2 * half + 1), np.uint8)
+    cv.circle(stamp, (half, half), radius, 255, thickness)
+    ys, xs = np.nonzero(stamp)
+    return np.stack([xs - half, ys - half], axis=1)
+
+
+def _draw_circles(frame: np.ndarray, centers: np.ndarray, colors: np.ndarray, radius: int, thickness: int):
+    """centers 순서대로 cv.circle을 호출한 것과 같은 결과를 numpy 대입 한 번으로 그림"""
+    height, width = frame.shape[:2]
+    offsets = _circle_offsets(radius, thickness)
+    xy = (centers[:, None, :] + offsets[None]).reshape(-1, 2)
+    colors = np.repeat(colors, len(offsets), axis=0)
+    inside = (xy[:, 0] >= 0) & (xy[:, 0] < width) & (xy[:, 1] >= 0) & (xy[:, 1] < height)
+    frame[xy[inside, 1], xy[inside, 0]] = colors[inside]
+
+
+def get_keypoints_rectangles(keypoints: np.ndarray, threshold) -> np.ndarray:
+    """(people, parts, 3) keypoints에서 사람별 (x, y, w, h). threshold를 넘는 part가 없으면 0"""
+    valid = keypoints[..., 2] > threshold
+    xy = keypoints[..., :2]
+    mins = np.where(valid[..., None], xy, np.inf).min(axis=1)
+    maxs = np.where(valid[..., None], xy, -np.inf).max(axis=1)
+    rectangles = np.concatenate([mins, maxs - mins], axis=1)
+    rectangles[~valid.any(axis=1)] = 0
+    return rectangles
+
 
 def get_keypoints_rectangle(person: np.ndarray, threshold) -> Tuple:
-    type_info = np.finfo(person.dtype)
-    min_x = type_info.max
-    max_x = type_info.min
-    min_y = min_x
-    max_y = max_x
-
-    for part in person:
-        score = part[2]
-        if score > threshold:
-            x, y = part[:2]
-            # Set X
-            if max_x < x: max_x = x
-            if min_x > x: min_x = x
-            # Set Y
-            if max_y < y: max_y = y
-            if min_y > y: min_y = y
-
-    return min_x, min_y, max_x - min_x, max_y - min_y if max_x >= min_x and max_y >= min_y else (0, 0, 0, 0)
-
-
-def render_keypoints(frame: np.ndarray, keypoints: np.ndarray, threshold=0.05):
+    return tuple(get_keypoints_rectangles(person[None], threshold)[0])
+
+
+def render_keypoints(frame: np.ndarray, keypoints: np.ndarray, threshold=0.05) -> Optional[Tuple[int, int, int, int]]:
+    """BGR, BGRA frame 모두 지원. BGRA인 경우 그려진 pixel의 alpha는 255.
+    그려진 pixel을 모두 포함하는 (x, y, w, h)를 반환하며, 아무것도 그리지 않았으면 None"""
     height, width = frame.shape[:2]
     area = width * height
-    # frame_bgr = frame.astype(np.float32)
+    bgra = frame.ndim == 3 and frame.shape[2] == 4
+    colors = _COLORS_BGRA if bgra else _COLORS_BGR
 
     # Parameters
-    number_scales = len(BODY_25_SCALES)
     threshold_rectangle = 0.1
 
-    # Keypoints
-    for person in keypoints:
-        x, y, w, h = get_keypoints_rectangle(person, threshold_rectangle)
-        if w * h > 0:
-            ratio_area = min(1, max(w / width, h / height))
-            # Size-dependant variables
-            thickness_ratio = max(round(math.sqrt(area) * thickness_circle_ratio * ratio_area), 2)
-            thickness_circle = max(1, thickness_ratio if ratio_area > 0.05 else -1)
-            thickness_line = max(1, round(thickness_ratio * thickness_line_ratio_wrt_circle))
-            radius = thickness_ratio / 2
-
-            # Draw lines
-            for i, j in BODY_25_PAIRS:
-                kp1, kp2 = person[i], person[j]
-                if kp1[2] > threshold and kp2[2] > threshold:
-                    thickness_line_scaled = int(round(thickness_line * BODY_25_SCALES[j % number_scales]))
-                    color = BODY_25_COLORS[j][::-1]
-                    p1 = int(round(kp1[0])), int(round(kp1[1]))
-                    p2 = int(round(kp2[0])), int(round(kp2[1]))
-                    cv.line(frame, p1, p2, color, thickness_line_scaled)
-
-            # Draw Circles
-            for i, part in enumerate(person):
-                if part[2] > threshold:
-                    radius_scaled = int(round(radius * BODY_25_SCALES[i % number_scales]))
-                    thickness_circle_scaled = int(round(thickness_circle * BODY_25_SCALES[i % number_scales]))
-                    color = BODY_25_COLORS[i][::-1]
-                    center = int(round(part[0])), int(round(part[1]))
-                    cv.circle(frame, center, radius_scaled, color, thickness_circle_scaled)
+    # Size-dependant variables
+    rectangles = get_keypoints_rectangles(keypoints, threshold_rectangle)
+    ratio_area = np.minimum(1, np.maximum(rectangles[:, 2] / width, rectangles[:, 3] / height))
+    thickness_ratio = np.maximum(np.rint(math.sqrt(area) * thickness_circle_ratio * ratio_area), 2)
+    thickness_line = np.maximum(1, np.rint(thickness_ratio * thickness_line_ratio_wrt_circle))
+    radius = thickness_ratio / 2
+
+    thickness_lines = np.rint(thickness_line[:, None] * _LINE_SCALES).astype(int)
+    thickness_circle = np.where(ratio_area > 0.05, thickness_ratio, 1).astype(int)
+    radius = np.rint(radius).astype(int)
+
+    points = np.rint(keypoints[..., :2]).astype(np.int32)
+    visible = keypoints[..., 2] > threshold
+    segments = points[:, _PAIRS]
+    segments_visible = visible[:, _PAIRS[:, 0]] & visible[:, _PAIRS[:, 1]]
+    drawn = rectangles[:, 2] * rectangles[:, 3] > 0
+
+    for person, line_thickness, radius_person, circle_thickness in zip(
+            np.flatnonzero(drawn).tolist(), thickness_lines[drawn].tolist(),
+            radius[drawn].tolist(), thickness_circle[drawn].tolist()):
+        # Draw lines
+        person_segments = segments[person]
+        person_visible = segments_visible[person]
+        for (color, color_bgra, _, indices), thickness in zip(_LINE_GROUPS, line_thickness):
+            indices = indices[person_visible[indices]]
+            if indices.size:
+                cv.polylines(frame, person_segments[indices], False, color_bgra if bgra else color, thickness)
+
+        # Draw circles
+        parts = np.flatnonzero(visible[person])
+        if parts.size:
+            _draw_circles(frame, points[person, parts], colors[parts], radius_person, circle_thickness)
+
+    # 그려진 관절 좌표 범위를 선 두께의 절반, 원의 바깥 둘레 중 큰 쪽만큼 넓히면 그려진 pixel을 모두 포함
+    visible &= drawn[:, None]
+    if not visible.any():
+        return None
+    margins = np.maximum(thickness_lines.max(axis=1, initial=0) // 2, radius + thickness_circle) + 1
+    margins = np.broadcast_to(margins[:, None, None], points.shape)[visible]
+    drawn_points = points[visible]
+    x0, y0 = np.maximum((drawn_points - margins).min(axis=0), 0).tolist()
+    x1, y1 = np.minimum((drawn_points + margins + 1).max(axis=0), (width, height)).tolist()
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
@@ -1,23 +1,70 @@
 from collections import deque
-from copy import deepcopy
+import socket
 from threading import Thread, Lock, Condition
-from time import time, sleep
-from typing import Optional, Tuple
-from io import BytesIO
+from time import time
+from typing import Callable, NamedTuple, Optional, Tuple
+import json
 
 import requests
-from simplejson.errors import JSONDecodeError
 import numpy as np
 
+import codec
+from dispatch import AdaptiveDispatcher
+from frames import Frame, FramePool, FrameAssembler, FrameTrace, ServerTiming
+from metrics import Registry
+from motion import MotionDetector
+from roi import Roi, RoiCropper
+from transport import StreamExtractor
+
+
+class KeypointsSnapshot(NamedTuple):
+    """FrameProcessor가 발행한 결과. 수정할 수 없으므로 lock이나 복사 없이 그대로 읽으면 됨"""
+    timestamp: float
+    keypoints: Optional[np.ndarray]
+    sequence: int
+    # 발행한 시각
+    published: float = 0.0
+
+
+def parse_keypoints(content_type: str, body: bytes) -> Optional[np.ndarray]:
+    # binary 응답은 복사 없이 np.frombuffer로, 그 외에는 기존 JSON으로 처리
+    if codec.is_binary(content_type):
+        return codec.decode(body)
+    data = json.loads(body)
+    return np.array(data['keypoints'], np.float32) if data['code'] == 0 else None
+
+
+def parse_process_time(headers) -> Optional[float]:
+    """서버가 X-Process-Time으로 알려준 decode + inference 시간(초)"""
+    try:
+        return float(headers['X-Process-Time'])
+    except (KeyError, ValueError):
+        return None
+
+
+def frame_headers(trace_id: int, timestamp: float, budget: float) -> dict:
+    """서버가 기한(budget초) 안에 처리할 수 없거나 같은 station의 더 최신 frame이 있으면 추론하지 않고 410으로 답함"""
+    return {'X-Trace-Id': str(trace_id), 'X-Frame-Time': f'{timestamp:.6f}', 'X-Budget-Ms': f'{budget * 1000:.0f}'}
+
+
+def parse_server_timing(headers) -> Optional[ServerTiming]:
+    """X-Server-Time을 보내지 않는 이전 서버면 None"""
+    try:
+        return ServerTiming(float(headers.get('X-Queue-Time', 0)), float(headers.get('X-Decode-Time', 0)),
+                            float(headers.get('X-Inference-Time', 0)), float(headers['X-Server-Time']))
+    except (KeyError, ValueError):
+        return None
+
 
 class KeypointsExtractor(Thread):
-    def __init__(self, server_url, owner, name, reqeust_timeout=1):
+    def __init__(self, server_url, owner, name, reqeust_timeout=1, keypoints_format='f32'):
         super(KeypointsExtractor, self).__init__()
         self.name = name
         self.terminated = False
         self.url = server_url
         self.owner = owner
         self.sess = requests.Session()
+        self.sess.headers['Accept'] = codec.accept_header(keypoints_format)
         self.reqeust_timeout = reqeust_timeout
         self.start()
     
@@ -28,62 +75,337 @@ class KeypointsExtractor(Thread):
         timeout = self.reqeust_timeout
 
         while not self.terminated:
-            with owner._condition:
-                owner._condition.wait_for(lambda: owner._recent_frame[1] is not None)
-                timestamp, frame = owner._recent_frame
-                owner._recent_frame = timestamp, None
+            frame = owner._take_frame(timeout=0.5)
+            if frame is None:
+                continue
+            # release 이후에는 frame이 재사용되므로 timestamp, trace id와 roi를 먼저 보관
+            timestamp, trace_id, roi = frame.timestamp, frame.trace_id, frame.roi
 
+            sent = time()
             try:
-                res = sess.post(url, files={'frame': frame}, timeout=timeout)
-                data = res.json()
-            except (requests.exceptions.Timeout, JSONDecodeError) as e:
+                # 응답을 timeout까지만 기다리므로 그 이후의 결과는 서버에서도 필요 없음
+                res = sess.post(url, files={'frame': frame.data},
+                                headers={**frame_headers(trace_id, timestamp, timeout), **owner.station_headers},
+                                timeout=timeout)
+                if res.status_code == 410:
+                    owner._discard(shed=True)
+                    continue
+                # 503/504 등의 오류 응답을 "사람 없음"으로 발행하지 않음
+                res.raise_for_status()
+                keypoints = parse_keypoints(res.headers.get('Content-Type', ''), res.content)
+            except (requests.exceptions.RequestException, ValueError) as e:
                 print(self.name, e)
+                owner._discard()
                 continue
-    
-            keypoints = np.array(data['keypoints'], np.float32) if data['code'] == 0 else None
-            # issue: keypoints에 스칼라값이 들어가는 문제
-            if keypoints is not None and not keypoints.shape:
-                keypoints = None
-            # end of issue
-            with owner._lock:
-                # 현재 처리 결과가 최신인 경우에만. 즉, 이전의 timestamp(keypoints[0])보다
-                # 지금 처리한 frame의 timestamp가 더 큰 경우에만 인정
-                if owner._timestamp_and_keypoints[0] < timestamp:
-                    owner._timestamp_and_keypoints = timestamp, keypoints
+            finally:
+                frame.release()
+            owner._publish(timestamp, keypoints, time() - sent, parse_process_time(res.headers), roi,
+                           FrameTrace(trace_id, timestamp, sent, parse_server_timing(res.headers)))
 
 
 class FrameProcessor:
-    def __init__(self, server_url, workers=4):
-        self.__stream = BytesIO()
+    def __init__(self, server_url, workers=4, keypoints_format='f32', transport='http', stream_url=None,
+                 engine='threads', frame_capacity=1 << 20, target_age=0.15, mode_rates=None,
+                 motion: Optional[MotionDetector] = None, motion_hold=3.0, cropper: Optional[RoiCropper] = None,
+                 station_id: Optional[str] = None):
         self._condition = Condition()
-        self._recent_frame = time(), None
-        self.__pools = [KeypointsExtractor(server_url, self, f'keypoints_extractor-{i}') for i in range(workers)]
+        self._recent_frame = None  # type: Optional[Frame]
+        self.dispatcher = AdaptiveDispatcher(workers, target_age)
+        self._frame_listeners = []
+        # 업로드 중인 frame(workers개) + 최신 frame + 조립 중인 frame
+        self._frame_pool = FramePool(workers + 2, frame_capacity)
+        self._assembler = FrameAssembler(self._frame_pool, self._on_frame, self._acquire_frame)
         self._lock = Lock()
-        self._timestamp_and_keypoints = time(), None
+        # 새 결과를 기다리는 consumer를 깨우기 위한 condition. 발행하는 쪽에서만 lock을 잡음
+        self._published = Condition(self._lock)
+        self._snapshot = KeypointsSnapshot(time(), None, 0)
+        self._started = self._snapshot.timestamp
+        # measurer 상태(Mode 이름)별 초당 추론 횟수. 없거나 None이면 제한 없음
+        self.mode_rates = mode_rates or {}
+        self._mode_interval = 0.0
+        # 서버가 station별로 공평하게, 측정 중인 station을 먼저 처리할 수 있도록 요청마다 보냄
+        self.station_id = station_id or socket.gethostname()
+        self._mode_name = ''
+        self._session_id = ''
+        self.station_headers = self._station_headers()
+        # 추론 주기를 낮춘 동안 움직임이 감지되면 motion_hold초 동안 제한 없이 추론
+        self.motion = motion
+        self.motion_hold = motion_hold
+        self._boost_until = 0.0
+        self._keypoints_listeners = []
+        # 마지막 keypoints 주변만 잘라서 업로드
+        self.cropper = cropper
+        self.bytes_uploaded = 0
+        self.uploads_failed = 0
+        # ROI를 자르다 실패해서 원본 그대로 올린 frame
+        self.crops_failed = 0
+        # 더 최신 결과가 이미 발행되어 버린 결과
+        self.results_stale = 0
+        # 서버가 기한이 지났거나 더 최신 frame이 있어 추론하지 않은 frame
+        self.frames_shed = 0
+        # 최근 frame들의 처리 단계별 시각. GET /traces
+        self.traces = deque(maxlen=256)
+        self.metrics = Registry('bbm_')
+        self._init_metrics()
+        if transport == 'stream':
+            # 하나의 연결에서 workers 개의 frame을 동시에 처리
+            self.__pools = [StreamExtractor(stream_url, self, 'stream_extractor', max_in_flight=workers)]
+        elif transport == 'http' and engine == 'asyncio':
+            # aiohttp는 asyncio engine에서만 필요
+            from async_extractor import AsyncKeypointsExtractor
+            self.__pools = [AsyncKeypointsExtractor(server_url, self, 'async_keypoints_extractor', concurrency=workers,
+                                                    keypoints_format=keypoints_format)]
+        elif transport == 'http':
+            self.__pools = [KeypointsExtractor(server_url, self, f'keypoints_extractor-{i}', keypoints_format=keypoints_format)
+                            for i in range(workers)]
+        else:
+            raise ValueError(f'Unknown transport: {transport}')
     
+    def _init_metrics(self):
+        metrics = self.metrics
+        self.capture_to_upload = metrics.histogram('capture_to_upload_seconds',
+                                                   'Frame complete to upload start (sampling, dispatch, crop)')
+        self.rtt = metrics.histogram('rtt_seconds', 'Upload start to response')
+        self.network = metrics.histogram('network_seconds', 'Round trip minus the time spent in the server')
+        self.server_queue = metrics.histogram('server_queue_seconds', 'Waiting for an inference worker')
+        self.server_decode = metrics.histogram('server_decode_seconds', 'JPEG decode on the server')
+        self.server_inference = metrics.histogram('server_inference_seconds', 'Inference on the server')
+        self.capture_to_publish = metrics.histogram('capture_to_publish_seconds', 'Keypoints age when published')
+        dispatcher = self.dispatcher
+        metrics.gauge('frames_dropped_total', 'Frames or results thrown away, by stage', lambda: {
+            # pool에 빈 buffer가 없거나 capacity를 넘은 frame
+            'assemble': self._assembler.dropped,
+            'sampling': dispatcher.frames_dropped - dispatcher.frames_superseded,
+            'superseded': dispatcher.frames_superseded,
+            'upload': self.uploads_failed,
+            'stale': self.results_stale,
+            'shed': self.frames_shed,
+        }, label='stage', type='counter')
+        metrics.gauge('frames_captured_total', 'Frames assembled from the camera stream',
+                      lambda: dispatcher.frames_captured, type='counter')
+        metrics.gauge('requests_sent_total', 'Uploads started', lambda: dispatcher.requests_sent, type='counter')
+        metrics.gauge('bytes_uploaded_total', 'JPEG bytes uploaded', lambda: self.bytes_uploaded, type='counter')
+        metrics.gauge('crops_failed_total', 'Frames uploaded uncropped because the ROI crop failed',
+                      lambda: self.crops_failed, type='counter')
+        metrics.gauge('in_flight', 'Uploads waiting for a response', lambda: dispatcher.in_flight)
+        metrics.gauge('keypoint_age_seconds', 'Age of the newest published keypoints', lambda: self.keypoint_age)
+
     def write(self, buf: bytes):
-        if buf.startswith(b'\xff\xd8') and self.__stream.tell() > 0:
-            with self._condition:
-                self._recent_frame = time(), self.__stream.getvalue()
-                self._condition.notify()
-            self.__stream.seek(0)
-            self.__stream.truncate()
-        self.__stream.write(buf)
+        self._assembler.write(buf)
 
     def flush(self):
-        self.__stream.close()
         for p in self.__pools:
             p.terminated = True
             p.join()
 
+    @property
+    def frames_dropped(self) -> int:
+        return self.dispatcher.frames_dropped + self._assembler.dropped
+
+    @property
+    def drop_rate(self) -> float:
+        return self.dispatcher.drop_rate
+
+    @property
+    def in_flight(self) -> int:
+        return self.dispatcher.in_flight
+
+    @property
+    def requests_sent(self) -> int:
+        return self.dispatcher.requests_sent
+
+    @property
+    def requests_per_hour(self) -> float:
+        """생성 이후 평균 서버 요청 수 (시간당)"""
+        return self.dispatcher.requests_sent / max(time() - self._started, 1e-3) * 3600
+
+    def set_mode(self, mode):
+        """measurer의 상태(Mode)에 맞춰 추론 주기를 바꿈. 다음 frame부터 적용"""
+        rate = self.mode_rates.get(mode.name)
+        interval = 1 / rate if rate else 0.0
+        if interval != self._mode_interval and self.motion is not None:
+            self.motion.reset()
+        self._mode_interval = interval
+        if mode.name != self._mode_name:
+            self._mode_name = mode.name
+            self.station_headers = self._station_headers()
+
+    def set_session(self, session_id: str):
+        """진행 중인 측정(user id). 다음 요청부터 X-Session-Id로 보냄"""
+        self._session_id = session_id
+        self.station_headers = self._station_headers()
+
+    def _station_headers(self) -> dict:
+        # 요청 thread들은 dict를 통째로 바꿔 끼운 것만 읽음
+        return {'X-Station-Id': self.station_id, 'X-Station-Mode': self._mode_name, 'X-Session-Id': self._session_id}
+
+    @property
+    def keypoint_age(self) -> float:
+        """현재 keypoints가 나온 frame이 촬영된 뒤 지난 시간(초)"""
+        return time() - self._snapshot.timestamp
+
+    def _on_frame(self, frame: Frame):
+        mode_interval = self._mode_interval
+        if mode_interval and self.motion is not None and self.motion.update(frame.timestamp, frame.data):
+            # 누군가 들어오면 measurer 상태가 바뀌기를 기다리지 않고 바로 추론 주기를 올림
+            self._boost_until = frame.timestamp + self.motion_hold
+        with self._condition:
+            self.dispatcher.min_interval = 0.0 if frame.timestamp < self._boost_until else mode_interval
+            if not self.dispatcher.accept(frame.timestamp):
+                superseded = frame
+            else:
+                superseded = self._recent_frame
+                self._recent_frame = frame
+                if superseded is not None:
+                    self.dispatcher.superseded()
+                self._condition.notify()
+        # 아무도 가져가지 않은 이전 frame은 바로 pool에 반환
+        if superseded is not None:
+            superseded.release()
+        if superseded is frame:
+            return
+        for listener in self._frame_listeners:
+            listener()
+
+    def _acquire_frame(self) -> Optional[Frame]:
+        frame = self._frame_pool.acquire()
+        if frame is None:
+            # 모든 buffer가 업로드 중이면 아직 처리되지 않은 최신 frame의 buffer를 재사용
+            with self._condition:
+                frame = self._recent_frame
+                self._recent_frame = None
+                if frame is not None:
+                    self.dispatcher.superseded()
+            if frame is not None:
+                frame.length = 0
+        return frame
+
+    def _take_frame(self, timeout=None, prepare=True) -> Optional[Frame]:
+        """가장 최신 frame을 가져감. timeout 동안 새 frame이 없거나 dispatcher가 허용하지 않으면 None.
+        업로드가 끝나면 frame.release()를, 결과에 따라 _publish() 또는 _discard()를 호출해야 함.
+        prepare가 False면 보내기 전에 _prepare_frame()을 직접 호출해야 함 (event loop에서 ROI를 자르지 않도록)"""
+        dispatcher = self.dispatcher
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._recent_frame is not None and dispatcher.can_dispatch(),
+                                            timeout):
+                return None
+            frame = self._recent_frame
+            self._recent_frame = None
+            dispatcher.dispatched()
+        if prepare:
+            self._prepare_frame(frame)
+        return frame
+
+    def _prepare_frame(self, frame: Frame):
+        """ROI만 잘라냄 (JPEG decode/encode). 업로드할 크기가 정해지므로 여기서 셈.
+        잘못된 ROI나 깨진 JPEG로 자르지 못하면 원본 frame을 그대로 올림. 여기서 raise하면 extractor thread가 죽거나
+        dispatch slot이 반환되지 않음"""
+        if self.cropper is not None:
+            try:
+                self._crop(frame)
+            except Exception as e:
+                # _crop은 다시 encode한 뒤에만 buffer를 덮어쓰므로 frame은 원본 그대로임
+                self.crops_failed += 1
+                print('crop failed', repr(e))
+        self.bytes_uploaded += frame.length
+
+    def _crop(self, frame: Frame):
+        # 가져간 frame은 이 worker만 사용하므로 잘라낸 JPEG로 buffer를 덮어써도 됨
+        snapshot = self._snapshot
+        region = self.cropper.region(snapshot.keypoints, frame.timestamp - snapshot.timestamp, frame.timestamp)
+        if region is None:
+            return
+        encoded, roi = self.cropper.crop_jpeg(frame.data, region)
+        if encoded is None or len(encoded) > frame.capacity:
+            return
+        frame._view[:len(encoded)] = encoded.reshape(-1)
+        frame.length = len(encoded)
+        frame.roi = roi
+
+    def _discard(self, shed=False):
+        """실패한 요청(shed이면 서버가 추론하지 않은 요청)의 dispatch slot 반환"""
+        if shed:
+            self.frames_shed += 1
+        else:
+            self.uploads_failed += 1
+        with self._condition:
+            if shed:
+                self.dispatcher.shed()
+            else:
+                self.dispatcher.failed()
+            self._condition.notify()
+
+    def _publish(self, timestamp: float, keypoints: Optional[np.ndarray], rtt: float,
+                 server_time: Optional[float] = None, roi: Optional[Roi] = None, trace: Optional[FrameTrace] = None):
+        now = time()
+        with self._condition:
+            self.dispatcher.completed(now, rtt, server_time)
+            self._condition.notify()
+        published = self._observe(now, rtt, trace)
+        # issue: keypoints에 스칼라값이 들어가는 문제
+        if keypoints is not None and not keypoints.shape:
+            keypoints = None
+        # end of issue
+        if keypoints is not None and roi is not None:
+            keypoints = roi.to_frame(keypoints)
+        if keypoints is not None:
+            keypoints.setflags(write=False)
+        with self._published:
+            snapshot = self._snapshot
+            # 현재 처리 결과가 최신인 경우에만. 즉, 이전의 timestamp보다
+            # 지금 처리한 frame의 timestamp가 더 큰 경우에만 인정
+            if snapshot.timestamp >= timestamp:
+                self.results_stale += 1
+                return
+            # 참조 교체는 atomic하므로 읽는 쪽은 lock 없이 이전 또는 새 snapshot 중 하나를 보게 됨
+            self._snapshot = KeypointsSnapshot(timestamp, keypoints, snapshot.sequence + 1, now)
+            self._published.notify_all()
+        if published is not None:
+            published['published'] = now
+        self.capture_to_publish.observe(now - timestamp)
+        for listener in self._keypoints_listeners:
+            listener()
+
+    def _observe(self, received: float, rtt: float, trace: Optional[FrameTrace]) -> Optional[dict]:
+        """단계별 시간을 histogram에 반영하고 traces에 추가한 기록을 반환 (발행되면 published가 채워짐)"""
+        self.rtt.observe(rtt)
+        if trace is None:
+            return None
+        self.capture_to_upload.observe(trace.sent - trace.captured)
+        record = {'trace_id': trace.trace_id, 'captured': trace.captured, 'sent': trace.sent, 'received': received,
+                  'published': None}
+        server = trace.server
+        if server is not None:
+            self.network.observe(max(rtt - server.total, 0.0))
+            # cache에서 바로 답한 경우 0
+            if server.inference:
+                self.server_queue.observe(server.queue)
+                self.server_decode.observe(server.decode)
+                self.server_inference.observe(server.inference)
+            record['server'] = server._asdict()
+        self.traces.append(record)
+        return record
+
+    def add_keypoints_listener(self, listener: Callable[[], None]):
+        """새 keypoints가 발행될 때마다 발행한 thread에서 호출됨. 오래 걸리는 작업은 하지 않아야 함"""
+        self._keypoints_listeners.append(listener)
+
+    @property
+    def snapshot(self) -> KeypointsSnapshot:
+        return self._snapshot
+
+    def wait_for_sequence(self, sequence: int, timeout=None) -> Optional[KeypointsSnapshot]:
+        """sequence보다 새로운 결과가 발행될 때까지 대기. timeout이 지나면 None"""
+        with self._published:
+            if not self._published.wait_for(lambda: self._snapshot.sequence > sequence, timeout):
+                return None
+            return self._snapshot
+
     @property
     def timestamp_and_keypoints(self) -> Tuple[float, Optional[np.ndarray]]:
-        with self._lock:
-            replica = deepcopy(self._timestamp_and_keypoints)
-        return replica
+        snapshot = self._snapshot
+        return snapshot.timestamp, snapshot.keypoints
 
     @property
     def keypoints(self) -> Optional[np.ndarray]:
-        with self._lock:
-            replica = deepcopy(self._timestamp_and_keypoints[1])
-        return replica
+        return self._snapshot.keypoints
@@ -0,0 +1,291 @@
+"""FrameProcessor가 발행한 keypoints의 기록과 재생.
+
+기록은 두 파일로 이루어짐
+- <path>.bin: 고정 길이 float32 record의 배열. record마다
+  [log 시작 기준 timestamp(초), 사람 수, max_people * 25 * 3개의 keypoints 값]
+- <path>.json: index. 시작 시각, record 길이, 해상도와 측정 시작 같은 event
+
+record 길이가 고정이므로 i번째 record는 i * stride 위치에 있고, 읽는 쪽은 np.memmap으로
+파일 전체를 복사 없이 바로 열 수 있음. record 수는 .bin의 크기로 정하므로 index를 마지막으로
+쓴 뒤에 추가된 record도 읽힘 (전원이 꺼진 경우 마지막의 잘린 record만 버려짐).
+
+    python recording.py recordings/20240101-120000 --speed 4
+"""
+from argparse import ArgumentParser
+from collections import namedtuple
+import json
+import os
+from threading import Lock
+from time import perf_counter, sleep, time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+NUMBER_PARTS = 25
+# timestamp, 사람 수
+RECORD_HEADER = 2
+VERSION = 1
+
+
+class Event(NamedTuple):
+    """record번째 record 직전에 일어난 일 (예: 측정 시작)"""
+    record: int
+    timestamp: float
+    name: str
+    data: dict
+
+
+class KeypointsRecorder:
+    """발행된 keypoints를 record 단위로 모아서 chunk마다 파일에 씀"""
+
+    def __init__(self, path: str, max_people=1, resolution: Optional[Tuple[int, int]] = None, chunk=256):
+        self.path = path
+        self.max_people = max_people
+        self.resolution = resolution
+        self.stride = RECORD_HEADER + max_people * NUMBER_PARTS * 3
+        self.start = None  # type: Optional[float]
+        self.records = 0
+        self.events = []  # type: List[Event]
+        self._buffer = np.zeros((chunk, self.stride), np.float32)
+        self._buffered = 0
+        self._lock = Lock()
+        self._recorded_sequence = -1
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path + '.bin', 'wb')
+        self._write_index()
+
+    def listen(self, processor):
+        """processor가 keypoints를 발행할 때마다 기록"""
+
+        def on_keypoints():
+            snapshot = processor.snapshot
+            with self._lock:
+                # 여러 extractor thread가 동시에 발행하면 이미 기록한 snapshot을 다시 볼 수 있음
+                if snapshot.sequence <= self._recorded_sequence:
+                    return
+                self._recorded_sequence = snapshot.sequence
+                self._append(snapshot.timestamp, snapshot.keypoints)
+
+        processor.add_keypoints_listener(on_keypoints)
+
+    def record(self, timestamp: float, keypoints: Optional[np.ndarray]):
+        with self._lock:
+            self._append(timestamp, keypoints)
+
+    def _append(self, timestamp: float, keypoints: Optional[np.ndarray]):
+        if self.start is None:
+            self.start = timestamp
+        row = self._buffer[self._buffered]
+        # float32이므로 시작 기준 상대 시간으로 저장. 1시간 뒤에도 0.25 ms 단위
+        row[0] = timestamp - self.start
+        people = 0 if keypoints is None else min(len(keypoints), self.max_people)
+        row[1] = people
+        row[RECORD_HEADER:] = 0
+        if people:
+            row[RECORD_HEADER:RECORD_HEADER + people * NUMBER_PARTS * 3] = keypoints[:people].reshape(-1)
+        self._buffered += 1
+        self.records += 1
+        if self._buffered == len(self._buffer):
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        # 발행하는 thread에서 호출되므로 chunk 단위로 한 번에 씀
+        self._file.write(self._buffer[:self._buffered].tobytes())
+        self._buffered = 0
+
+    def mark(self, name: str, timestamp: Optional[float] = None, **data):
+        """다음 record 직전에 일어난 event를 기록. 재생할 때 같은 위치에서 다시 일어남"""
+        with self._lock:
+            self.events.append(Event(self.records, time() if timestamp is None else timestamp, name, data))
+            self._write_index()
+
+    def flush(self):
+        with self._lock:
+            self._flush_buffer()
+            self._file.flush()
+            self._write_index()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def _write_index(self):
+        index = {
+            'version': VERSION,
+            'start': self.start,
+            'stride': self.stride,
+            'max_people': self.max_people,
+            'resolution': self.resolution,
+            'records': self.records,
+            'events': [event._asdict() for event in self.events],
+        }
+        # 쓰는 도중에 꺼져도 이전 index가 남도록 교체
+        temp = self.path + '.json.tmp'
+        with open(temp, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp, self.path + '.json')
+
+
+class KeypointsLog:
+    """KeypointsRecorder가 쓴 기록을 memory map으로 읽음. log[i]는 (timestamp, keypoints 또는 None)"""
+
+    def __init__(self, path: str):
+        with open(path + '.json') as f:
+            index = json.load(f)
+        if index['version'] != VERSION:
+            raise ValueError(f'Unsupported keypoints log version: {index["version"]}')
+        self.path = path
+        self.start = index['start'] or 0.0
+        self.stride = index['stride']
+        self.max_people = index['max_people']
+        self.resolution = tuple(index['resolution']) if index['resolution'] else None
+        self.events = [Event(**event) for event in index['events']]
+        records = os.path.getsize(path + '.bin') // (self.stride * 4)
+        # 빈 파일은 memory map할 수 없음
+        self.data = np.memmap(path + '.bin', np.float32, 'r', shape=(records, self.stride)) if records \
+            else np.zeros((0, self.stride), np.float32)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, i: int) -> Tuple[float, Optional[np.ndarray]]:
+        row = self.data[i]
+        people = int(row[1])
+        keypoints = row[RECORD_HEADER:RECORD_HEADER + people * NUMBER_PARTS * 3].reshape(people, NUMBER_PARTS, 3) \
+            if people else None
+        return self.start + float(row[0]), keypoints
+
+    @property
+    def times(self) -> np.ndarray:
+        """record별 log 시작 기준 timestamp (복사 없는 view)"""
+        return self.data[:, 0]
+
+    @property
+    def duration(self) -> float:
+        return float(self.data[-1, 0]) if len(self.data) else 0.0
+
+    def seek(self, timestamp: float) -> int:
+        """timestamp 이후 첫 record의 번호"""
+        return int(np.searchsorted(self.times, timestamp - self.start))
+
+
+class ReplaySnapshot(NamedTuple):
+    # processors.KeypointsSnapshot과 같은 모양
+    timestamp: float
+    keypoints: Optional[np.ndarray]
+    sequence: int
+
+
+class KeypointsReplayer:
+    """카메라와 서버 없이 기록된 keypoints를 FrameProcessor 대신 발행.
+
+    speed가 1이면 기록된 간격대로, 2면 두 배 빠르게, None이면 기다리지 않고 발행함.
+    None일 때는 measurer가 각 snapshot을 처리할 때까지 기다리므로 항상 같은 결과가 나옴.
+    measurer는 clock=replayer.clock으로 만들어서 기록된 시각으로 측정해야 함"""
+
+    def __init__(self, log: KeypointsLog, speed: Optional[float] = 1.0):
+        self.log = log
+        self.speed = speed
+        self._snapshot = ReplaySnapshot(log.start, None, 0)
+        self._keypoints_listeners = []  # type: List[Callable[[], None]]
+        self._now = log.start
+        self._origin = None  # type: Optional[Tuple[float, float]]
+        self.mode = None
+        self.published = 0
+
+    def clock(self) -> float:
+        """재생 중인 시각. 속도를 제한할 때는 실제 경과 시간 * speed로 흐름"""
+        if self._origin is None or self.speed is None:
+            return self._now
+        log_start, wall_start = self._origin
+        return log_start + (perf_counter() - wall_start) * self.speed
+
+    # FrameProcessor에서 measurer가 사용하는 부분
+    @property
+    def snapshot(self) -> ReplaySnapshot:
+        return self._snapshot
+
+    @property
+    def timestamp_and_keypoints(self) -> Tuple[float, Optional[np.ndarray]]:
+        snapshot = self._snapshot
+        return snapshot.timestamp, snapshot.keypoints
+
+    @property
+    def keypoints(self) -> Optional[np.ndarray]:
+        return self._snapshot.keypoints
+
+    def add_keypoints_listener(self, listener: Callable[[], None]):
+        self._keypoints_listeners.append(listener)
+
+    def set_mode(self, mode):
+        self.mode = mode
+
+    def run(self, measurer=None, start=0, stop=None):
+        """start번째부터 stop번째 전까지의 record를 발행. 기록된 event(측정 시작)는 measurer에 전달"""
+        log = self.log
+        stop = len(log) if stop is None else min(stop, len(log))
+        events = [event for event in log.events if start <= event.record < stop]
+        self._origin = (log.start + float(log.times[start]), perf_counter()) if start < stop else None
+        for i in range(start, stop):
+            while events and events[0].record == i:
+                self._fire(events.pop(0), measurer)
+            timestamp, keypoints = log[i]
+            if self.speed is not None:
+                delay = (timestamp - self.clock()) / self.speed
+                if delay > 0:
+                    busy_until = perf_counter() + delay
+                    # sleep의 정밀도보다 짧게 남으면 그대로 발행
+                    while perf_counter() < busy_until - 1e-3:
+                        sleep(min(busy_until - perf_counter(), 0.05))
+            self._now = timestamp
+            self._snapshot = ReplaySnapshot(timestamp, keypoints, self._snapshot.sequence + 1)
+            self.published += 1
+            for listener in self._keypoints_listeners:
+                listener()
+            if self.speed is None and measurer is not None:
+                measurer.wait_measured(self._snapshot.sequence)
+
+    def _fire(self, event: Event, measurer):
+        if measurer is None:
+            return
+        if event.name == 'start':
+            if self.speed is None:
+                self._now = max(self._now, event.timestamp)
+            measurer.start_measuring(event.data.get('user_id', ''))
+
+
+def main():
+    from measurer import BodyBalanceMeasurer
+
+    parser = ArgumentParser()
+    parser.add_argument('path', help='확장자를 뺀 기록 경로')
+    parser.add_argument('--speed', type=float, default=0, help='재생 속도 배율. 0이면 기다리지 않음')
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f, object_hook=lambda d: namedtuple('Config', d.keys())(*d.values()))
+    log = KeypointsLog(args.path)
+    if log.resolution:
+        # 기록한 카메라의 해상도로 그림
+        width, height = log.resolution
+        config = config._replace(picamera=config.picamera._replace(
+            resolution=config.picamera.resolution._replace(width=width, height=height)))
+    replayer = KeypointsReplayer(log, args.speed or None)
+    scores = []
+    measurer = BodyBalanceMeasurer(replayer, config, clock=replayer.clock)
+    measurer.add_score_listener(lambda user_id, score, elapsed, mode: scores.append((user_id, score, elapsed, mode)))
+    start = perf_counter()
+    replayer.run(measurer)
+    elapsed = perf_counter() - start
+    measurer.close()
+    for user_id, score, measured, mode in scores:
+        print(f'id {user_id}: {mode.name} {score} ({measured:.3f} s)')
+    print(f'{replayer.published} records ({log.duration:.0f} s) in {elapsed:.2f} s:'
+          f' {replayer.published / max(elapsed, 1e-9):.0f} records/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+from typing import NamedTuple, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from pose import get_keypoints_rectangles
+
+# 축소 비율별로 JPEG decoder가 DCT 단계에서 바로 줄여 주는 flag
+_REDUCED_COLOR = {2: cv.IMREAD_REDUCED_COLOR_2, 4: cv.IMREAD_REDUCED_COLOR_4, 8: cv.IMREAD_REDUCED_COLOR_8}
+
+
+class Roi(NamedTuple):
+    """잘라서 보낸 이미지의 좌표계. pixel 중심 기준으로 원본 좌표 = (잘라낸 이미지 좌표 + 0.5) / scale - 0.5 + (x, y)"""
+    x: int
+    y: int
+    scale_x: float
+    scale_y: float
+
+    def to_frame(self, keypoints: np.ndarray) -> np.ndarray:
+        """잘라낸 이미지 기준 (people, parts, 3) keypoints를 원본 frame 좌표로 변환한 새 배열"""
+        keypoints = keypoints.copy()
+        # OpenPose는 검출하지 못한 관절을 (0, 0, 0)으로 주므로 그대로 둠
+        detected = keypoints[..., 2] > 0
+        keypoints[..., 0] = np.where(detected, (keypoints[..., 0] + 0.5) / self.scale_x - 0.5 + self.x, 0)
+        keypoints[..., 1] = np.where(detected, (keypoints[..., 1] + 0.5) / self.scale_y - 0.5 + self.y, 0)
+        return keypoints
+
+
+class RoiCropper:
+    """마지막 keypoints의 bounding box 주변만 잘라(필요하면 축소해) 보내도록 영역을 정함.
+
+    - keypoints가 없거나 `max_age`초보다 오래됐으면 원본 frame을 보냄
+    - 다른 사람이 들어오거나 영역 밖으로 벗어난 관절을 다시 찾을 수 있도록 `full_frame_interval`초마다 원본 frame을 보냄
+    - 잘라도 원본의 `max_area` 비율보다 크면 원본 frame을 보냄
+    - 긴 변이 `max_side`보다 크면 축소. 서버는 어차피 network 입력 크기로 줄이므로 그 이상은 보낼 필요가 없음
+    """
+
+    def __init__(self, width: int, height: int, padding=0.25, max_side: Optional[int] = 368, quality=90,
+                 full_frame_interval=2.0, max_age=1.0, max_area=0.7, threshold=0.1):
+        self.width = width
+        self.height = height
+        self.padding = padding
+        self.max_side = max_side
+        self.quality = quality
+        self.full_frame_interval = full_frame_interval
+        self.max_age = max_age
+        self.max_area = max_area
+        self.threshold = threshold
+        self._last_full = float('-inf')
+
+    def region(self, keypoints: Optional[np.ndarray], age: float, timestamp: float) -> Optional[Tuple[int, int, int, int]]:
+        """timestamp에 찍힌 frame에서 잘라낼 (x0, y0, x1, y1). 원본 frame을 보내야 하면 None"""
+        region = None
+        if keypoints is not None and age <= self.max_age and timestamp - self._last_full < self.full_frame_interval:
+            region = self._person_region(keypoints)
+        if region is None:
+            self._last_full = timestamp
+        return region
+
+    def _person_region(self, keypoints: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        rectangles = get_keypoints_rectangles(keypoints, self.threshold)
+        rectangles = rectangles[rectangles[:, 2] * rectangles[:, 3] > 0]
+        if not len(rectangles):
+            return None
+        x0, y0 = rectangles[:, :2].min(axis=0)
+        x1, y1 = (rectangles[:, :2] + rectangles[:, 2:]).max(axis=0)
+        pad = self.padding * max(x1 - x0, y1 - y0)
+        x0, y0 = max(int(x0 - pad), 0), max(int(y0 - pad), 0)
+        x1, y1 = min(int(x1 + pad) + 1, self.width), min(int(y1 + pad) + 1, self.height)
+        if x0 >= x1 or y0 >= y1 or (x1 - x0) * (y1 - y0) > self.max_area * self.width * self.height:
+            return None
+        return x0, y0, x1, y1
+
+    def _scale(self, region) -> float:
+        x0, y0, x1, y1 = region
+        side = max(x1 - x0, y1 - y0)
+        return min(1.0, self.max_side / side) if self.max_side else 1.0
+
+    def crop_image(self, image: np.ndarray, region, reduction=1) -> Tuple[np.ndarray, Roi]:
+        """`reduction`배 축소된 image에서 원본 좌표 기준 region을 잘라 `max_side`에 맞게 줄임"""
+        x0, y0, x1, y1 = (v // reduction for v in region)
+        crop = image[y0:y1, x0:x1]
+        scale = self._scale(region) * reduction
+        height, width = crop.shape[:2]
+        if scale < 1:
+            size = max(1, round(width * scale)), max(1, round(height * scale))
+            crop = cv.resize(crop, size, interpolation=cv.INTER_AREA)
+        return crop, Roi(x0 * reduction, y0 * reduction,
+                         crop.shape[1] / width / reduction, crop.shape[0] / height / reduction)
+
+    def crop_jpeg(self, jpeg, region) -> Tuple[Optional[bytes], Optional[Roi]]:
+        """원본 JPEG에서 region을 잘라 다시 encode. 축소할 만큼은 decode 단계에서 미리 줄임"""
+        scale = self._scale(region)
+        reduction = max([1] + [r for r in _REDUCED_COLOR if r * scale <= 1])
+        image = cv.imdecode(np.frombuffer(jpeg, np.uint8), _REDUCED_COLOR.get(reduction, cv.IMREAD_COLOR))
+        if image is None:
+            return None, None
+        crop, roi = self.crop_image(image, region, reduction)
+        ok, encoded = cv.imencode('.jpg', crop, [cv.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return None, None
+        return encoded, roi
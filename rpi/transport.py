@@ -0,0 +1,180 @@
+import socket
+import struct
+from threading import Thread, Lock, BoundedSemaphore
+from time import time, sleep
+from typing import Optional
+from urllib.parse import urlsplit
+
+import codec
+from frames import FrameTrace
+
+# stream_server.py와 같은 framing: <frame id: uint32><length: uint32><payload>
+FRAME_HEADER = struct.Struct('<II')
+
+
+class StreamExtractor(Thread):
+    """하나의 TCP 연결로 frame을 연속 전송하고, frame id로 keypoints 응답을 매칭.
+
+    sender thread(자기 자신)와 receiver thread 두 개만 사용하며
+    최대 `max_in_flight`개의 frame을 응답 대기 상태로 둘 수 있음.
+    """
+
+    def __init__(self, stream_url, owner, name, max_in_flight=4, request_timeout=1, reconnect_interval=1):
+        super(StreamExtractor, self).__init__()
+        self.name = name
+        self.terminated = False
+        url = urlsplit(stream_url)
+        self.address = url.hostname, url.port
+        self.owner = owner
+        self.request_timeout = request_timeout
+        self.reconnect_interval = reconnect_interval
+        self._slots = BoundedSemaphore(max_in_flight)
+        self._lock = Lock()
+        self._sock = None  # type: Optional[socket.socket]
+        self._next_frame_id = 0
+        # frame id -> (frame timestamp, sent time, roi, trace id)
+        self._in_flight = {}
+        self._receiver = Thread(target=self._receive_loop, name=f'{name}-receiver')
+        self.start()
+        self._receiver.start()
+
+    def join(self, timeout=None):
+        super(StreamExtractor, self).join(timeout)
+        self._receiver.join(timeout)
+        self._disconnect(self._sock)
+
+    def run(self):
+        owner = self.owner
+
+        while not self.terminated:
+            if not self._slots.acquire(timeout=0.5):
+                self._expire()
+                continue
+
+            frame = owner._take_frame(timeout=0.5)
+            if frame is None:
+                self._slots.release()
+                continue
+            sock = self._connect()
+            if sock is None:
+                # 연결하지 못한 frame은 보내지 않고 포기
+                frame.release()
+                self._slots.release()
+                owner._discard()
+                continue
+
+            with self._lock:
+                frame_id = self._next_frame_id
+                self._next_frame_id = (frame_id + 1) & 0xffffffff
+                self._in_flight[frame_id] = frame.timestamp, time(), frame.roi, frame.trace_id
+            try:
+                sock.sendall(FRAME_HEADER.pack(frame_id, frame.length))
+                sock.sendall(frame.data)
+            except OSError as e:
+                print(self.name, e)
+                with self._lock:
+                    lost = self._in_flight.pop(frame_id, None) is not None
+                if lost:
+                    self._slots.release()
+                    owner._discard()
+                self._disconnect(sock)
+            finally:
+                frame.release()
+
+    def _receive_loop(self):
+        owner = self.owner
+
+        while not self.terminated:
+            sock = self._sock
+            if sock is None:
+                self._expire()
+                sleep(0.05)
+                continue
+
+            try:
+                header = self._recv_exactly(sock, FRAME_HEADER.size, idle_ok=True)
+                if header is None:
+                    self._expire()
+                    continue
+                frame_id, length = FRAME_HEADER.unpack(header)
+                body = self._recv_exactly(sock, length)
+            except OSError as e:
+                print(self.name, e)
+                self._disconnect(sock)
+                continue
+
+            with self._lock:
+                entry = self._in_flight.pop(frame_id, None)
+            if entry is None:
+                # timeout으로 이미 포기한 frame
+                continue
+            self._slots.release()
+
+            timestamp, sent, roi, trace_id = entry
+            try:
+                keypoints = codec.decode(body)
+            except (ValueError, struct.error) as e:
+                print(self.name, e)
+                owner._discard()
+                continue
+            # stream 응답에는 서버 처리 시간이 없음
+            owner._publish(timestamp, keypoints, time() - sent, roi=roi, trace=FrameTrace(trace_id, timestamp, sent))
+
+    def _recv_exactly(self, sock, size, idle_ok=False) -> Optional[bytearray]:
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            try:
+                n = sock.recv_into(view[received:])
+            except socket.timeout:
+                # 아무것도 받지 않은 상태의 timeout은 in-flight 만료 확인용
+                if received == 0 and idle_ok:
+                    return None
+                if self.terminated:
+                    raise
+                continue
+            if n == 0:
+                raise ConnectionError('Connection closed by server')
+            received += n
+        return buf
+
+    def _connect(self) -> Optional[socket.socket]:
+        sock = self._sock
+        if sock is not None:
+            return sock
+        try:
+            sock = socket.create_connection(self.address, timeout=self.request_timeout)
+        except OSError as e:
+            print(self.name, e)
+            sleep(self.reconnect_interval)
+            return None
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        return sock
+
+    def _disconnect(self, sock):
+        if sock is None:
+            return
+        lost = 0
+        with self._lock:
+            # 응답을 받을 수 없게 된 in-flight frame은 모두 포기
+            if self._sock is sock:
+                self._sock = None
+                lost = len(self._in_flight)
+                self._in_flight.clear()
+        for _ in range(lost):
+            self._slots.release()
+            self.owner._discard()
+        sock.close()
+
+    def _expire(self):
+        # request_timeout이 지난 응답은 포기하고 slot을 반환
+        deadline = time() - self.request_timeout
+        with self._lock:
+            expired = [frame_id for frame_id, (_, sent, _, _) in self._in_flight.items() if sent < deadline]
+            for frame_id in expired:
+                del self._in_flight[frame_id]
+        for _ in expired:
+            self._slots.release()
+            self.owner._discard()
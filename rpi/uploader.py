@@ -0,0 +1,271 @@
+"""측정 결과를 DB 서버에 올리는 background uploader.
+
+점수는 먼저 SQLite spool에 저장한 뒤 별도 thread에서 올리므로, DB 서버가 느리거나 꺼져 있어도
+measurer는 기다리지 않고 점수는 재부팅 후에도 남아 있음.
+
+- 쌓인 점수는 최대 `batch_size`개씩 `bulk_path`로 한 번에 보냄. 서버가 bulk endpoint를
+  모르면(404/405) 이후로는 `/scores/save`로 하나씩 보내고, 그 외의 4xx면 문제가 있는 점수를
+  찾기 위해 그 batch만 하나씩 보냄
+- 연결 오류, timeout, 5xx와 408/429(서버가 바쁨)면 `min_backoff`초부터 두 배씩(최대 `max_backoff`초)
+  기다렸다가 다시 시도
+- 하나씩 보낸 점수가 그 외의 4xx로 거절되면 다시 보내지 않고 rejected로 남겨 둠
+
+    python uploader.py scores.sqlite3            # spool 상태
+    python uploader.py scores.sqlite3 --retry    # rejected를 다시 pending으로
+"""
+from argparse import ArgumentParser
+import json
+import random
+import sqlite3
+from threading import Condition, Lock, Thread
+from time import perf_counter, time
+from typing import List, Optional, Tuple
+
+import requests
+
+from metrics import Registry
+
+PENDING = 'pending'
+REJECTED = 'rejected'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+)
+'''
+
+
+def score_record(user_id: str, module_type, score: int, elapsed: float) -> dict:
+    """/scores/save의 요청 본문"""
+    return {
+        'user_seq': user_id,
+        'module_type': module_type,
+        'score_1': score,
+        'score_2': f'{elapsed:.3f}'
+    }
+
+
+# 점수가 아니라 서버 상태 때문에 거절된 응답. 나중에 그대로 다시 보냄
+RETRY_STATUS = (408, 429)
+
+
+def _error(status) -> str:
+    return status if isinstance(status, str) else f'HTTP {status}'
+
+
+def _retry_later(status) -> bool:
+    """연결 오류나 timeout(exception repr), 5xx, 408/429"""
+    return not isinstance(status, int) or status >= 500 or status in RETRY_STATUS
+
+
+class ScoreUploader:
+    def __init__(self, url: str, spool_path: str, batch_size=20, bulk_path: Optional[str] = '/scores/save_bulk',
+                 timeout=5.0, min_backoff=1.0, max_backoff=300.0, metrics: Optional[Registry] = None):
+        self.url = url
+        self.batch_size = batch_size
+        self.bulk_path = bulk_path
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.sess = requests.Session()
+        # submit은 measurer thread에서, 나머지는 upload thread에서 호출되므로 연결 하나를 lock으로 공유.
+        # 네트워크를 기다리는 동안에는 lock을 잡지 않음
+        self._db = sqlite3.connect(spool_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(SCHEMA)
+        self._db.commit()
+        self._db_lock = Lock()
+        self._wakeup = Condition()
+        # 이전에 꺼지기 전에 못 올린 점수부터 바로 보냄
+        self._woken = True
+        self._terminated = False
+        self.backoff = 0.0
+        self._retry_at = 0.0
+        self.uploaded = 0
+        self.rejected = 0
+        self.failures = 0
+        self.posts = 0
+        if metrics is not None:
+            self._init_metrics(metrics)
+        else:
+            self.upload_seconds = None
+        self._worker = Thread(target=self._upload_loop, name='score_uploader', daemon=True)
+        self._worker.start()
+
+    def _init_metrics(self, metrics: Registry):
+        self.upload_seconds = metrics.histogram('score_upload_seconds', 'One post to the score database')
+        metrics.gauge('score_queue_depth', 'Scores in the spool, by status', self.counts, label='status')
+        metrics.gauge('score_oldest_pending_seconds', 'Age of the oldest score not uploaded yet',
+                      lambda: self.oldest_pending_age or 0.0)
+        metrics.gauge('score_uploads_total', 'Scores by upload result', lambda: {
+            'uploaded': self.uploaded,
+            'rejected': self.rejected,
+        }, label='result', type='counter')
+        metrics.gauge('score_upload_failures_total', 'Posts that failed and were retried later',
+                      lambda: self.failures, type='counter')
+        metrics.gauge('score_upload_backoff_seconds', 'Current wait before retrying', lambda: self.backoff)
+
+    def submit(self, record: dict):
+        """spool에 저장만 하고 바로 반환. 네트워크를 기다리지 않음"""
+        with self._db_lock:
+            self._db.execute('INSERT INTO scores (payload, created) VALUES (?, ?)', (json.dumps(record), time()))
+            self._db.commit()
+        self.wake()
+
+    def wake(self):
+        with self._wakeup:
+            self._woken = True
+            self._wakeup.notify_all()
+
+    def counts(self) -> dict:
+        with self._db_lock:
+            rows = self._db.execute('SELECT status, COUNT(*) FROM scores GROUP BY status').fetchall()
+        counts = {PENDING: 0, REJECTED: 0}
+        counts.update(rows)
+        return counts
+
+    @property
+    def pending(self) -> int:
+        return self.counts()[PENDING]
+
+    @property
+    def oldest_pending_age(self) -> Optional[float]:
+        with self._db_lock:
+            created, = self._db.execute('SELECT MIN(created) FROM scores WHERE status = ?', (PENDING,)).fetchone()
+        return None if created is None else time() - created
+
+    def wait_empty(self, timeout=None) -> bool:
+        """pending인 점수가 모두 올라갈 때까지 대기"""
+        deadline = None if timeout is None else perf_counter() + timeout
+        with self._wakeup:
+            while self.pending:
+                remaining = None if deadline is None else deadline - perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.wait(0.05 if remaining is None else min(remaining, 0.05))
+        return True
+
+    def close(self):
+        self._terminated = True
+        self.wake()
+        self._worker.join()
+        self._db.close()
+
+    def _batch(self) -> List[Tuple[int, dict]]:
+        with self._db_lock:
+            rows = self._db.execute('SELECT id, payload FROM scores WHERE status = ? ORDER BY id LIMIT ?',
+                                    (PENDING, self.batch_size)).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def _upload_loop(self):
+        while True:
+            # 새 점수가 들어오거나 backoff가 끝날 때까지 대기
+            with self._wakeup:
+                timeout = max(self._retry_at - perf_counter(), 0) if self.backoff else None
+                self._wakeup.wait_for(lambda: self._woken or self._terminated, timeout)
+                self._woken = False
+            if self._terminated:
+                break
+            if self.backoff and perf_counter() < self._retry_at:
+                # backoff 중에 들어온 점수는 backoff가 끝난 뒤 함께 보냄
+                continue
+            batch = self._batch()
+            while batch and not self._terminated:
+                error = self._upload(batch)
+                if error is not None:
+                    self._failed(batch, error)
+                    break
+                self.backoff = 0.0
+                batch = self._batch()
+            with self._wakeup:
+                self._wakeup.notify_all()
+
+    def _failed(self, batch: List[Tuple[int, dict]], error: str):
+        self.failures += 1
+        with self._db_lock:
+            self._db.executemany('UPDATE scores SET attempts = attempts + 1, last_error = ? WHERE id = ?',
+                                 [(error, row_id) for row_id, _ in batch])
+            self._db.commit()
+        self.backoff = min(self.max_backoff, max(self.backoff * 2, self.min_backoff))
+        # 여러 station이 같은 순간에 다시 몰리지 않도록 흩뜨림
+        self._retry_at = perf_counter() + self.backoff * random.uniform(0.8, 1.2)
+
+    def _upload(self, batch: List[Tuple[int, dict]]) -> Optional[str]:
+        """batch를 처리했으면 None, 나중에 다시 보내야 하면 오류 내용"""
+        if self.bulk_path and len(batch) > 1:
+            status = self._post(self.bulk_path, [record for _, record in batch])
+            if _retry_later(status):
+                return _error(status)
+            if 200 <= status < 300:
+                self._delete([row_id for row_id, _ in batch])
+                return None
+            if status in (404, 405):
+                print(f'{self.bulk_path} is not supported ({status}), posting scores one by one')
+                self.bulk_path = None
+        for row_id, record in batch:
+            status = self._post('/scores/save', record)
+            if _retry_later(status):
+                return _error(status)
+            if 200 <= status < 300:
+                self._delete([row_id])
+            else:
+                self._reject(row_id, _error(status))
+        return None
+
+    def _post(self, path: str, body):
+        """응답 status code. 연결 오류나 timeout이면 그 exception의 repr"""
+        start = perf_counter()
+        try:
+            res = self.sess.post(f'{self.url}{path}', json=body, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f'Failed to post scores: {e!r}')
+            return repr(e)
+        finally:
+            self.posts += 1
+            if self.upload_seconds is not None:
+                self.upload_seconds.observe(perf_counter() - start)
+        if res.status_code >= 300:
+            print(f'Unsuccessful status code from {path}: {res.status_code}')
+        return res.status_code
+
+    def _delete(self, row_ids: List[int]):
+        with self._db_lock:
+            self._db.executemany('DELETE FROM scores WHERE id = ?', [(row_id,) for row_id in row_ids])
+            self._db.commit()
+        self.uploaded += len(row_ids)
+
+    def _reject(self, row_id: int, error: str):
+        with self._db_lock:
+            self._db.execute('UPDATE scores SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?',
+                             (REJECTED, error, row_id))
+            self._db.commit()
+        self.rejected += 1
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('spool', help='SQLite spool 경로')
+    parser.add_argument('--retry', action='store_true', help='rejected인 점수를 다시 보내도록 pending으로 되돌림')
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.spool)
+    db.execute(SCHEMA)
+    if args.retry:
+        changed = db.execute('UPDATE scores SET status = ? WHERE status = ?', (PENDING, REJECTED)).rowcount
+        db.commit()
+        print(f'{changed} scores back to pending')
+    for status, count, oldest in db.execute('SELECT status, COUNT(*), MIN(created) FROM scores GROUP BY status'):
+        print(f'{status}: {count} (oldest {time() - oldest:.0f} s ago)')
+    for row_id, payload, error in db.execute('SELECT id, payload, last_error FROM scores WHERE status = ?',
+                                             (REJECTED,)):
+        print(f'  #{row_id} {payload}: {error}')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
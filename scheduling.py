@@ -0,0 +1,157 @@
+"""station별 job queue를 weighted deficit round robin(DRR)으로 처리.
+
+Pi(station)마다 FIFO가 하나씩 있음. station은 round마다 `weight`개 frame만큼의 credit(deficit)을 받고
+credit이 한 frame 이상 남아 있는 동안 처리됨. 그래서 weight가 같으면 동시에 몇 개를 올리든
+대기 중인 station은 inference worker를 똑같이 나눠 씀. 측정 중인 station은 weight를 크게 줘서
+idle station의 frame 뒤에서 기다리지 않고 앞질러 가게 함.
+
+frame의 비용은 모두 같으므로(inference 한 번) 여기서 DRR은 소수 weight도 다룰 수 있는
+weighted round robin임.
+
+대기 중인 frame이 거의 하나뿐인 station(서버가 최신 frame만 남기는 경우 등)은 credit보다 frame이 먼저
+떨어져서 weight의 효과가 없음. 그래서 weight가 1보다 크면 round의 맨 뒤가 아니라 맨 앞에 들어감.
+"""
+from collections import deque
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+def check_weight(weight: float) -> float:
+    """weight가 0 이하면 credit이 쌓이지 않아 pop()이 끝나지 않으므로 ValueError"""
+    if not weight > 0:
+        raise ValueError(f'Station weight must be positive: {weight!r}')
+    return weight
+
+
+class StationQueue:
+    def __init__(self, name: str, weight=1.0):
+        self.name = name
+        self.weight = weight
+        self.jobs = deque()  # type: Deque[Any]
+        self.deficit = 0.0
+        self.active = False
+        # station이 마지막으로 알려준 자기 정보 (mode, session)
+        self.info = {}  # type: Dict[str, str]
+        self.last_seen = perf_counter()
+        # worker에 넘겼고 아직 응답하지 않은 job 수
+        self.in_flight = 0
+        self.submitted = 0
+        self.served = 0
+        self.rejected = 0
+        # 추론하지 않고 stale로 응답한 job 수. InferencePool 참고
+        self.shed = 0
+        # worker에 넘긴 / 응답한 가장 최신 frame의 촬영 시각 (client 시계)
+        self.latest_dispatched = float('-inf')
+        self.latest_answered = float('-inf')
+        self._queue_time = 0.0
+
+    @property
+    def weight(self) -> float:
+        return self._weight
+
+    @weight.setter
+    def weight(self, weight: float):
+        self._weight = check_weight(weight)
+
+    @property
+    def outstanding(self) -> int:
+        return len(self.jobs) + self.in_flight
+
+    def done(self, queue_time: float):
+        self.in_flight -= 1
+        self.served += 1
+        self._queue_time += queue_time
+
+    def stats(self, now: float) -> dict:
+        return {
+            'weight': self.weight,
+            **self.info,
+            'queued': len(self.jobs),
+            'in_flight': self.in_flight,
+            'submitted': self.submitted,
+            'served': self.served,
+            'rejected': self.rejected,
+            'shed': self.shed,
+            'mean_queue_time': self._queue_time / self.served if self.served else 0.0,
+            'idle_for': now - self.last_seen,
+        }
+
+
+class FairQueue:
+    """thread safe하지 않음. 호출하는 쪽에서 lock을 잡음"""
+
+    def __init__(self):
+        self.stations = {}  # type: Dict[str, StationQueue]
+        # 대기 중인 job이 있는 station. 처리 순서대로
+        self._active = deque()  # type: Deque[StationQueue]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self) -> Iterator[StationQueue]:
+        return iter(list(self.stations.values()))
+
+    def station(self, name: str) -> StationQueue:
+        queue = self.stations.get(name)
+        if queue is None:
+            queue = self.stations[name] = StationQueue(name)
+        return queue
+
+    def push(self, queue: StationQueue, job):
+        queue.jobs.append(job)
+        queue.submitted += 1
+        queue.last_seen = perf_counter()
+        self._size += 1
+        if not queue.active:
+            queue.active = True
+            if queue.weight > 1:
+                self._active.appendleft(queue)
+            else:
+                self._active.append(queue)
+
+    def pop(self) -> Optional[Tuple[StationQueue, Any]]:
+        """DRR 순서로 다음 (station, job). 대기 중인 job이 없으면 None"""
+        active = self._active
+        while active:
+            queue = active[0]
+            if not queue.jobs:
+                # drop()으로 비워짐
+                queue.deficit = 0.0
+                queue.active = False
+                active.popleft()
+                continue
+            if queue.deficit < 1:
+                # 이 station의 새 round. weight가 1보다 작으면 frame 하나에 여러 round가 필요
+                queue.deficit += queue.weight
+                if queue.deficit < 1:
+                    active.rotate(-1)
+                    continue
+            queue.deficit -= 1
+            job = queue.jobs.popleft()
+            self._size -= 1
+            if not queue.jobs:
+                # 보낼 것이 없는 동안에는 credit을 쌓아 두지 않음
+                queue.deficit = 0.0
+                queue.active = False
+                active.popleft()
+            elif queue.deficit < 1:
+                active.rotate(-1)
+            return queue, job
+        return None
+
+    def drop(self, queue: StationQueue, predicate: Callable[[Any], bool]) -> List[Any]:
+        """`queue`에서 `predicate`에 맞는 job을 빼서 반환. station은 round의 자리를 그대로 유지하므로
+        더 최신 frame으로 바뀐 frame이 맨 뒤로 밀리지 않음"""
+        dropped = [job for job in queue.jobs if predicate(job)]
+        if dropped:
+            queue.jobs = deque(job for job in queue.jobs if not predicate(job))
+            self._size -= len(dropped)
+        return dropped
+
+    def forget(self, idle_for: float):
+        """`idle_for`초 동안 아무것도 보내지 않은 station의 통계를 지움"""
+        now = perf_counter()
+        for name, queue in list(self.stations.items()):
+            if not queue.outstanding and now - queue.last_seen > idle_for:
+                del self.stations[name]
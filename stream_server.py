@@ -0,0 +1,100 @@
+"""`main_http.submit` 앞의 길이 prefix TCP stream.
+
+요청은 `<frame id: uint32><length: uint32><jpeg>`, 응답은 `<frame id: uint32><length: uint32><codec.FLOAT32 payload>`.
+client는 한 연결로 여러 frame을 이어서 보내고 frame id로 응답을 맞춤. frame은 도착하는 대로 inference pool에
+submit하고 끝나는 대로 응답하므로 한 연결의 frame이 동시에 추론되며 응답 순서가 바뀔 수 있음.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import Future
+from functools import partial
+import socket
+import socketserver
+import struct
+from threading import Lock
+
+import codec
+from inference import QueueFull
+
+FRAME_HEADER = struct.Struct('<II')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytearray:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError('Connection closed by peer')
+        received += n
+    return buf
+
+
+class StreamHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        submit = self.server.submit
+        # 응답은 frame을 끝낸 thread가 씀
+        send_lock = Lock()
+
+        while True:
+            try:
+                frame_id, length = FRAME_HEADER.unpack(recv_exactly(sock, FRAME_HEADER.size))
+                if length > MAX_FRAME_SIZE:
+                    print(f'{self.client_address}: frame too large ({length} bytes)')
+                    return
+                frame = recv_exactly(sock, length)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                # stream에는 header가 없음. station마다 연결을 하나씩 유지하므로 port까지 포함한 주소로 station을 구분
+                # (NAT 뒤나 loadgen처럼 여러 station이 host를 같이 쓸 수 있음)
+                future = submit(frame, '%s:%d' % self.client_address[:2])
+            except QueueFull as e:
+                self._dropped(frame_id, e)
+                continue
+            future.add_done_callback(partial(self._respond, sock, send_lock, frame_id))
+
+    def _respond(self, sock: socket.socket, send_lock: Lock, frame_id: int, future: Future):
+        """inference collector thread(cache hit이면 이 thread)에서 실행됨. 응답은 수백 byte로 socket buffer에
+        들어가므로 sendall이 client를 기다리지 않음"""
+        error = future.exception()
+        if error is not None:
+            self._dropped(frame_id, error)
+            return
+        body = codec.encode(future.result(), codec.FLOAT32)
+        try:
+            with send_lock:
+                sock.sendall(FRAME_HEADER.pack(frame_id, len(body)) + body)
+        except OSError:
+            # 연결이 끊김. handle()이 다음 read에서 알아챔
+            pass
+
+    def _dropped(self, frame_id: int, error: BaseException):
+        # "사람 없음"으로 응답하지 않음: client는 응답 없는 frame을 request_timeout 뒤에 포기함
+        print(f'{self.client_address}: frame {frame_id} dropped ({error!r})')
+
+
+class StreamServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, submit):
+        self.submit = submit
+        super(StreamServer, self).__init__(address, StreamHandler)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    from main_http import submit
+
+    with StreamServer((args.host, args.port), submit) as server:
+        print(f'Streaming keypoints on {args.host}:{args.port}')
+        server.serve_forever()
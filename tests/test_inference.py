@@ -0,0 +1,60 @@
+from concurrent.futures import CancelledError, TimeoutError
+from functools import partial
+
+import cv2
+import numpy as np
+import pytest
+
+from backends import create_backend
+from inference import InferencePool
+
+JPEG = cv2.imencode('.jpg', np.zeros((48, 64, 3), np.uint8))[1].tobytes()
+
+
+@pytest.fixture
+def pool():
+    pool = InferencePool(partial(create_backend, 'synthetic', latency=0.01), workers=1)
+    assert pool.wait_ready(30)
+    yield pool
+    pool.close()
+
+
+class _CancelOnPop(dict):
+    """collector가 future를 꺼낸 직후 estimate()가 timeout되어 abandon()한 것과 같은 순서를 만듦"""
+
+    def pop(self, key, *default):
+        future = super().pop(key, *default)
+        if future is not None:
+            future.cancel()
+        return future
+
+
+def test_abandon_while_result_arrives(pool):
+    with pool._lock:
+        pool._pending = _CancelOnPop()
+    future = pool.submit(JPEG)
+    with pytest.raises(CancelledError):
+        future.result(10)
+    with pool._lock:
+        pool._pending = dict(pool._pending)
+    # collector thread가 살아 있어야 다음 요청에 응답함
+    assert pool.estimate(JPEG, 10).keypoints is not None
+    assert pool._collector.is_alive() and pool._dispatcher.is_alive()
+    assert pool.stats()['dispatched'] == 0
+
+
+def test_abandon_races_collector(pool):
+    # timeout을 추론 시간 근처로 두어 abandon()과 결과 도착이 겹치게 함
+    for timeout in np.linspace(0.005, 0.03, 40):
+        try:
+            pool.estimate(JPEG, timeout)
+        except TimeoutError:
+            pass
+    assert pool.estimate(JPEG, 10).keypoints is not None
+    assert pool._collector.is_alive() and pool._dispatcher.is_alive()
+
+
+def test_non_positive_weight_is_rejected(pool):
+    with pytest.raises(ValueError):
+        pool.submit(JPEG, 'station', weight=0)
+    assert 'station' not in pool.station_stats()
@@ -0,0 +1,25 @@
+import pytest
+
+from scheduling import FairQueue, StationQueue
+
+
+def test_weighted_round_robin():
+    fair = FairQueue()
+    measuring, idle = fair.station('measuring'), fair.station('idle')
+    measuring.weight = 3
+    for i in range(6):
+        fair.push(idle, ('idle', i))
+        fair.push(measuring, ('measuring', i))
+    order = [fair.pop()[1][0] for _ in range(8)]
+    assert order == ['measuring'] * 3 + ['idle'] + ['measuring'] * 3 + ['idle']
+
+
+@pytest.mark.parametrize('weight', [0, -1, float('nan')])
+def test_non_positive_weight_is_rejected(weight):
+    # 0 이하의 weight는 pop()이 끝나지 않게 만듦
+    with pytest.raises(ValueError):
+        StationQueue('station', weight)
+    queue = FairQueue().station('station')
+    with pytest.raises(ValueError):
+        queue.weight = weight
+    assert queue.weight == 1.0